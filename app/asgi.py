@@ -0,0 +1,249 @@
+# app/asgi.py
+#
+# ASGI entry point: uvicorn app.asgi:app --host 0.0.0.0 --port 5000
+#
+# The hot read paths and the long-lived streams are served natively on the
+# asyncio loop: a waiting client or an open metrics stream costs a coroutine,
+# not a thread, so one process holds thousands of them. Blocking libvirt calls
+# go through AsyncLibvirtManager's bounded pool. Every other endpoint (and the
+# dashboard) is the Flask app from app.main, mounted as WSGI, so both servers
+# share the same managers, job queue and caches.
+
+import asyncio
+import collections
+import contextlib
+import json
+import os
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MultiDict
+
+from app.core.async_manager import AsyncLibvirtManager, ExecutorBusyError
+from app.core.event_loop import start_asyncio_event_loop
+from app.core.instrumentation import begin_trace, end_trace
+from app.core.vm_query import VMQuery
+from app.main import (app as flask_app, fleet, job_manager, libvirt_manager, metrics_sampler,
+                      report_trace, rpc_stats, run_vm_action, start_background, stop_background,
+                      VM_ACTIONS, _fleet_status)
+
+libvirt_async = AsyncLibvirtManager(libvirt_manager,
+                                    max_workers=int(os.environ.get('GRENADE_ASYNC_WORKERS', 16)),
+                                    max_pending=int(os.environ.get('GRENADE_ASYNC_MAX_PENDING', 1024)))
+
+# Seconds between keepalive comments on an idle metrics stream
+STREAM_KEEPALIVE = 15
+
+NOT_CONNECTED = {"error": "Not connected to libvirt"}
+
+async def get_status(request):
+    """Returns the current connection status to libvirt."""
+    connected = await libvirt_async.connect() # Attempt to connect if not already
+    status = "Connected" if connected else "Disconnected"
+    return JSONResponse({"libvirt_status": status, "connected": connected})
+
+async def get_executor_metrics(request):
+    """Returns the async libvirt pool's bound and how many calls are queued or running."""
+    return JSONResponse(libvirt_async.metrics())
+
+def _etag_matches(header, etag):
+    """True if an If-None-Match header lists `etag` (or '*')."""
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == '*' or candidate.strip('"') == etag:
+            return True
+    return False
+
+async def get_vms(request):
+    """
+    Returns virtual machines (active and inactive) with basic details; same
+    query parameters, pagination and ETag handling as the Flask endpoint.
+    While the inventory cache is live no thread is involved at all.
+    """
+    if not await libvirt_async.is_connected():
+        return JSONResponse(NOT_CONNECTED, status_code=500)
+    try:
+        query = VMQuery.from_args(MultiDict(request.query_params.multi_items()))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    # Read the generation before the list: a change in between only costs one extra full reply
+    headers = {}
+    if libvirt_manager.inventory.is_ready():
+        etag = f"g{libvirt_manager.inventory.generation}-{query.fingerprint()}"
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+        if _etag_matches(request.headers.get('if-none-match', ''), etag):
+            return Response(status_code=304, headers=headers)
+
+    inventory = await libvirt_async.list_vms()
+    if inventory is None:
+        return JSONResponse({"error": "Failed to retrieve VMs. Check logs for details."}, status_code=500)
+    vms, total, next_cursor = query.apply(inventory)
+    return JSONResponse({"vms": vms, "total": total, "next_cursor": next_cursor}, headers=headers)
+
+async def get_vm_details(request):
+    """Returns detailed information about a VM (devices, CPU pinning, memory backing)."""
+    name = request.path_params['name']
+    if not await libvirt_async.is_connected():
+        return JSONResponse(NOT_CONNECTED, status_code=500)
+    details = await libvirt_async.get_vm_details(name)
+    if details is None:
+        return JSONResponse({"error": f"VM '{name}' not found"}, status_code=404)
+    return JSONResponse(details)
+
+async def vm_action(request):
+    """Queues a lifecycle action on a VM; 202 with a job id, as in the Flask endpoint."""
+    name, action = request.path_params['name'], request.path_params['action']
+    if action not in VM_ACTIONS:
+        return JSONResponse({"error": "Invalid action"}, status_code=400)
+    if not await libvirt_async.is_connected():
+        return JSONResponse(NOT_CONNECTED, status_code=500)
+
+    job = job_manager.submit(name, action, run_vm_action, args=(name, action), pass_job=True)
+    if job is None:
+        return JSONResponse({"error": "Too many pending jobs, try again later", "success": False},
+                            status_code=429)
+    return JSONResponse({
+        "message": f"Action '{action}' on VM '{name}' queued.",
+        "success": True,
+        "job_id": job.id,
+        "status_url": f"/api/jobs/{job.id}",
+    }, status_code=202)
+
+async def list_jobs(request):
+    """Lists recent jobs, newest first. Optional ?status= and ?limit= filters."""
+    try:
+        limit = int(request.query_params.get('limit', 100))
+    except ValueError:
+        limit = 100
+    return JSONResponse({
+        "jobs": [job.to_dict() for job in job_manager.list(request.query_params.get('status'), limit)],
+        "stats": job_manager.stats(),
+    })
+
+async def get_job(request):
+    """Returns the status, progress and outcome of a job."""
+    job = job_manager.get(request.path_params['job_id'])
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return JSONResponse(job.to_dict())
+
+# Recent (message, SSE frame) pairs. The sampler hands the same message object
+# to every subscriber, so each is serialized once however many streams are open.
+_frames = collections.deque(maxlen=4)
+
+def _sse_frame(message):
+    for cached, frame in _frames:
+        if cached is message:
+            return frame
+    frame = f"event: {message['type']}\ndata: {json.dumps(message)}\n\n".encode()
+    _frames.append((message, frame))
+    return frame
+
+async def stream_metrics(request):
+    """
+    Server-Sent Events stream of per-VM metrics, as in the Flask endpoint. The
+    sampler thread wakes the stream's coroutine when a message is queued, so an
+    open stream holds no thread.
+    """
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+
+    def notify():
+        try:
+            loop.call_soon_threadsafe(ready.set)
+        except RuntimeError:
+            pass # Loop already closed (server shutting down)
+
+    subscription = metrics_sampler.subscribe(notify=notify)
+
+    async def generate():
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(ready.wait(), STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n" # Keeps proxies from closing an idle stream
+                    continue
+                ready.clear()
+                while True:
+                    message = subscription.get(timeout=0)
+                    if message is None:
+                        break
+                    yield _sse_frame(message)
+        finally:
+            subscription.close()
+
+    return StreamingResponse(generate(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+async def search_vms(request):
+    """Searches VMs on every fleet host; same query parameters as the Flask endpoint."""
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return JSONResponse({"error": "q is required"}, status_code=400)
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 50)), 1000))
+    except ValueError:
+        limit = 50
+    hosts = request.query_params.getlist('host') or None
+    matches, results = await libvirt_async.run(fleet.search, query, limit, hosts=hosts)
+    return JSONResponse({"query": query, "results": matches, "hosts": _fleet_status(results)})
+
+async def executor_busy(request, exc):
+    return JSONResponse({"error": "Server busy, try again later"}, status_code=503,
+                        headers={'Retry-After': '1'})
+
+def traced(path, endpoint):
+    """
+    Wraps a route so its libvirt calls are recorded and reported like the Flask
+    endpoints' (X-Libvirt-Calls, Server-Timing, /metrics).
+    """
+    if rpc_stats is None:
+        return endpoint
+
+    async def handler(request):
+        begin_trace()
+        try:
+            response = await endpoint(request)
+        finally:
+            trace = end_trace()
+        report_trace(trace, response.headers, path, request.method, response.status_code, request.url.path,
+                     debug=flask_app.debug or request.headers.get('x-debug-libvirt') == '1')
+        return response
+    return handler
+
+def route(path, endpoint, **kwargs):
+    return Route(path, traced(path, endpoint), **kwargs)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Importing app.main opens no connection and starts no thread, so libvirt
+    # events can still be hooked to this loop before anything connects
+    start_asyncio_event_loop(asyncio.get_running_loop())
+    if not await libvirt_async.connect():
+        print("Initial libvirt connection failed; requests will retry it.")
+    start_background()
+    yield
+    stop_background()
+    libvirt_async.close()
+
+routes = [
+    route('/api/status', get_status),
+    route('/api/metrics/executor', get_executor_metrics),
+    route('/api/vms', get_vms),
+    route('/api/vms/{name}', get_vm_details),
+    route('/api/vm/{name}/{action}', vm_action, methods=['POST']),
+    route('/api/jobs', list_jobs),
+    route('/api/jobs/{job_id}', get_job),
+    route('/api/stream/metrics', stream_metrics),
+    route('/api/search', search_vms),
+    # Everything else (and other methods on the paths above) is served by Flask
+    Mount('/', app=WSGIMiddleware(flask_app, workers=int(os.environ.get('GRENADE_WSGI_WORKERS', 16)))),
+]
+
+app = Starlette(routes=routes, lifespan=lifespan, exception_handlers={ExecutorBusyError: executor_busy})
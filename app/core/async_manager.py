@@ -0,0 +1,92 @@
+# app/core/async_manager.py
+
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ExecutorBusyError(Exception):
+    """Raised when more blocking calls are queued than AsyncLibvirtManager accepts."""
+
+
+class AsyncLibvirtManager:
+    """
+    asyncio facade over a LibvirtManager.
+
+    The libvirt bindings block, so calls run on a bounded thread pool
+    (`max_workers`), each with a pooled connection checked out for its
+    duration. Coroutines waiting for a worker cost no thread, but at most
+    `max_pending` calls may be queued or running; past that the call fails
+    with ExecutorBusyError instead of queueing without bound.
+
+    Reads that the event-fed inventory cache answers (list_vms, find_vm,
+    get_vm_state) and is_connected() while the connection is alive return
+    straight away without a trip through the pool. Any
+    other public LibvirtManager method is available as a coroutine:
+    `await facade.start_vm(name)`.
+    """
+
+    def __init__(self, manager, max_workers=16, max_pending=1024):
+        self.manager = manager
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='libvirt-async')
+        self._pending = 0
+
+    async def run(self, func, *args, **kwargs):
+        """Runs func(*args, **kwargs) on the pool with a connection checked out; returns its result."""
+        if self._pending >= self.max_pending:
+            raise ExecutorBusyError(f"{self._pending} libvirt calls already pending")
+        manager = self.manager
+
+        def call():
+            with manager.connection():
+                return func(*args, **kwargs)
+
+        # The caller's context goes along, so the call lands in the request's trace
+        context = contextvars.copy_context()
+        self._pending += 1 # Only touched on the event loop thread
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, context.run, call)
+        finally:
+            self._pending -= 1
+
+    def __getattr__(self, name):
+        attr = getattr(self.manager, name)
+        if name.startswith('_') or not callable(attr):
+            raise AttributeError(name)
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+        return method
+
+    # --- Cache-served reads, no thread hop when the inventory is live ---
+    async def list_vms(self):
+        inventory = self.manager.inventory
+        if inventory.is_ready():
+            return inventory.list()
+        return await self.run(self.manager.list_vms)
+
+    async def find_vm(self, vm_name):
+        inventory = self.manager.inventory
+        if inventory.is_ready():
+            return inventory.get_by_name(vm_name)
+        return await self.run(self.manager.find_vm, vm_name)
+
+    async def is_connected(self):
+        # isAlive() is answered locally; only a reconnect needs the pool
+        if self.manager.is_alive():
+            return True
+        return await self.run(self.manager.is_connected)
+
+    async def get_vm_state(self, vm_name):
+        return self.manager.get_vm_state(vm_name)
+
+    def metrics(self):
+        """Returns the pool bound and the number of calls queued or running."""
+        return {'max_workers': self.max_workers, 'max_pending': self.max_pending, 'pending': self._pending}
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,119 @@
+# app/core/cloning.py
+
+import copy
+import random
+import uuid as uuid_lib
+import xml.etree.ElementTree as ET
+
+
+def random_mac(taken=None):
+    """A random address in QEMU's 52:54:00 range, not in `taken` (a set, updated)."""
+    while True:
+        mac = "52:54:00:%02x:%02x:%02x" % (random.randrange(256), random.randrange(256), random.randrange(256))
+        if taken is None or mac not in taken:
+            if taken is not None:
+                taken.add(mac)
+            return mac
+
+
+class CloneTemplate:
+    """
+    A source domain's inactive XML prepared for cloning. Parsed once, then
+    rendered per clone with a new name, UUID, MACs and disk paths.
+
+    Writable file-backed disks are the ones cloned (`disks`); read-only and
+    shareable disks and CD-ROMs stay shared with the source. Host-specific bits that libvirt
+    fills in per domain (interface target names, graphics ports, UNIX channel
+    paths, the NVRAM file) are dropped so every clone gets its own.
+
+    Expects XML read with VIR_DOMAIN_XML_SECURE. Clones keep the source's
+    VNC/SPICE password, like virt-clone: a console that silently lost its
+    password would be open to anyone who can reach the port.
+    """
+
+    def __init__(self, xml_desc):
+        self.root = ET.fromstring(xml_desc)
+        self.source_name = self.root.findtext('name')
+        self.disks = []  # [{'target', 'path', 'format'}] in document order
+        disk_elems = []
+        for disk in self.root.findall('./devices/disk'):
+            source = disk.find('source')
+            target = disk.find('target')
+            driver = disk.find('driver')
+            path = source.get('file') if source is not None else None
+            if (disk.get('device', 'disk') != 'disk' or disk.find('readonly') is not None
+                    or disk.find('shareable') is not None or not path or target is None):
+                continue
+            self.disks.append({'target': target.get('dev'), 'path': path,
+                               'format': driver.get('type', 'raw') if driver is not None else 'raw'})
+            disk_elems.append(disk)
+        # Where the cloned disks sit in iteration order, to find them again in copies
+        elems = list(self.root.iter())
+        self._disk_positions = [elems.index(disk) for disk in disk_elems]
+        self.mac_count = len(self.root.findall('./devices/interface'))
+
+    def render(self, name, disk_paths, uuid=None, macs=None, disk_formats=None):
+        """
+        XML for one clone: `disk_paths` replace the cloned disks' sources in order,
+        with `disk_formats` (same order, default qcow2 for all) as their driver
+        types. With uuid/macs None the source's identity is kept (used to move
+        the source itself onto overlays).
+        """
+        if len(disk_paths) != len(self.disks):
+            raise ValueError(f"Expected {len(self.disks)} disk paths, got {len(disk_paths)}")
+        if disk_formats is None:
+            disk_formats = ['qcow2'] * len(disk_paths)
+        elif len(disk_formats) != len(disk_paths):
+            raise ValueError(f"Expected {len(disk_paths)} disk formats, got {len(disk_formats)}")
+        root = copy.deepcopy(self.root)
+        elems = list(root.iter())
+        for position, path, disk_format in zip(self._disk_positions, disk_paths, disk_formats):
+            disk = elems[position]
+            disk.set('type', 'file')
+            source = disk.find('source')
+            source.attrib.clear()
+            source.set('file', path)
+            for child in list(source):
+                source.remove(child)
+            driver = disk.find('driver')
+            if driver is None:
+                driver = ET.SubElement(disk, 'driver', name='qemu')
+            driver.set('type', disk_format)
+            backing = disk.find('backingStore')
+            if backing is not None:
+                disk.remove(backing) # libvirt reads the chain from the image itself
+
+        root.find('name').text = name
+        if uuid is not None:
+            uuid_elem = root.find('uuid')
+            if uuid_elem is None:
+                uuid_elem = ET.SubElement(root, 'uuid')
+            uuid_elem.text = uuid
+        interfaces = root.findall('./devices/interface')
+        for index, iface in enumerate(interfaces):
+            for tag in ('target', 'alias'):
+                for elem in iface.findall(tag):
+                    iface.remove(elem)
+            if macs is not None:
+                mac = iface.find('mac')
+                if mac is None:
+                    mac = ET.SubElement(iface, 'mac')
+                mac.attrib.clear()
+                mac.set('address', macs[index])
+        if uuid is not None:
+            for graphics in root.findall('./devices/graphics'):
+                if graphics.get('port') not in (None, '-1'):
+                    graphics.set('port', '-1')
+                    graphics.set('autoport', 'yes')
+            for channel in root.findall('./devices/channel'):
+                source = channel.find('source')
+                if channel.get('type') == 'unix' and source is not None:
+                    source.attrib.pop('path', None)
+            nvram = root.find('./os/nvram')
+            if nvram is not None:
+                nvram.text = None # Created from the firmware template on first start
+        return ET.tostring(root, encoding='unicode')
+
+    def identity(self, taken_macs=None):
+        """A fresh (uuid, [mac]) pair for one clone."""
+        return str(uuid_lib.uuid4()), [random_mac(taken_macs) for _ in range(self.mac_count)]
@@ -2,6 +2,7 @@
 
 import json
 import os
+import sys
 
 class ConfigManager:
     def __init__(self, config_file="config.json"):
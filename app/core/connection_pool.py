@@ -0,0 +1,206 @@
+# app/core/connection_pool.py
+
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import libvirt
+
+class ConnectionPool:
+    """
+    Bounded pool of libvirt connections to one URI.
+
+    Connections are opened lazily, up to `size`, and reused afterwards. Health is
+    checked with isAlive(), which is answered locally (keepalive/socket state)
+    instead of an RPC. Failed opens back off exponentially so a dead daemon is
+    not hammered by every waiting thread.
+    """
+
+    def __init__(self, uri, size=4, timeout=10.0, opener=None, max_backoff=30.0):
+        self.uri = uri
+        self.size = size
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self._opener = opener or libvirt.open
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._open_count = 0
+        self._waiting = 0
+        self._backoff = 0.0
+        self._next_attempt = 0.0
+        self._closed = False
+        self._stats = {
+            'checkouts': 0,
+            'wait_count': 0,
+            'wait_time_total': 0.0,
+            'checkout_time_total': 0.0,
+            'checkout_time_max': 0.0,
+            'timeouts': 0,
+            'opened': 0,
+            'open_failures': 0,
+            'discarded': 0,
+        }
+
+    def acquire(self, timeout=None):
+        """
+        Checks out a healthy connection, waiting up to `timeout` seconds for one
+        to be released. Returns None on timeout or if no connection can be opened.
+        """
+        start = time.monotonic()
+        deadline = start + (self.timeout if timeout is None else timeout)
+        waited = False
+        conn = None
+        with self._cond:
+            while conn is None:
+                if self._closed:
+                    return None
+                if self._idle:
+                    conn = self._idle.pop()
+                    if not self._is_alive(conn):
+                        # Already dead, so close() does not go over the wire
+                        self._forget(conn)
+                        self._close_quietly(conn)
+                        conn = None
+                    continue
+                if self._open_count < self.size:
+                    # Reserve the slot, then open outside the lock
+                    self._open_count += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    return None
+                waited = True
+                self._waiting += 1
+                self._cond.wait(remaining)
+                self._waiting -= 1
+
+        if conn is None:
+            conn = self._open()
+            if conn is None:
+                with self._cond:
+                    self._open_count -= 1
+                    self._cond.notify()
+                return None
+
+        elapsed = time.monotonic() - start
+        with self._cond:
+            self._stats['checkouts'] += 1
+            self._stats['checkout_time_total'] += elapsed
+            self._stats['checkout_time_max'] = max(self._stats['checkout_time_max'], elapsed)
+            if waited:
+                self._stats['wait_count'] += 1
+                self._stats['wait_time_total'] += elapsed
+        return conn
+
+    def release(self, conn, broken=False):
+        """Returns a connection to the pool; broken or dead connections are closed instead."""
+        with self._cond:
+            keep = not (broken or self._closed or not self._is_alive(conn))
+            if keep:
+                self._idle.append(conn)
+            else:
+                self._forget(conn)
+            self._cond.notify()
+        if not keep:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager around acquire()/release(). Yields None if no connection is available."""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            if conn is not None:
+                self.release(conn)
+
+    def close(self):
+        """Closes idle connections; checked-out ones are closed as they are released."""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            for conn in idle:
+                self._forget(conn)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    def reopen(self):
+        """Lets a closed pool hand out connections again (e.g. after a reconnect)."""
+        with self._cond:
+            self._closed = False
+            self._backoff = 0.0
+            self._next_attempt = 0.0
+
+    def metrics(self):
+        """Returns pool size, usage, wait time and checkout latency figures."""
+        with self._cond:
+            stats = dict(self._stats)
+            checkouts = stats['checkouts']
+            return {
+                'uri': self.uri,
+                'size': self.size,
+                'open': self._open_count,
+                'idle': len(self._idle),
+                'in_use': self._open_count - len(self._idle),
+                'waiting': self._waiting,
+                'checkouts': checkouts,
+                'wait_count': stats['wait_count'],
+                'wait_time_total_ms': round(stats['wait_time_total'] * 1000, 3),
+                'checkout_latency_avg_ms': round(stats['checkout_time_total'] * 1000 / checkouts, 3) if checkouts else 0.0,
+                'checkout_latency_max_ms': round(stats['checkout_time_max'] * 1000, 3),
+                'timeouts': stats['timeouts'],
+                'opened': stats['opened'],
+                'open_failures': stats['open_failures'],
+                'discarded': stats['discarded'],
+                'backoff_s': self._backoff,
+            }
+
+    def _open(self):
+        """Opens a new connection, honouring the reconnect backoff window."""
+        with self._cond:
+            if time.monotonic() < self._next_attempt:
+                return None
+        try:
+            conn = self._opener(self.uri)
+            if conn is None:
+                raise libvirt.libvirtError(f"Failed to open connection to '{self.uri}'")
+        except libvirt.libvirtError as e:
+            print(f"Pool connection error: {e}", file=sys.stderr)
+            with self._cond:
+                self._stats['open_failures'] += 1
+                self._backoff = min(self.max_backoff, self._backoff * 2 or 0.5)
+                self._next_attempt = time.monotonic() + self._backoff
+            return None
+        try:
+            conn.setKeepAlive(5, 3)
+        except libvirt.libvirtError:
+            pass # No event loop registered; isAlive() still sees closed sockets
+        with self._cond:
+            self._stats['opened'] += 1
+            self._backoff = 0.0
+            self._next_attempt = 0.0
+        return conn
+
+    def _forget(self, conn):
+        """Frees the slot of a connection that is about to be closed. Caller holds the lock."""
+        self._open_count -= 1
+        self._stats['discarded'] += 1
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except libvirt.libvirtError:
+            pass
+
+    @staticmethod
+    def _is_alive(conn):
+        try:
+            return conn.isAlive() == 1
+        except libvirt.libvirtError:
+            return False
@@ -0,0 +1,327 @@
+# app/core/domain_xml.py
+
+import io
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+
+# Multipliers from libvirt memory units to KiB
+_UNIT_TO_KIB = {
+    'b': 1 / 1024, 'bytes': 1 / 1024,
+    'kb': 1000 / 1024, 'k': 1, 'kib': 1,
+    'mb': 1000 ** 2 / 1024, 'm': 1024, 'mib': 1024,
+    'gb': 1000 ** 3 / 1024, 'g': 1024 ** 2, 'gib': 1024 ** 2,
+    'tb': 1000 ** 4 / 1024, 't': 1024 ** 3, 'tib': 1024 ** 3,
+}
+
+# Namespace of Grenade's own <metadata> element:
+#   <metadata><grenade:meta xmlns:grenade="..."><grenade:tag>web</grenade:tag></grenade:meta></metadata>
+METADATA_NS = 'https://github.com/Armora-Security/Grenade/metadata/1.0'
+_TAG_ELEMENT = '{%s}tag' % METADATA_NS
+
+# virtio-serial channel name of qemu-guest-agent
+GUEST_AGENT_CHANNEL = 'org.qemu.guest_agent.0'
+
+def _to_kib(text, unit):
+    try:
+        return int(int(text) * _UNIT_TO_KIB.get((unit or 'KiB').lower(), 1))
+    except (TypeError, ValueError):
+        return 0
+
+
+class _Model:
+    """Base for the slotted model classes: equality and to_dict() from __slots__."""
+
+    __slots__ = ()
+
+    def to_dict(self):
+        out = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if isinstance(value, _Model):
+                value = value.to_dict()
+            elif isinstance(value, list):
+                value = [v.to_dict() if isinstance(v, _Model) else v for v in value]
+            out[name] = value
+        return out
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, n) == getattr(other, n) for n in self.__slots__)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class Disk(_Model):
+    __slots__ = ('device', 'type', 'driver_type', 'source', 'target', 'bus', 'readonly', 'boot_order', 'serial')
+
+    def __init__(self, device='disk', type='file', driver_type=None, source=None, target=None,
+                 bus=None, readonly=False, boot_order=None, serial=None):
+        self.device = device
+        self.type = type
+        self.driver_type = driver_type
+        self.source = source
+        self.target = target
+        self.bus = bus
+        self.readonly = readonly
+        self.boot_order = boot_order
+        self.serial = serial
+
+
+class Interface(_Model):
+    __slots__ = ('type', 'mac', 'source', 'model', 'target')
+
+    def __init__(self, type='network', mac=None, source=None, model=None, target=None):
+        self.type = type
+        self.mac = mac
+        self.source = source
+        self.model = model
+        self.target = target
+
+
+class Graphics(_Model):
+    __slots__ = ('type', 'port', 'autoport', 'listen')
+
+    def __init__(self, type='vnc', port=None, autoport=False, listen=None):
+        self.type = type
+        self.port = port
+        self.autoport = autoport
+        self.listen = listen
+
+
+class VcpuPin(_Model):
+    __slots__ = ('vcpu', 'cpuset')
+
+    def __init__(self, vcpu, cpuset):
+        self.vcpu = vcpu
+        self.cpuset = cpuset
+
+
+class MemoryBacking(_Model):
+    __slots__ = ('hugepages', 'locked', 'nosharepages', 'source_type', 'access_mode')
+
+    def __init__(self, hugepages=False, locked=False, nosharepages=False, source_type=None, access_mode=None):
+        self.hugepages = hugepages
+        self.locked = locked
+        self.nosharepages = nosharepages
+        self.source_type = source_type
+        self.access_mode = access_mode
+
+
+class DomainModel(_Model):
+    __slots__ = ('name', 'uuid', 'type', 'os_type', 'arch', 'machine', 'memory_kb', 'current_memory_kb',
+                 'vcpu', 'vcpu_placement', 'cpu_mode', 'numa_nodeset', 'numa_mode', 'emulator',
+                 'disks', 'interfaces', 'graphics', 'vcpupins', 'emulatorpin', 'memory_backing', 'tags',
+                 'guest_agent')
+
+    def __init__(self):
+        self.name = None
+        self.uuid = None
+        self.type = None
+        self.os_type = None
+        self.arch = None
+        self.machine = None
+        self.memory_kb = 0
+        self.current_memory_kb = 0
+        self.vcpu = 0
+        self.vcpu_placement = None
+        self.cpu_mode = None
+        self.numa_nodeset = None
+        self.numa_mode = None
+        self.emulator = None
+        self.disks = []
+        self.interfaces = []
+        self.graphics = []
+        self.vcpupins = []
+        self.emulatorpin = None
+        self.memory_backing = None
+        self.tags = []
+        self.guest_agent = False  # Has a qemu-guest-agent channel
+
+
+def _parse_disk(elem):
+    driver = elem.find('driver')
+    source = elem.find('source')
+    target = elem.find('target')
+    boot = elem.find('boot')
+    serial = elem.find('serial')
+    src = None
+    if source is not None:
+        src = source.get('file') or source.get('dev') or source.get('name') or source.get('dir')
+        if src is None and source.get('pool'):
+            src = f"{source.get('pool')}/{source.get('volume')}"
+    return Disk(
+        device=elem.get('device', 'disk'),
+        type=elem.get('type', 'file'),
+        driver_type=driver.get('type') if driver is not None else None,
+        source=src,
+        target=target.get('dev') if target is not None else None,
+        bus=target.get('bus') if target is not None else None,
+        readonly=elem.find('readonly') is not None,
+        boot_order=int(boot.get('order')) if boot is not None and boot.get('order') else None,
+        serial=serial.text if serial is not None else None,
+    )
+
+def _parse_interface(elem):
+    mac = elem.find('mac')
+    source = elem.find('source')
+    model = elem.find('model')
+    target = elem.find('target')
+    src = None
+    if source is not None:
+        src = source.get('bridge') or source.get('network') or source.get('dev')
+    return Interface(
+        type=elem.get('type', 'network'),
+        mac=mac.get('address') if mac is not None else None,
+        source=src,
+        model=model.get('type') if model is not None else None,
+        target=target.get('dev') if target is not None else None,
+    )
+
+def _parse_graphics(elem):
+    port = elem.get('port')
+    listen = elem.get('listen')
+    if listen is None:
+        listen_elem = elem.find('listen')
+        if listen_elem is not None:
+            listen = listen_elem.get('address') or listen_elem.get('network')
+    return Graphics(
+        type=elem.get('type'),
+        port=int(port) if port and port.lstrip('-').isdigit() else None,
+        autoport=elem.get('autoport') == 'yes',
+        listen=listen,
+    )
+
+def _parse_memory_backing(elem):
+    source = elem.find('source')
+    access = elem.find('access')
+    return MemoryBacking(
+        hugepages=elem.find('hugepages') is not None,
+        locked=elem.find('locked') is not None,
+        nosharepages=elem.find('nosharepages') is not None,
+        source_type=source.get('type') if source is not None else None,
+        access_mode=access.get('mode') if access is not None else None,
+    )
+
+def parse_domain_xml(xml_desc):
+    """
+    Builds a DomainModel from a domain XML document in a single iterparse pass.
+    Each device subtree is converted and cleared as soon as it ends, so large
+    definitions (dozens of disks) never sit in memory as a full element tree.
+    Raises xml.etree.ElementTree.ParseError on malformed XML.
+    """
+    model = DomainModel()
+    path = []
+    source = io.BytesIO(xml_desc.encode('utf-8') if isinstance(xml_desc, str) else xml_desc)
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            path.append(elem.tag)
+            if len(path) == 1:
+                model.type = elem.get('type')
+            continue
+
+        depth = len(path)
+        tag = elem.tag
+        parent = path[-2] if depth >= 2 else None
+        if depth == 2:
+            if tag == 'name':
+                model.name = elem.text
+            elif tag == 'uuid':
+                model.uuid = elem.text
+            elif tag == 'memory':
+                model.memory_kb = _to_kib(elem.text, elem.get('unit'))
+            elif tag == 'currentMemory':
+                model.current_memory_kb = _to_kib(elem.text, elem.get('unit'))
+            elif tag == 'vcpu':
+                model.vcpu = int(elem.text or 0)
+                model.vcpu_placement = elem.get('placement', 'static')
+            elif tag == 'cpu':
+                model.cpu_mode = elem.get('mode')
+            elif tag == 'memoryBacking':
+                model.memory_backing = _parse_memory_backing(elem)
+            elem.clear()
+        elif depth == 3:
+            if parent == 'devices':
+                if tag == 'disk':
+                    model.disks.append(_parse_disk(elem))
+                elif tag == 'interface':
+                    model.interfaces.append(_parse_interface(elem))
+                elif tag == 'graphics':
+                    model.graphics.append(_parse_graphics(elem))
+                elif tag == 'emulator':
+                    model.emulator = elem.text
+                elif tag == 'channel':
+                    target = elem.find('target')
+                    if target is not None and target.get('name') == GUEST_AGENT_CHANNEL:
+                        model.guest_agent = True
+                elem.clear() # Done with this device subtree
+            elif parent == 'os' and tag == 'type':
+                model.os_type = elem.text
+                model.arch = elem.get('arch')
+                model.machine = elem.get('machine')
+            elif parent == 'cputune':
+                if tag == 'vcpupin':
+                    model.vcpupins.append(VcpuPin(int(elem.get('vcpu')), elem.get('cpuset')))
+                elif tag == 'emulatorpin':
+                    model.emulatorpin = elem.get('cpuset')
+            elif parent == 'numatune' and tag == 'memory':
+                model.numa_mode = elem.get('mode', 'strict')
+                model.numa_nodeset = elem.get('nodeset')
+            elif parent == 'metadata':
+                elem.clear() # Other applications' metadata isn't kept
+        elif depth == 4 and tag == _TAG_ELEMENT and path[1] == 'metadata':
+            if elem.text and elem.text.strip():
+                model.tags.append(elem.text.strip())
+        path.pop()
+    return model
+
+
+class DomainXMLCache:
+    """
+    Parsed DomainModel per domain UUID, with the domain's autostart flag.
+
+    Entries are filled on first use and stay valid until invalidate() is called,
+    which LibvirtManager does on define/undefine, start/stop (live XML gains
+    runtime details such as ports and tap devices) and device added/removed
+    events. Autostart changes raise no event, so that flag is refreshed with
+    the XML. The cache is bounded; least recently used entries are dropped.
+    """
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # uuid -> (DomainModel, autostart)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, uuid):
+        """Returns the cached (model, autostart) pair, or None."""
+        with self._lock:
+            entry = self._entries.get(uuid)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(uuid)
+            self.hits += 1
+            return entry
+
+    def put(self, uuid, model, autostart):
+        with self._lock:
+            self._entries[uuid] = (model, autostart)
+            self._entries.move_to_end(uuid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, uuid):
+        with self._lock:
+            self._entries.pop(uuid, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def models(self):
+        """Returns a snapshot list of all cached models."""
+        with self._lock:
+            return [model for model, _ in self._entries.values()]
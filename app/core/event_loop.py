@@ -0,0 +1,71 @@
+# app/core/event_loop.py
+
+import sys
+import threading
+
+import libvirt
+
+_lock = threading.Lock()
+_thread = None
+_asyncio_loop = None  # Set when libvirt's events are dispatched by an asyncio loop instead
+
+def start_event_loop():
+    """
+    Registers libvirt's default event loop implementation and runs it on a
+    daemon thread. Safe to call more than once. It must run before opening any
+    connection that registers domain event callbacks.
+    Returns True if the event loop is running, False otherwise.
+    """
+    global _thread
+    with _lock:
+        if _thread is not None or _asyncio_loop is not None:
+            return True
+        try:
+            libvirt.virEventRegisterDefaultImpl()
+        except libvirt.libvirtError as e:
+            print(f"Error registering libvirt event loop: {e}", file=sys.stderr)
+            return False
+        _thread = threading.Thread(target=_run_event_loop, name='libvirt-event-loop', daemon=True)
+        _thread.start()
+        return True
+
+def start_asyncio_event_loop(loop):
+    """
+    Dispatches libvirt events from the asyncio event loop `loop` (libvirtaio)
+    instead of a dedicated thread. Like start_event_loop() it must run before
+    the first connection is opened; start_event_loop() then reports the loop as
+    running without registering the default implementation.
+    Returns True if libvirt events run on `loop`, False otherwise (the bindings
+    lack libvirtaio, or another implementation was registered first).
+    """
+    global _asyncio_loop
+    with _lock:
+        if _asyncio_loop is not None:
+            return _asyncio_loop is loop
+        if _thread is not None:
+            print("Libvirt's default event loop is already running; not switching to asyncio.", file=sys.stderr)
+            return False
+        try:
+            import libvirtaio
+        except ImportError:
+            print("libvirtaio not available; libvirt events will use the default event loop.", file=sys.stderr)
+            return False
+        try:
+            libvirtaio.virEventRegisterAsyncIOImpl(loop=loop)
+        except libvirt.libvirtError as e:
+            print(f"Error registering asyncio event loop for libvirt: {e}", file=sys.stderr)
+            return False
+        _asyncio_loop = loop
+        return True
+
+def uses_asyncio_event_loop():
+    """Returns True if libvirt events are dispatched on an asyncio loop."""
+    return _asyncio_loop is not None
+
+def _run_event_loop():
+    """Dispatches libvirt events (domain callbacks, keepalives) forever."""
+    while True:
+        try:
+            libvirt.virEventRunDefaultImpl()
+        except libvirt.libvirtError as e:
+            print(f"Libvirt event loop error: {e}", file=sys.stderr)
@@ -0,0 +1,207 @@
+# app/core/fleet.py
+
+import contextvars
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from app.core.libvirt_manager import LibvirtManager
+
+
+class HostResult:
+    """Outcome of one host's part of a fan-out call."""
+
+    __slots__ = ('host', 'ok', 'value', 'error', 'elapsed_ms')
+
+    def __init__(self, host, ok, value=None, error=None, elapsed_ms=None):
+        self.host = host
+        self.ok = ok
+        self.value = value
+        self.error = error
+        self.elapsed_ms = elapsed_ms
+
+    def to_dict(self):
+        return {'host': self.host, 'ok': self.ok, 'error': self.error, 'elapsed_ms': self.elapsed_ms}
+
+
+class FleetManager:
+    """
+    Many libvirt hosts behind one interface: one LibvirtManager (and connection)
+    per URI, queried concurrently.
+
+    fan_out() runs a call on every host in parallel and waits at most `timeout`
+    seconds, so a fleet-wide query takes about as long as the slowest healthy
+    host. A host that doesn't answer in time is reported as failed and the rest
+    of the results are returned as usual. Its call keeps running in the
+    background (libvirt RPCs can't be aborted); until it returns, further calls
+    to that host fail fast instead of piling up threads behind it. Calls that
+    are merely still running (e.g. another request's fan-out) don't count.
+    """
+
+    def __init__(self, timeout=10.0, max_workers=32, manager_factory=None):
+        self.timeout = timeout
+        self._factory = manager_factory or (lambda uri: LibvirtManager(uri))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fleet')
+        self._lock = threading.Lock()
+        self._hosts = {}     # name -> LibvirtManager
+        self._stuck = {}     # name -> Future of a call that outlived its timeout
+
+    # --- Hosts ---
+    def add_host(self, name, uri=None, manager=None):
+        """
+        Adds a host by URI, or an existing LibvirtManager (e.g. the local one).
+        The connection is opened lazily by the first call. Returns False if the name is taken.
+        """
+        with self._lock:
+            if name in self._hosts:
+                return False
+            self._hosts[name] = manager if manager is not None else self._factory(uri)
+        return True
+
+    def remove_host(self, name):
+        """Removes a host and closes its connection. Returns False if unknown."""
+        with self._lock:
+            manager = self._hosts.pop(name, None)
+            self._stuck.pop(name, None)
+        if manager is None:
+            return False
+        self._executor.submit(manager.disconnect)  # may block on a dead host
+        return True
+
+    def hosts(self):
+        with self._lock:
+            return sorted(self._hosts)
+
+    def get_manager(self, name):
+        """The LibvirtManager of a host, or None."""
+        return self._hosts.get(name)
+
+    # --- Fan-out ---
+    def fan_out(self, func, hosts=None, timeout=None):
+        """
+        Calls func(manager) on each host concurrently (all hosts by default).
+        Returns {host: HostResult}. A func returning None counts as a failure,
+        matching LibvirtManager's convention.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            names = [h for h in (hosts if hosts is not None else self._hosts) if h in self._hosts]
+            targets = {name: self._hosts[name] for name in names}
+
+        results = {}
+        futures = {}
+        for name, manager in targets.items():
+            with self._lock:
+                stuck = name in self._stuck
+            if stuck:
+                results[name] = HostResult(name, False, error="Host busy: previous call still running")
+                continue
+            future = self._executor.submit(contextvars.copy_context().run, self._call, name, manager, func)
+            futures[future] = name
+
+        done, pending = wait(futures, timeout=timeout)
+        for future in done:
+            results[futures[future]] = future.result()
+        for future in pending:
+            name = futures[future]
+            results[name] = HostResult(name, False, error=f"Timed out after {timeout:g}s")
+            with self._lock:
+                self._stuck[name] = future
+            # Runs at once if the call finished meanwhile
+            future.add_done_callback(lambda f, name=name: self._unstick(name, f))
+        return results
+
+    def _unstick(self, name, future):
+        with self._lock:
+            if self._stuck.get(name) is future:
+                del self._stuck[name]
+
+    def _call(self, name, manager, func):
+        start = time.perf_counter()
+        try:
+            if not manager.is_connected() and not manager.connect():
+                value, error = None, f"Cannot connect to {manager.uri}"
+            else:
+                value = func(manager)
+                error = None if value is not None else "Call failed, see server log"
+        except Exception as e:
+            print(f"Fleet call on host '{name}' failed: {e}", file=sys.stderr)
+            value, error = None, str(e)
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+        return HostResult(name, error is None, value, error, elapsed_ms)
+
+    # --- Merged views ---
+    def list_vms(self, hosts=None, timeout=None):
+        """
+        Returns (vms, results): every host's VM summaries tagged with 'host',
+        and the per-host HostResults (failures included).
+        """
+        results = self.fan_out(lambda m: m.list_vms(), hosts, timeout)
+        vms = []
+        for name in sorted(results):
+            result = results[name]
+            if result.ok:
+                vms.extend(dict(vm, host=name) for vm in result.value)
+        return vms, results
+
+    def find_vm(self, vm_name, hosts=None, timeout=None):
+        """Returns [(host, summary)] for every host that has a VM called `vm_name`."""
+        results = self.fan_out(lambda m: m.find_vm(vm_name) or False, hosts, timeout)
+        return [(name, r.value) for name, r in sorted(results.items()) if r.ok and r.value]
+
+    def search(self, query, limit=50, hosts=None, timeout=None):
+        """
+        Runs LibvirtManager.search_vms() on every host. Returns (matches, results);
+        matches are tagged with 'host'.
+        """
+        results = self.fan_out(lambda m: m.search_vms(query, limit), hosts, timeout)
+        matches = []
+        for name in sorted(results):
+            result = results[name]
+            if result.ok:
+                matches.extend(dict(match, host=name) for match in result.value)
+        return matches[:limit], results
+
+    def host_metrics(self, hosts=None, timeout=None):
+        """
+        Returns (per_host, totals, results): node capacity (getInfo, getFreeMemory)
+        and allocation from each host's inventory, plus fleet-wide sums.
+        """
+        results = self.fan_out(self._host_metrics, hosts, timeout)
+        per_host = {name: r.value for name, r in results.items() if r.ok}
+        keys = ('cpus', 'memory_mb', 'free_memory_mb', 'vms', 'running', 'vcpus_allocated', 'memory_allocated_mb')
+        totals = {key: sum(m[key] for m in per_host.values()) for key in keys}
+        totals['hosts'] = len(results)
+        totals['hosts_ok'] = len(per_host)
+        return per_host, totals, results
+
+    @staticmethod
+    def _host_metrics(manager):
+        vms = manager.list_vms()
+        if vms is None:
+            return None
+        model, memory_mb, cpus, mhz = manager.conn.getInfo()[:4]
+        running = [vm for vm in vms if vm['id'] is not None]
+        return {
+            'uri': manager.uri,
+            'model': model,
+            'cpus': cpus,
+            'mhz': mhz,
+            'memory_mb': memory_mb,
+            'free_memory_mb': manager.conn.getFreeMemory() // (1024 * 1024),
+            'vms': len(vms),
+            'running': len(running),
+            'vcpus_allocated': sum(vm['vcpu'] or 0 for vm in running),
+            'memory_allocated_mb': sum(vm['memory_kb'] or 0 for vm in running) // 1024,
+        }
+
+    def close(self):
+        """Disconnects every host and stops the worker threads."""
+        with self._lock:
+            managers = list(self._hosts.values())
+            self._hosts.clear()
+            self._stuck.clear()
+        for manager in managers:
+            self._executor.submit(manager.disconnect)
+        self._executor.shutdown(wait=False)
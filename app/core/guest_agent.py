@@ -0,0 +1,282 @@
+# app/core/guest_agent.py
+
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import libvirt
+
+# Addresses the agent reports that say nothing about how to reach the guest
+_IGNORED_PREFIXES = ('127.', '::1', 'fe80:')
+
+
+def parse_interface_addresses(interfaces):
+    """
+    Turns interfaceAddresses() output into (interfaces, ips): interfaces is a
+    list of {'name', 'mac', 'addresses': ['ip/prefix']} without loopback, and
+    ips the routable addresses.
+    """
+    result, ips = [], []
+    for name, iface in sorted((interfaces or {}).items()):
+        if name == 'lo':
+            continue
+        addresses = []
+        for addr in iface.get('addrs') or []:
+            ip = addr.get('addr')
+            if not ip:
+                continue
+            addresses.append(f"{ip}/{addr.get('prefix')}" if addr.get('prefix') is not None else ip)
+            if not ip.lower().startswith(_IGNORED_PREFIXES):
+                ips.append(ip)
+        result.append({'name': name, 'mac': (iface.get('hwaddr') or '').lower() or None, 'addresses': addresses})
+    return result, sorted(set(ips))
+
+def parse_guest_info(info):
+    """
+    Turns the flat guestInfo() dict ('os.id', 'fs.0.mountpoint', ...) into
+    {'hostname', 'os', 'timezone', 'users', 'filesystems'}.
+    """
+    info = info or {}
+
+    def indexed(prefix, fields):
+        items = []
+        for i in range(int(info.get(f"{prefix}.count", 0))):
+            items.append({field: info.get(f"{prefix}.{i}.{key}") for field, key in fields})
+        return items
+
+    filesystems = indexed('fs', (('mountpoint', 'mountpoint'), ('name', 'name'), ('type', 'fstype'),
+                                 ('used_bytes', 'used-bytes'), ('total_bytes', 'total-bytes')))
+    for fs in filesystems:
+        for key in ('used_bytes', 'total_bytes'):
+            if fs[key] is not None:
+                fs[key] = int(fs[key])
+    return {
+        'hostname': info.get('hostname'),
+        'os': {key: info[f"os.{key}"] for key in ('id', 'name', 'pretty-name', 'version', 'version-id',
+                                                   'kernel-release', 'machine') if f"os.{key}" in info} or None,
+        'timezone': info.get('timezone.name'),
+        'users': [user['name'] for user in indexed('user', (('name', 'name'),)) if user['name']],
+        'filesystems': filesystems,
+    }
+
+
+class _AgentState:
+    """Polling state of one running VM."""
+
+    __slots__ = ('name', 'interval', 'due', 'busy', 'started', 'timed_out', 'token', 'data', 'fetched',
+                 'expires', 'failures', 'has_agent')
+
+    def __init__(self, name, interval, due):
+        self.name = name
+        self.interval = interval
+        self.due = due
+        self.busy = False     # A worker is polling it
+        self.started = 0.0    # When that poll started
+        self.timed_out = False
+        self.token = 0        # Bumped when a poll times out, so its late result is dropped
+        self.data = None
+        self.fetched = 0.0
+        self.expires = 0.0
+        self.failures = 0
+        self.has_agent = None
+
+
+class GuestAgentCollector:
+    """
+    Polls qemu-guest-agent data (interface addresses, OS, hostname, users,
+    filesystem usage) for every running VM with an agent channel, in the
+    background, so request handlers only read the cache.
+
+    Polls run concurrently on `workers` threads, each with a pooled connection.
+    A poll running longer than `timeout` counts as failed and its result is
+    dropped; the VM is not polled again until that call returns, so an
+    unresponsive agent holds at most one worker and never delays the others.
+    (The call itself ends when libvirt's agent response timeout expires; the
+    collector does not change that per-domain setting, since other agent users
+    such as quiesced snapshots depend on it.)
+
+    The interval adapts per VM: it starts at `interval`, grows by half up to
+    `max_interval` while the data stays the same, returns to `interval` when
+    it changes and doubles on failures. Data expires `ttl_factor` intervals
+    after it was fetched, when the VM stops, or when its agent goes away.
+    Guest IPs are also fed to the search index (source 'agent').
+    """
+
+    TICK = 2.0         # Seconds between scheduling passes
+    BOOT_DELAY = 20.0  # A VM that just started needs time before its agent answers
+
+    def __init__(self, libvirt_manager, interval=30.0, max_interval=300.0, timeout=5.0, workers=8,
+                 ttl_factor=3):
+        self.libvirt_manager = libvirt_manager
+        self.interval = interval
+        self.max_interval = max(interval, max_interval)
+        self.timeout = timeout
+        self.workers = workers
+        self.ttl_factor = ttl_factor
+        self._lock = threading.Lock()
+        self._states = {}  # uuid -> _AgentState
+        self._executor = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._first_pass = True
+        self._stats = {'polls': 0, 'failures': 0, 'timeouts': 0}
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='guest-agent')
+        self._thread = threading.Thread(target=self._run, name='guest-agent-collector', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._thread = None
+
+    def get(self, uuid):
+        """Cached guest data for a VM (with 'age_seconds'), or None if there is none or it expired."""
+        with self._lock:
+            state = self._states.get(uuid)
+            if state is None or state.data is None or time.monotonic() >= state.expires:
+                return None
+            return dict(state.data, age_seconds=round(time.monotonic() - state.fetched, 1))
+
+    def request(self, uuid):
+        """Asks for a poll of one VM soon (e.g. a client is looking at it). Does not wait for it."""
+        with self._lock:
+            state = self._states.get(uuid)
+            if state is None or state.busy or state.has_agent is False or state.failures:
+                return # Failing agents keep their backoff
+            if state.due > time.monotonic():
+                state.due = time.monotonic()
+        self._wakeup.set()
+
+    def stats(self):
+        """Counters: polls, failures, timeouts, polls in progress, VMs tracked and VMs with cached data."""
+        with self._lock:
+            now = time.monotonic()
+            return dict(self._stats, busy=sum(1 for s in self._states.values() if s.busy),
+                        tracked=len(self._states),
+                        cached=sum(1 for s in self._states.values() if s.data is not None and now < s.expires))
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                self.schedule()
+            except Exception as e: # Never let one bad pass end collection
+                print(f"Guest agent collector error: {e}", file=sys.stderr)
+            self._wakeup.wait(self.TICK)
+
+    def schedule(self):
+        """One scheduling pass: syncs the running VMs, expires data, times out and submits polls."""
+        if not self.libvirt_manager.is_connected():
+            return
+        vms = self.libvirt_manager.list_vms()
+        if vms is None:
+            return
+        running = {vm['uuid']: vm['name'] for vm in vms if vm['state_code'] == libvirt.VIR_DOMAIN_RUNNING}
+        now = time.monotonic()
+        cleared, submit = [], []
+        with self._lock:
+            for uuid in [u for u in self._states if u not in running]:
+                if self._states.pop(uuid).data is not None:
+                    cleared.append(uuid)
+            first_delay = 0.0 if self._first_pass else self.BOOT_DELAY
+            self._first_pass = False
+            for uuid, name in running.items():
+                state = self._states.get(uuid)
+                if state is None:
+                    self._states[uuid] = _AgentState(name, self.interval, now + first_delay)
+                    continue
+                state.name = name
+                if state.data is not None and now >= state.expires:
+                    state.data = None
+                    cleared.append(uuid)
+                if state.busy and not state.timed_out and now - state.started > self.timeout:
+                    self._stats['timeouts'] += 1
+                    state.timed_out = True
+                    state.token += 1
+                    self._fail_locked(state, now)
+            busy = sum(1 for s in self._states.values() if s.busy)
+            due = sorted((s.due, uuid) for uuid, s in self._states.items() if not s.busy and s.due <= now)
+            for _, uuid in due[:max(0, self.workers - busy)]:
+                state = self._states[uuid]
+                state.busy, state.started, state.timed_out = True, now, False
+                submit.append((uuid, state.name, state.token))
+        for uuid in cleared:
+            self.libvirt_manager.search.set_ips(uuid, [], source='agent')
+        executor = self._executor
+        for uuid, name, token in submit:
+            if executor is None:
+                break
+            executor.submit(self._poll, uuid, name, token)
+
+    def _fail_locked(self, state, now):
+        state.failures += 1
+        state.interval = min(self.max_interval, state.interval * 2)
+        state.due = now + state.interval
+
+    def _poll(self, uuid, name, token):
+        """Worker: polls one VM's agent and stores the result (unless the poll timed out meanwhile)."""
+        manager = self.libvirt_manager
+        data, error, has_agent = None, None, True
+        try:
+            model, _ = manager.get_domain_model(name)
+            if model is not None and not model.guest_agent:
+                has_agent = False
+            else:
+                with manager.connection():
+                    domain = manager.conn.lookupByUUIDString(uuid)
+                    interfaces, ips = parse_interface_addresses(domain.interfaceAddresses(
+                        libvirt.VIR_DOMAIN_INTERFACE_ADDRESSES_SRC_AGENT, 0))
+                    try:
+                        info = parse_guest_info(domain.guestInfo(0, 0))
+                    except (libvirt.libvirtError, AttributeError):
+                        info = parse_guest_info(None) # Older libvirt or agent: addresses only
+                data = dict(info, interfaces=interfaces, ips=ips)
+        except libvirt.libvirtError as e:
+            error = e
+        except Exception as e:
+            print(f"Error polling guest agent of '{name}': {e}", file=sys.stderr)
+            error = e
+        self._store(uuid, token, data, error, has_agent)
+
+    def _store(self, uuid, token, data, error, has_agent):
+        now = time.monotonic()
+        ips = None
+        with self._lock:
+            state = self._states.get(uuid)
+            if state is None:
+                return # Stopped meanwhile
+            state.busy = False
+            if state.token != token:
+                return # Timed out; already counted and rescheduled
+            self._stats['polls'] += 1
+            state.has_agent = has_agent
+            if not has_agent:
+                state.interval = self.max_interval # Re-checked rarely, in case one is added
+                state.due = now + state.interval
+                if state.data is not None:
+                    state.data = None
+                    ips = []
+            elif error is not None:
+                self._stats['failures'] += 1
+                self._fail_locked(state, now)
+            else:
+                changed = data != state.data
+                state.interval = self.interval if changed else min(self.max_interval, state.interval * 1.5)
+                state.failures = 0
+                state.data = data
+                state.fetched = now
+                state.due = now + state.interval
+                state.expires = now + state.interval * self.ttl_factor
+                ips = data['ips'] # Every time: a no-op when unchanged, and the index may have been rebuilt
+        if ips is not None:
+            self.libvirt_manager.search.set_ips(uuid, ips, source='agent')
@@ -0,0 +1,336 @@
+# app/core/instrumentation.py
+
+import bisect
+import contextvars
+import threading
+import time
+
+import libvirt
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Answered by the bindings from the object itself, never over the wire: not timed or counted
+LOCAL_METHODS = frozenset(('name', 'UUIDString', 'UUID', 'ID', 'getName', 'isAlive', 'connect',
+                           'c_pointer', 'getConnect', 'getDomain'))
+
+# libvirt object types whose calls are instrumented; results of these types are wrapped too
+WRAPPED_TYPES = tuple(getattr(libvirt, name) for name in (
+    'virConnect', 'virDomain', 'virDomainSnapshot', 'virDomainCheckpoint', 'virStoragePool',
+    'virStorageVol', 'virNetwork', 'virNetworkPort', 'virInterface', 'virNodeDevice', 'virSecret',
+    'virNWFilter', 'virNWFilterBinding', 'virStream') if hasattr(libvirt, name))
+
+# Other stand-ins for libvirt objects (e.g. simulated connections), wrapped like the real ones
+_proxy_types = ()
+
+def register_proxy_type(cls):
+    """Lets objects of `cls` be instrumented; they must expose the wrapped type's name as `_prefix`."""
+    global _proxy_types
+    _proxy_types += (cls,)
+
+
+class Histogram:
+    """Cumulative-style latency histogram over LATENCY_BUCKETS."""
+
+    __slots__ = ('buckets', 'sum', 'count')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # Last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class RPCStats:
+    """
+    Process-wide counters: calls, errors and latency per libvirt method (e.g.
+    'virDomain.XMLDesc'), and requests, latency and libvirt calls per HTTP
+    endpoint. prometheus() renders them in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}     # method -> Histogram
+        self._errors = {}    # method -> count
+        self._requests = {}  # (endpoint, http method, status) -> count
+        self._latency = {}   # endpoint -> Histogram
+        self._rpcs = {}      # endpoint -> [total calls, requests, most in one request]
+
+    def record_call(self, method, seconds, error=False):
+        with self._lock:
+            histogram = self._calls.get(method)
+            if histogram is None:
+                histogram = self._calls[method] = Histogram()
+            histogram.observe(seconds)
+            if error:
+                self._errors[method] = self._errors.get(method, 0) + 1
+
+    def record_request(self, endpoint, http_method, status, seconds, rpcs):
+        with self._lock:
+            key = (endpoint, http_method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            histogram = self._latency.get(endpoint)
+            if histogram is None:
+                histogram = self._latency[endpoint] = Histogram()
+            histogram.observe(seconds)
+            entry = self._rpcs.setdefault(endpoint, [0, 0, 0])
+            entry[0] += rpcs
+            entry[1] += 1
+            entry[2] = max(entry[2], rpcs)
+
+    def methods(self):
+        """Per-method totals, busiest first: [{'method', 'calls', 'errors', 'seconds'}]."""
+        with self._lock:
+            rows = [{'method': method, 'calls': h.count, 'errors': self._errors.get(method, 0),
+                     'seconds': round(h.sum, 6)} for method, h in self._calls.items()]
+        return sorted(rows, key=lambda row: -row['seconds'])
+
+    def endpoints(self):
+        """Per-endpoint libvirt calls: [{'endpoint', 'requests', 'rpcs_avg', 'rpcs_max'}], most calls first."""
+        with self._lock:
+            rows = [{'endpoint': endpoint, 'requests': count, 'rpcs_avg': round(total / count, 2),
+                     'rpcs_max': most} for endpoint, (total, count, most) in self._rpcs.items()]
+        return sorted(rows, key=lambda row: -row['rpcs_avg'])
+
+    def reset(self):
+        with self._lock:
+            for table in (self._calls, self._errors, self._requests, self._latency, self._rpcs):
+                table.clear()
+
+    def prometheus(self, gauges=None):
+        """
+        Text exposition of all counters. `gauges` adds plain gauges:
+        {name: (help, value)} or {name: (help, {label value: value}, label name)}.
+        """
+        with self._lock:
+            calls = {method: _copy(h) for method, h in self._calls.items()}
+            errors = dict(self._errors)
+            requests = dict(self._requests)
+            latency = {endpoint: _copy(h) for endpoint, h in self._latency.items()}
+            rpcs = {endpoint: list(entry) for endpoint, entry in self._rpcs.items()}
+
+        lines = []
+        _histogram(lines, 'grenade_libvirt_call_duration_seconds',
+                   'Latency of libvirt binding calls.', 'method', calls)
+        lines.append('# HELP grenade_libvirt_call_errors_total libvirt binding calls that raised.')
+        lines.append('# TYPE grenade_libvirt_call_errors_total counter')
+        for method in sorted(calls):
+            lines.append(f'grenade_libvirt_call_errors_total{{method="{_label(method)}"}} {errors.get(method, 0)}')
+
+        lines.append('# HELP grenade_http_requests_total HTTP requests served.')
+        lines.append('# TYPE grenade_http_requests_total counter')
+        for (endpoint, http_method, status), count in sorted(requests.items()):
+            lines.append(f'grenade_http_requests_total{{endpoint="{_label(endpoint)}",method="{http_method}",'
+                         f'status="{status}"}} {count}')
+        _histogram(lines, 'grenade_http_request_duration_seconds',
+                   'Time to build HTTP responses (streamed bodies excluded).', 'endpoint', latency)
+        lines.append('# HELP grenade_http_request_libvirt_calls libvirt calls made per HTTP request.')
+        lines.append('# TYPE grenade_http_request_libvirt_calls summary')
+        for endpoint, (total, count, most) in sorted(rpcs.items()):
+            label = f'endpoint="{_label(endpoint)}"'
+            lines.append(f'grenade_http_request_libvirt_calls_sum{{{label}}} {total}')
+            lines.append(f'grenade_http_request_libvirt_calls_count{{{label}}} {count}')
+        lines.append('# HELP grenade_http_request_libvirt_calls_max Most libvirt calls made by one request.')
+        lines.append('# TYPE grenade_http_request_libvirt_calls_max gauge')
+        for endpoint, (total, count, most) in sorted(rpcs.items()):
+            lines.append(f'grenade_http_request_libvirt_calls_max{{endpoint="{_label(endpoint)}"}} {most}')
+
+        for name, spec in sorted((gauges or {}).items()):
+            lines.append(f'# HELP {name} {spec[0]}')
+            lines.append(f'# TYPE {name} gauge')
+            if isinstance(spec[1], dict):
+                for key, value in sorted(spec[1].items()):
+                    lines.append(f'{name}{{{spec[2]}="{_label(key)}"}} {_number(value)}')
+            else:
+                lines.append(f'{name} {_number(spec[1])}')
+        return '\n'.join(lines) + '\n'
+
+
+def _copy(histogram):
+    copy = Histogram()
+    copy.buckets = list(histogram.buckets)
+    copy.sum, copy.count = histogram.sum, histogram.count
+    return copy
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value):
+    if value is None:
+        return 'NaN'
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+def _histogram(lines, name, help_text, label, histograms):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for key, histogram in sorted(histograms.items()):
+        label_text = f'{label}="{_label(key)}"'
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram.buckets):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{label_text}}} {histogram.sum!r}')
+        lines.append(f'{name}_count{{{label_text}}} {histogram.count}')
+
+
+# --- Per-request traces ---
+_current = contextvars.ContextVar('libvirt_trace', default=None)
+
+class Trace:
+    """libvirt calls made while serving one request (or any other unit of work)."""
+
+    __slots__ = ('started', 'calls', 'errors', 'libvirt_seconds', 'methods', '_lock')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.calls = 0
+        self.errors = 0
+        self.libvirt_seconds = 0.0
+        self.methods = {}  # method -> [calls, seconds]
+        self._lock = threading.Lock()
+
+    def record(self, method, seconds, error=False):
+        with self._lock:
+            self.calls += 1
+            self.errors += error
+            self.libvirt_seconds += seconds
+            entry = self.methods.get(method)
+            if entry is None:
+                self.methods[method] = [1, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def repeated(self, threshold):
+        """Methods called at least `threshold` times, the usual sign of an N+1 loop."""
+        with self._lock:
+            return {method: calls for method, (calls, _) in self.methods.items() if calls >= threshold}
+
+    def server_timing(self):
+        """Server-Timing header value: time spent in libvirt and in total, in ms."""
+        return (f'libvirt;dur={self.libvirt_seconds * 1000:.2f};desc="{self.calls} calls", '
+                f'total;dur={self.elapsed() * 1000:.2f}')
+
+    def breakdown(self):
+        """'method=calls' pairs, most calls first, for the debug header."""
+        with self._lock:
+            items = sorted(self.methods.items(), key=lambda item: -item[1][0])
+        return ', '.join(f'{method}={calls}' for method, (calls, _) in items)
+
+def begin_trace():
+    """Starts a trace for the current thread / asyncio task and returns it."""
+    trace = Trace()
+    _current.set(trace)
+    return trace
+
+def end_trace():
+    """Stops recording into the current trace and returns it (or None)."""
+    trace = _current.get()
+    _current.set(None)
+    return trace
+
+def current_trace():
+    return _current.get()
+
+
+# --- Binding proxies ---
+class InstrumentedProxy:
+    """
+    Stands in for a libvirt object (connection, domain, pool, ...). Every call
+    is timed into `stats` and the current trace; libvirt objects it returns
+    are wrapped the same way, and proxies passed as arguments are unwrapped,
+    since the bindings only accept their own types.
+    """
+
+    __slots__ = ('_target', '_stats', '_prefix')
+
+    def __init__(self, target, stats):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_stats', stats)
+        object.__setattr__(self, '_prefix', target._prefix if isinstance(target, _proxy_types)
+                           else type(target).__name__)
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+        stats = self._stats
+        if name in LOCAL_METHODS:
+            def local(*args, **kwargs):
+                return wrap(attr(*args, **kwargs), stats)
+            return local
+        method = f"{self._prefix}.{name}"
+
+        def call(*args, **kwargs):
+            if args:
+                args = tuple(_unwrap(arg) for arg in args)
+            if kwargs:
+                kwargs = {key: _unwrap(value) for key, value in kwargs.items()}
+            start = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception:
+                _record(stats, method, time.perf_counter() - start, True)
+                raise
+            _record(stats, method, time.perf_counter() - start, False)
+            return wrap(result, stats)
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+    def __eq__(self, other):
+        return self._target == _unwrap(other)
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __repr__(self):
+        return f"<instrumented {self._target!r}>"
+
+def _record(stats, method, seconds, error):
+    stats.record_call(method, seconds, error)
+    trace = _current.get()
+    if trace is not None:
+        trace.record(method, seconds, error)
+
+def wrap(value, stats):
+    """Wraps libvirt objects in `value` (also inside lists/tuples, e.g. stats records)."""
+    if isinstance(value, WRAPPED_TYPES) or isinstance(value, _proxy_types):
+        return InstrumentedProxy(value, stats)
+    if isinstance(value, list):
+        return [wrap(item, stats) for item in value]
+    if isinstance(value, tuple):
+        return tuple(wrap(item, stats) for item in value)
+    return value
+
+def _unwrap(value):
+    if isinstance(value, InstrumentedProxy):
+        return value._target
+    if isinstance(value, list):
+        return [_unwrap(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_unwrap(item) for item in value)
+    return value
+
+def instrumented_opener(stats, opener=None):
+    """An opener (uri -> connection) whose connections report into `stats`."""
+    opener = opener or libvirt.open
+
+    def open_instrumented(uri):
+        start = time.perf_counter()
+        try:
+            conn = opener(uri)
+        except Exception:
+            _record(stats, 'libvirt.open', time.perf_counter() - start, True)
+            raise
+        _record(stats, 'libvirt.open', time.perf_counter() - start, False)
+        return InstrumentedProxy(conn, stats) if conn is not None else None
+    return open_instrumented
@@ -0,0 +1,171 @@
+# app/core/jobs.py
+
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+class Job:
+    """A single queued unit of work, e.g. one lifecycle action on one VM."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    def __init__(self, key, action, target, func, args, kwargs):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.action = action
+        self.target = target
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = Job.QUEUED
+        self.progress = 0
+        self.message = ''
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def is_finished(self):
+        return self.status in (Job.SUCCEEDED, Job.FAILED)
+
+    def set_progress(self, progress, message=None):
+        """Lets long-running work report progress (0-100) while it runs."""
+        self.progress = max(0, min(100, int(progress)))
+        if message is not None:
+            self.message = message
+
+    def wait(self, timeout=None):
+        """Blocks until the job has finished. Returns True if it did within `timeout`."""
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'action': self.action,
+            'target': self.target,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'error': self.error,
+            'result': self.result if isinstance(self.result, (dict, list, str, int, float, bool)) else None,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded thread pool. Jobs sharing a key (normally the VM name)
+    run strictly one after another, in submission order, so two actions on the
+    same domain never overlap; jobs with different keys run concurrently.
+    """
+
+    def __init__(self, max_workers=8, max_pending=1000, max_history=1000, context=None):
+        self.max_pending = max_pending
+        self.max_history = max_history
+        # Wraps every job run, e.g. LibvirtManager.connection to check out a connection
+        self._context = context or nullcontext
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()   # id -> Job, oldest first
+        self._queues = {}            # key -> deque of jobs waiting behind the running one
+        self._pending = 0            # queued + running jobs
+
+    def submit(self, key, action, func, args=(), kwargs=None, target=None, pass_job=False):
+        """
+        Enqueues func(*args, **kwargs) and returns its Job right away, or None if
+        the engine already holds max_pending unfinished jobs. With pass_job=True the
+        function also receives the Job as `job=` so it can report progress.
+        A result of False or None marks the job failed, anything else succeeded.
+        """
+        kwargs = dict(kwargs or {})
+        job = Job(key, action, target if target is not None else key, func, args, kwargs)
+        if pass_job:
+            job.kwargs['job'] = job
+        with self._lock:
+            if self._pending >= self.max_pending:
+                return None
+            self._pending += 1
+            self._jobs[job.id] = job
+            self._prune_history()
+            queue = self._queues.get(key)
+            if queue is not None:
+                queue.append(job) # Another job for this key is running; run after it
+                return job
+            self._queues[key] = deque()
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        """Returns a Job by id, or None."""
+        return self._jobs.get(job_id)
+
+    def list(self, status=None, limit=100):
+        """Returns the most recent jobs first, optionally filtered by status."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        jobs.reverse()
+        if status:
+            jobs = [job for job in jobs if job.status == status]
+        return jobs[:limit]
+
+    def stats(self):
+        """Returns counts of jobs per status and the number of busy keys."""
+        with self._lock:
+            counts = {Job.QUEUED: 0, Job.RUNNING: 0, Job.SUCCEEDED: 0, Job.FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            counts['active_keys'] = len(self._queues)
+            return counts
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job):
+        job.status = Job.RUNNING
+        job.started_at = time.time()
+        try:
+            with self._context():
+                job.result = job.func(*job.args, **job.kwargs)
+            job.status = Job.FAILED if job.result is False or job.result is None else Job.SUCCEEDED
+        except Exception as e:
+            print(f"Job {job.id} ({job.action} {job.target}) failed: {e}", file=sys.stderr)
+            job.error = str(e)
+            job.status = Job.FAILED
+        job.progress = 100
+        job.finished_at = time.time()
+        job.func = job.args = job.kwargs = None # Release references held by finished jobs
+        job._done.set()
+
+        with self._lock:
+            self._pending -= 1
+            queue = self._queues[job.key]
+            if queue:
+                next_job = queue.popleft()
+            else:
+                del self._queues[job.key]
+                next_job = None
+        if next_job is not None:
+            self._executor.submit(self._run, next_job)
+
+    def _prune_history(self):
+        """Drops the oldest finished jobs beyond max_history. Caller holds the lock."""
+        excess = len(self._jobs) - self.max_history
+        if excess <= 0:
+            return
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].is_finished():
+                del self._jobs[job_id]
+                excess -= 1
@@ -1,57 +1,241 @@
 # app/core/libvirt_manager.py
 
+import contextvars
 import libvirt
 import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from app.core.cloning import CloneTemplate
+from app.core.connection_pool import ConnectionPool
+from app.core.domain_xml import DomainXMLCache, parse_domain_xml
+from app.core.event_loop import start_event_loop, uses_asyncio_event_loop
+from app.core.instrumentation import instrumented_opener
+from app.core.provisioning import ProvisioningError, ProvisioningPipeline
+from app.core.search_index import SearchIndex, SearchIndexer
+from app.core.simulator import open_uri
+from app.core.snapshots import SnapshotCache, parse_snapshot_xml, snapshot_tree, snapshot_xml
+from app.core.storage_index import StorageIndex
+from app.core.vm_inventory import VMInventory
+
+def format_version(version):
+    """9009000 -> '9.9.0'."""
+    if not version:
+        return 'unknown'
+    return f"{version // 1000000}.{version // 1000 % 1000}.{version % 1000}"
 
 class LibvirtManager:
-    def __init__(self, uri='qemu:///system'):
+    # Stats groups fetched in a single getAllDomainStats/domainListGetStats RPC
+    INVENTORY_STATS = (libvirt.VIR_DOMAIN_STATS_STATE |
+                       libvirt.VIR_DOMAIN_STATS_VCPU |
+                       libvirt.VIR_DOMAIN_STATS_BALLOON |
+                       libvirt.VIR_DOMAIN_STATS_BLOCK |
+                       libvirt.VIR_DOMAIN_STATS_INTERFACE)
+
+    # Stats groups for metrics sampling: inventory stats plus total CPU time
+    METRICS_STATS = INVENTORY_STATS | libvirt.VIR_DOMAIN_STATS_CPU_TOTAL
+
+    # Seconds between inventory consistency checks (catches missed events)
+    INVENTORY_CHECK_INTERVAL = 60
+    # libvirt versions (major * 1000000 + minor * 1000 + release) that can revert and delete
+    # external (disk-only) snapshots; older ones only create them
+    EXTERNAL_SNAPSHOT_REVERT_VERSION = 9009000
+    EXTERNAL_SNAPSHOT_DELETE_VERSION = 9000000
+
+    # Reconnect backoff bounds in seconds
+    RECONNECT_BACKOFF_MIN = 0.5
+    RECONNECT_BACKOFF_MAX = 30.0
+
+    def __init__(self, uri='qemu:///system', use_events=True, pool_size=0, pool_timeout=10.0, rpc_stats=None):
         self.uri = uri
-        self.conn = None
+        self.use_events = use_events
+        # With an RPCStats every binding call on this manager's connections is counted and timed
+        self.rpc_stats = rpc_stats
+        # sim:// URIs open a simulated slow hypervisor (see app.core.simulator)
+        self._opener = instrumented_opener(rpc_stats, open_uri) if rpc_stats is not None else open_uri
+        self.inventory = VMInventory()
+        self.domain_xml = DomainXMLCache()
+        self.storage = StorageIndex()
+        self.search = SearchIndex()
+        self._indexer = None
+        self.snapshots = SnapshotCache()
+        # Optional GuestAgentCollector; its cached data is added to get_vm_details()
+        self.guest_agent = None
+        # Primary connection: events, inventory and callers without a checked-out connection
+        self._conn = None
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._backoff = 0.0
+        self._next_connect_attempt = 0.0
+        self._lib_version = None
+        self._event_callback_ids = []
+        self._pool_event_callback_ids = []
+        self._check_stop = None
+        # Runs event callbacks off the event loop when that loop is asyncio's (see _dispatch)
+        self._event_executor = None
+        # Optional pool for per-thread checkouts (e.g. one per Flask request)
+        self.pool = ConnectionPool(uri, pool_size, pool_timeout, opener=self._opener) if pool_size > 0 else None
+
+    @property
+    def conn(self):
+        """The connection checked out by the current thread, else the primary connection."""
+        conn = getattr(self._local, 'conn', None)
+        return conn if conn is not None else self._conn
+
+    @conn.setter
+    def conn(self, value):
+        self._conn = value
 
     def connect(self):
         """
         Attempts to establish a connection to the libvirt daemon.
         Returns True on success, False otherwise.
         """
-        if self.conn: # Already connected
-            return True
-        try:
-            self.conn = libvirt.open(self.uri)
-            if self.conn is None:
-                print(f"Error: Failed to open connection to '{self.uri}'", file=sys.stderr)
+        with self._lock:
+            if self._conn: # Already connected
+                return True
+            if time.monotonic() < self._next_connect_attempt:
+                return False # Still backing off after a failed attempt
+            try:
+                # The event loop must be registered before the connection is opened
+                events = self.use_events and start_event_loop()
+                self._conn = self._opener(self.uri)
+                if self._conn is None:
+                    print(f"Error: Failed to open connection to '{self.uri}'", file=sys.stderr)
+                    self._schedule_reconnect()
+                    return False
+                print(f"Successfully connected to libvirt at '{self.uri}'")
+                self._backoff = 0.0
+                self._next_connect_attempt = 0.0
+                if self.pool is not None:
+                    self.pool.reopen() # Closed by a previous disconnect()
+                if events:
+                    self._start_inventory_tracking()
+                return True
+            except libvirt.libvirtError as e:
+                print(f"Libvirt connection error: {e}", file=sys.stderr)
+                self._conn = None
+                self._schedule_reconnect()
                 return False
-            print(f"Successfully connected to libvirt at '{self.uri}'")
-            return True
-        except libvirt.libvirtError as e:
-            print(f"Libvirt connection error: {e}", file=sys.stderr)
-            self.conn = None
+
+    def _schedule_reconnect(self):
+        """Doubles the reconnect backoff after a failed connection attempt."""
+        self._backoff = min(self.RECONNECT_BACKOFF_MAX, self._backoff * 2 or self.RECONNECT_BACKOFF_MIN)
+        self._next_connect_attempt = time.monotonic() + self._backoff
+
+    def is_alive(self):
+        """
+        True if the primary connection is open and alive. Answered locally and
+        never reconnects, so it is safe on an event loop; is_connected() does
+        the recovery.
+        """
+        conn = self._conn
+        try:
+            return conn is not None and conn.isAlive() == 1
+        except libvirt.libvirtError:
             return False
 
     def is_connected(self):
-        """Checks if the libvirt connection is active and responsive."""
-        if self.conn:
-            try:
-                # Attempt to get a property to verify connection is still alive
-                self.conn.getLibVersion()
+        """
+        Checks if the libvirt connection is alive. Uses isAlive(), which is answered
+        locally, so no RPC is made. A lost primary connection is reopened (with
+        backoff) and a dead checked-out connection is swapped for a fresh one.
+        """
+        conn = self.conn
+        if conn is None:
+            return False
+        try:
+            if conn.isAlive() == 1:
                 return True
-            except libvirt.libvirtError:
-                self.conn = None # Connection lost
-                return False
-        return False
+        except libvirt.libvirtError:
+            pass
+
+        if getattr(self._local, 'conn', None) is conn:
+            self.pool.release(conn, broken=True)
+            self._local.conn = self.pool.acquire()
+            return self._local.conn is not None
+
+        with self._lock:
+            if self._conn is conn:
+                print(f"Libvirt connection to '{self.uri}' lost, reconnecting.", file=sys.stderr)
+                self._stop_inventory_tracking()
+                try:
+                    conn.close()
+                except libvirt.libvirtError:
+                    pass
+                self._conn = None # Connection lost
+            return self.connect()
 
     def disconnect(self):
         """Closes the libvirt connection."""
-        if self.conn:
-            try:
-                self.conn.close()
-                print("Disconnected from libvirt.")
-            except libvirt.libvirtError as e:
-                print(f"Error closing libvirt connection: {e}", file=sys.stderr)
-            finally:
-                self.conn = None
+        with self._lock:
+            self._stop_inventory_tracking()
+            if self.pool:
+                self.pool.close()
+            self._lib_version = None
+            if self._conn:
+                try:
+                    self._conn.close()
+                    print("Disconnected from libvirt.")
+                except libvirt.libvirtError as e:
+                    print(f"Error closing libvirt connection: {e}", file=sys.stderr)
+                finally:
+                    self._conn = None
+
+    # --- Per-thread connection checkout ---
+    def checkout(self):
+        """
+        Pins a pooled connection to the current thread; `self.conn` then refers to
+        it until release() is called. Nested calls are counted. Without a pool the
+        primary connection is used. Returns False if no connection is available.
+        """
+        if self.pool is None:
+            return self.connect()
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+        if depth > 0:
+            return self.conn is not None
+        self._local.conn = None
+        if not self.connect(): # Primary connection also carries events and the inventory
+            return False
+        # If the pool is exhausted or unreachable, the primary connection is used instead
+        self._local.conn = self.pool.acquire()
+        return True
+
+    def release(self):
+        """Returns the current thread's pooled connection to the pool."""
+        if self.pool is None:
+            return
+        depth = getattr(self._local, 'depth', 0)
+        if depth == 0:
+            return
+        self._local.depth = depth - 1
+        if depth == 1:
+            conn = self._local.conn
+            self._local.conn = None
+            if conn is not None:
+                self.pool.release(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager around checkout()/release(); yields True if a connection is available."""
+        available = self.checkout()
+        try:
+            yield available
+        finally:
+            self.release()
+
+    def pool_metrics(self):
+        """Returns connection pool metrics, or None if pooling is disabled."""
+        return self.pool.metrics() if self.pool else None
 
     def list_active_vms(self):
         """Lists the names of all active (running) virtual machines."""
+        if self.inventory.is_ready():
+            return [vm['name'] for vm in self.inventory.list(active=True)]
         if not self.is_connected():
             return []
         try:
@@ -63,6 +247,8 @@ class LibvirtManager:
 
     def list_inactive_vms(self):
         """Lists the names of all inactive (stopped/defined but not running) virtual machines."""
+        if self.inventory.is_ready():
+            return [vm['name'] for vm in self.inventory.list(active=False)]
         if not self.is_connected():
             return []
         try:
@@ -74,6 +260,17 @@ class LibvirtManager:
 
     def get_domain_by_name(self, vm_name):
         """Returns a libvirt Domain object by its name."""
+        if self.inventory.is_ready():
+            domain = self.inventory.get_domain(vm_name)
+            if domain is not None and getattr(self._local, 'conn', None) is None:
+                return domain
+            vm = self.inventory.get_by_name(vm_name)
+            if vm is not None and self.is_connected():
+                # Cached objects belong to the primary connection; rebind to the checked-out one
+                try:
+                    return self.conn.lookupByUUIDString(vm['uuid'])
+                except libvirt.libvirtError:
+                    pass # Fall back to a lookup by name
         if not self.is_connected():
             return None
         try:
@@ -166,7 +363,9 @@ class LibvirtManager:
         if domain:
             try:
                 # Ensure VM is not running
-                state, reason = domain.state()
+                state = self.get_vm_state(vm_name)
+                if state is None:
+                    state, reason = domain.state()
                 if state == libvirt.VIR_DOMAIN_RUNNING:
                     print(f"Error: VM '{vm_name}' is running. Stop or destroy it first.", file=sys.stderr)
                     return False
@@ -182,6 +381,143 @@ class LibvirtManager:
                 return False
         return False
 
+    # --- Batch actions (banyak VM sekaligus, paralel) ---
+    BATCH_METHODS = ('start_vm', 'stop_vm', 'destroy_vm', 'suspend_vm', 'resume_vm', 'delete_vm',
+                     'create_snapshot', 'revert_snapshot', 'delete_snapshot')
+
+    def run_many(self, method, vm_names, concurrency=8, **kwargs):
+        """
+        Runs a single-VM action method (e.g. 'start_vm') on many VMs in parallel,
+        at most `concurrency` at a time, each worker on its own checked-out
+        connection; `kwargs` are passed to every call. Yields (vm_name, result)
+        pairs in completion order, result being the method's return value.
+        """
+        if method not in self.BATCH_METHODS:
+            raise ValueError(f"Unsupported batch action '{method}'")
+        action = getattr(self, method)
+        vm_names = list(dict.fromkeys(vm_names)) # De-duplicate, keep order
+        if not vm_names:
+            return
+
+        def run(vm_name):
+            with self.connection():
+                return action(vm_name, **kwargs)
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(vm_names))),
+                                      thread_name_prefix='batch')
+        # One context copy per task (a Context can't be entered by two threads
+        # at once), so each call lands in the caller's trace
+        futures = {executor.submit(contextvars.copy_context().run, run, vm_name): vm_name
+                   for vm_name in vm_names}
+        try:
+            for future in as_completed(futures):
+                try:
+                    success = future.result()
+                except Exception as e:
+                    print(f"Error running {method} on '{futures[future]}': {e}", file=sys.stderr)
+                    success = False
+                yield futures[future], success
+        finally:
+            # Consumer went away (e.g. client disconnected): drop work not yet started
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def start_many(self, vm_names, concurrency=8):
+        """Starts many VMs in parallel. Returns {vm_name: success}."""
+        return dict(self.run_many('start_vm', vm_names, concurrency))
+
+    def stop_many(self, vm_names, concurrency=8):
+        """Gracefully shuts down many VMs in parallel. Returns {vm_name: success}."""
+        return dict(self.run_many('stop_vm', vm_names, concurrency))
+
+    def destroy_many(self, vm_names, concurrency=8):
+        """Forcefully powers off many VMs in parallel. Returns {vm_name: success}."""
+        return dict(self.run_many('destroy_vm', vm_names, concurrency))
+
+    def suspend_many(self, vm_names, concurrency=8):
+        """Suspends many VMs in parallel. Returns {vm_name: success}."""
+        return dict(self.run_many('suspend_vm', vm_names, concurrency))
+
+    def resume_many(self, vm_names, concurrency=8):
+        """Resumes many VMs in parallel. Returns {vm_name: success}."""
+        return dict(self.run_many('resume_vm', vm_names, concurrency))
+
+    def delete_many(self, vm_names, concurrency=8):
+        """Undefines many (stopped) VMs in parallel. Returns {vm_name: success}."""
+        return dict(self.run_many('delete_vm', vm_names, concurrency))
+
+    def select_vms(self, names=None, uuids=None, selector=None):
+        """
+        Resolves batch targets to VM names. `names` and `uuids` are explicit lists;
+        `selector` is a dict with any of 'state' (e.g. 'Running', 'Stopped'),
+        'name_prefix', 'tag', 'bridge' or 'network'. Explicit targets and selector matches
+        are combined. Returns (vm_names, missing) where `missing` lists names/UUIDs
+        that do not exist.
+        """
+        vms = self.list_vms() or []
+        by_name = {vm['name']: vm for vm in vms}
+        by_uuid = {vm['uuid']: vm for vm in vms}
+        selected, missing = [], []
+        for name in names or []:
+            (selected if name in by_name else missing).append(name)
+        for uuid in uuids or []:
+            if uuid in by_uuid:
+                selected.append(by_uuid[uuid]['name'])
+            else:
+                missing.append(uuid)
+
+        if selector:
+            state = selector.get('state')
+            prefix = selector.get('name_prefix')
+            candidates = [vm for vm in vms
+                          if (not state or vm['state'].lower() == state.lower())
+                          and (not prefix or vm['name'].startswith(prefix))]
+            tag = selector.get('tag')
+            if tag:
+                candidates = [vm for vm in candidates if self._has_tag(vm['name'], tag)]
+            bridge = selector.get('bridge')
+            network = selector.get('network')
+            if bridge or network:
+                # Interface sources are only in the domain XML; filter the remaining candidates
+                candidates = [vm for vm in candidates
+                              if self._uses_network(vm['name'], bridge, network)]
+            selected.extend(vm['name'] for vm in candidates)
+        return list(dict.fromkeys(selected)), missing
+
+    def _uses_network(self, vm_name, bridge=None, network=None):
+        """True if one of the VM's interfaces is attached to `bridge` or `network`."""
+        model, _ = self.get_domain_model(vm_name)
+        if model is None:
+            return False
+        for iface in model.interfaces:
+            if bridge and iface.type == 'bridge' and iface.source == bridge:
+                return True
+            if network and iface.type == 'network' and iface.source == network:
+                return True
+        return False
+
+    def _has_tag(self, vm_name, tag):
+        """True if the VM carries `tag` in its Grenade metadata."""
+        model, _ = self.get_domain_model(vm_name)
+        return model is not None and tag in model.tags
+
+    def search_vms(self, query, limit=50):
+        """
+        Searches domains by UUID, name prefix, MAC, guest IP, disk path or tag
+        (see SearchIndex.search). Served from the event-maintained index; without
+        event tracking the index is rebuilt first, which reads every domain's XML.
+        Returns a list of matches, or None if not connected.
+        """
+        if self._indexer is None:
+            if not self.is_connected():
+                return None
+            indexer = SearchIndexer(self, self.search)
+            indexer.mark_all()
+            indexer.refresh_leases()
+            indexer.process()
+        return self.search.search(query, limit)
+
     def create_vm(self, xml_config):
         """
         Defines a new virtual machine from an XML configuration string.
@@ -197,6 +533,254 @@ class LibvirtManager:
             print(f"Error defining VM from XML: {e}", file=sys.stderr)
             return None
 
+    # --- Snapshots ---
+    def _snapshot_state(self, vm_name, refresh=False):
+        """(snapshots dict, current name) from the snapshot cache, synced if stale. None on error."""
+        domain = self.get_domain_by_name(vm_name)
+        if domain is None:
+            return None
+        uuid = domain.UUIDString()
+        cached = None if refresh else self.snapshots.get(uuid)
+        return cached if cached is not None else self.snapshots.sync(uuid, domain)
+
+    def list_snapshots(self, vm_name, refresh=False):
+        """
+        Lists a VM's snapshots, oldest first: name, description, state, created,
+        parent, memory, external, disks and current. Returns None if the VM is
+        unknown or the snapshots can't be read.
+        """
+        state = self._snapshot_state(vm_name, refresh)
+        if state is None:
+            return None
+        snapshots, current = state
+        return [dict(info, current=name == current)
+                for name, info in sorted(snapshots.items(), key=lambda item: (item[1]['created'], item[0]))]
+
+    def get_snapshot_tree(self, vm_name, refresh=False):
+        """Returns a VM's snapshots nested by parent (see snapshot_tree), or None."""
+        state = self._snapshot_state(vm_name, refresh)
+        return snapshot_tree(*state) if state is not None else None
+
+    def create_snapshot(self, vm_name, snapshot_name=None, description='', disk_only=False, quiesce=None):
+        """
+        Creates a snapshot. By default an internal one (disks and, for a running
+        VM, memory). disk_only=True takes an external disk-only snapshot instead:
+        every writable disk moves onto a new qcow2 overlay, which is quick and
+        doesn't pause the guest for a memory dump. quiesce=None freezes guest
+        filesystems first when the VM runs a guest agent, retrying without if the
+        agent doesn't answer; True requires it. Returns the snapshot's info dict
+        (with 'quiesced'), or None on failure.
+        """
+        domain = self.get_domain_by_name(vm_name)
+        if domain is None:
+            return None
+        snapshot_name = snapshot_name or time.strftime('snap-%Y%m%d-%H%M%S')
+        flags, disks = 0, None
+        quiesced = False
+        try:
+            if disk_only:
+                model, _ = self.get_domain_model(vm_name)
+                if model is None:
+                    return None
+                disks = {disk.target: 'external' if disk.device == 'disk' and not disk.readonly else 'no'
+                         for disk in model.disks if disk.target}
+                flags = libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_DISK_ONLY | libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_ATOMIC
+                if quiesce or (quiesce is None and model.guest_agent and domain.isActive()):
+                    quiesced = True
+            elif quiesce:
+                print(f"Quiesce needs a disk-only snapshot ('{vm_name}').", file=sys.stderr)
+                return None
+            xml = snapshot_xml(snapshot_name, description, disks)
+            try:
+                snap = domain.snapshotCreateXML(
+                    xml, flags | (libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_QUIESCE if quiesced else 0))
+            except libvirt.libvirtError as e:
+                if not quiesced or quiesce:
+                    raise
+                print(f"Guest agent of '{vm_name}' didn't quiesce ({e}); snapshotting without.",
+                      file=sys.stderr)
+                quiesced = False
+                snap = domain.snapshotCreateXML(xml, flags)
+            info = parse_snapshot_xml(snap.getXMLDesc(0))
+        except (libvirt.libvirtError, ET.ParseError) as e:
+            print(f"Error creating snapshot '{snapshot_name}' of VM '{vm_name}': {e}", file=sys.stderr)
+            return None
+        uuid = domain.UUIDString()
+        self.snapshots.added(uuid, info)
+        if disk_only:
+            # Disk sources now point at the new overlays
+            self.domain_xml.invalidate(uuid)
+            self._mark_search_dirty(domain)
+        print(f"Snapshot '{snapshot_name}' of VM '{vm_name}' created.")
+        return dict(info, current=True, quiesced=quiesced)
+
+    def libvirt_version(self):
+        """The daemon's libvirt version as an int (9009000 is 9.9.0), cached per connection. None on failure."""
+        if self._lib_version is None and self.is_connected():
+            try:
+                self._lib_version = self._conn.getLibVersion()
+            except libvirt.libvirtError as e:
+                print(f"Error reading libvirt version: {e}", file=sys.stderr)
+        return self._lib_version
+
+    def external_snapshot_support(self):
+        """{'revert': bool, 'delete': bool}: what this libvirt can do with external snapshots."""
+        version = self.libvirt_version() or 0
+        return {'revert': version >= self.EXTERNAL_SNAPSHOT_REVERT_VERSION,
+                'delete': version >= self.EXTERNAL_SNAPSHOT_DELETE_VERSION}
+
+    def unsupported_snapshot_vms(self, vm_names, snapshot_name, action):
+        """
+        Names of the VMs whose snapshot `snapshot_name` is external while this
+        libvirt can't `action` ('revert' or 'delete') external snapshots, so a
+        batch can be refused up front instead of failing VM by VM.
+        """
+        if self.external_snapshot_support()[action]:
+            return []
+        blocked = []
+        for vm_name in vm_names:
+            state = self._snapshot_state(vm_name)
+            if state is not None and state[0].get(snapshot_name, {}).get('external'):
+                blocked.append(vm_name)
+        return blocked
+
+    def _check_external_snapshot(self, vm_name, snapshot_name, action):
+        """Prints why and returns False if `action` can't be done on an external snapshot here."""
+        if not self.unsupported_snapshot_vms([vm_name], snapshot_name, action):
+            return True
+        required = (self.EXTERNAL_SNAPSHOT_REVERT_VERSION if action == 'revert'
+                    else self.EXTERNAL_SNAPSHOT_DELETE_VERSION)
+        print(f"Cannot {action} snapshot '{snapshot_name}' of VM '{vm_name}': it is external and "
+              f"libvirt {format_version(self.libvirt_version())} needs {format_version(required)} for that.",
+              file=sys.stderr)
+        return False
+
+    def revert_snapshot(self, vm_name, snapshot_name, running=None):
+        """
+        Reverts a VM to a snapshot. The VM ends up in the state recorded in the
+        snapshot unless `running` forces it (True: running, False: paused).
+        Returns True on success.
+        """
+        domain = self.get_domain_by_name(vm_name)
+        if domain is None or not self._check_external_snapshot(vm_name, snapshot_name, 'revert'):
+            return False
+        flags = 0
+        if running is True:
+            flags = libvirt.VIR_DOMAIN_SNAPSHOT_REVERT_RUNNING
+        elif running is False:
+            flags = libvirt.VIR_DOMAIN_SNAPSHOT_REVERT_PAUSED
+        try:
+            domain.revertToSnapshot(domain.snapshotLookupByName(snapshot_name, 0), flags)
+        except libvirt.libvirtError as e:
+            print(f"Error reverting VM '{vm_name}' to snapshot '{snapshot_name}': {e}", file=sys.stderr)
+            return False
+        uuid = domain.UUIDString()
+        self.snapshots.reverted(uuid, snapshot_name)
+        self.domain_xml.invalidate(uuid)
+        self._mark_search_dirty(domain)
+        print(f"VM '{vm_name}' reverted to snapshot '{snapshot_name}'.")
+        return True
+
+    def delete_snapshot(self, vm_name, snapshot_name, children=False, metadata_only=False):
+        """
+        Deletes a snapshot; with children=True its descendants too, otherwise
+        they are re-parented. metadata_only=True keeps the disk data (e.g. to
+        forget an external snapshot libvirt can't merge). Returns True on success.
+        """
+        domain = self.get_domain_by_name(vm_name)
+        if domain is None:
+            return False
+        if not metadata_only and not self._check_external_snapshot(vm_name, snapshot_name, 'delete'):
+            return False
+        flags = 0
+        if children:
+            flags |= libvirt.VIR_DOMAIN_SNAPSHOT_DELETE_CHILDREN
+        if metadata_only:
+            flags |= libvirt.VIR_DOMAIN_SNAPSHOT_DELETE_METADATA_ONLY
+        try:
+            domain.snapshotLookupByName(snapshot_name, 0).delete(flags)
+        except libvirt.libvirtError as e:
+            print(f"Error deleting snapshot '{snapshot_name}' of VM '{vm_name}': {e}", file=sys.stderr)
+            return False
+        self.snapshots.deleted(domain.UUIDString(), snapshot_name, children)
+        print(f"Snapshot '{snapshot_name}' of VM '{vm_name}' deleted.")
+        return True
+
+    def snapshot_many(self, vm_names, snapshot_name, description='', disk_only=None, quiesce=None,
+                      concurrency=8):
+        """
+        Snapshots many VMs in parallel under one snapshot name. disk_only=None
+        takes disk-only snapshots, so running guests aren't paused for memory
+        dumps, where libvirt can revert them (9.9+), and internal ones otherwise.
+        Returns {vm_name: info dict or None}.
+        """
+        if disk_only is None:
+            disk_only = self.external_snapshot_support()['revert']
+        return dict(self.run_many('create_snapshot', vm_names, concurrency, snapshot_name=snapshot_name,
+                                  description=description, disk_only=disk_only, quiesce=quiesce))
+
+    def revert_many(self, vm_names, snapshot_name, running=None, concurrency=8):
+        """Reverts many VMs (e.g. a whole lab) to the same-named snapshot in parallel. Returns {vm_name: success}."""
+        return dict(self.run_many('revert_snapshot', vm_names, concurrency,
+                                  snapshot_name=snapshot_name, running=running))
+
+    # --- Cloning ---
+    def clone_vm(self, source_name, new_name, full_copy=False, start=False):
+        """Clones one VM (see clone_many). Returns True on success."""
+        result = self.clone_many(source_name, [new_name], full_copy, start)
+        return bool(result and result['succeeded'])
+
+    def clone_many(self, source_name, names, full_copy=False, start=False, concurrency=8,
+                   freeze_source=True, job=None):
+        """
+        Clones a shut-off VM once per name with a new UUID and MACs. Linked
+        clones (the default) get qcow2 overlays backed by the source's disks, so
+        each costs a volume create and a define and almost no space; full_copy
+        copies every disk instead. Overlay creation and defines run on a pool of
+        `concurrency` workers.
+
+        A linked clone breaks if its backing image changes, so with
+        freeze_source the source VM is first moved onto overlays of its own and
+        its current images become read-only bases. Each cloning batch adds one
+        layer to the source's chain.
+
+        Returns {'requested', 'succeeded', 'failed'} like provisioning, or None
+        if the clone can't be planned.
+        """
+        domain = self.get_domain_by_name(source_name)
+        if domain is None:
+            return None
+        pipeline = ProvisioningPipeline(max_workers=max(1, concurrency))
+        plans = []
+        try:
+            if domain.isActive():
+                print(f"VM '{source_name}' must be shut off to be cloned.", file=sys.stderr)
+                return None
+            # SECURE: without it libvirt leaves out console passwords, and the
+            # template also redefines the source when freezing it
+            flags = libvirt.VIR_DOMAIN_XML_INACTIVE | libvirt.VIR_DOMAIN_XML_SECURE
+            template = CloneTemplate(domain.XMLDesc(flags))
+            plans = pipeline.clone_plans(self.conn, template)
+            if not full_copy and freeze_source and plans:
+                self._freeze_disks(pipeline, template, plans, domain)
+            result = pipeline.clone(self.conn, template, names, full_copy, start, concurrency, job, plans)
+        except (libvirt.libvirtError, ET.ParseError, ProvisioningError) as e:
+            print(f"Error cloning VM '{source_name}': {e}", file=sys.stderr)
+            return None
+        finally:
+            # Volume creation fires no storage event; pick up the new images
+            if self.storage.is_loaded():
+                for pool_name in {plan['pool'].name() for plan in plans}:
+                    self.refresh_storage_pool(pool_name)
+        print(f"Cloned VM '{source_name}': {len(result['succeeded'])} of {result['requested']} succeeded.")
+        return result
+
+    def _freeze_disks(self, pipeline, template, plans, domain):
+        """Moves the source VM onto fresh overlays so its current images never change again."""
+        pipeline.freeze_source(self.conn, template, plans, time.strftime('%Y%m%d%H%M%S'))
+        self.domain_xml.invalidate(domain.UUIDString())
+        self._mark_search_dirty(domain)
+
     # --- Storage Management Functions (Contoh Kerangka) ---
     def list_storage_pools(self):
         """Lists active storage pools."""
@@ -214,7 +798,7 @@ class LibvirtManager:
         if not self.is_connected():
             return []
         try:
-            pool = self.conn.lookupStoragePoolByName(pool_name)
+            pool = self.conn.storagePoolLookupByName(pool_name)
             if pool:
                 volumes = pool.listAllVolumes(0) # 0 for all flags
                 return [v.name() for v in volumes]
@@ -223,34 +807,439 @@ class LibvirtManager:
             print(f"Error listing volumes in pool '{pool_name}': {e}", file=sys.stderr)
             return []
 
+    # --- Storage index (pools, volumes, backing chains, usage) ---
+    def get_storage_index(self):
+        """
+        Returns the StorageIndex, loading it on first use and refreshing the
+        volume-to-VM usage map from the (cached) domain models.
+        Without storage pool events the index is re-read on every call.
+        Returns None if not connected.
+        """
+        if not self.is_connected():
+            return None
+        if not self.storage.is_loaded() or not self._pool_event_callback_ids:
+            if not self.storage.load(self._conn):
+                return None
+        usage = {}
+        for vm in self.list_vms():
+            model, _ = self.get_domain_model(vm['name'])
+            if model is None:
+                continue
+            for disk in model.disks:
+                if disk.source:
+                    usage.setdefault(disk.source, set()).add(vm['name'])
+        self.storage.set_usage(usage)
+        return self.storage
+
+    def refresh_storage_pool(self, pool_name, full=False):
+        """
+        Re-reads one pool into the index, e.g. after creating or deleting volumes
+        (libvirt emits no event for volume changes). Returns True on success.
+        """
+        if not self.is_connected():
+            return False
+        try:
+            pool = self._conn.storagePoolLookupByName(pool_name)
+        except libvirt.libvirtError as e:
+            print(f"Error looking up storage pool '{pool_name}': {e}", file=sys.stderr)
+            return False
+        return self.storage.refresh_pool(pool, full=full)
+
+    # --- Bulk inventory (satu RPC untuk semua domain) ---
+    def get_vm_inventory(self, domains=None):
+        """
+        Returns a list of summary dicts (state, vcpu, balloon, block and net stats)
+        for every domain, fetched with a single getAllDomainStats RPC.
+        If `domains` is given, only those domain objects are queried (domainListGetStats).
+        Returns None on failure.
+        """
+        records = self._fetch_domain_stats(domains)
+        if records is None:
+            return None
+        return [summary for _, summary in records]
+
+    def sample_vm_stats(self):
+        """
+        Returns summaries including cumulative CPU time for every domain, from one
+        bulk RPC, for metrics sampling. Returns None on failure.
+        """
+        records = self._fetch_domain_stats(stats=self.METRICS_STATS)
+        if records is None:
+            return None
+        return [summary for _, summary in records]
+
+    def _fetch_domain_stats(self, domains=None, stats=None, primary=False):
+        """
+        Bulk-fetches stats and returns a list of (domain, summary) pairs, or None on failure.
+        With primary=True the primary connection is used even if a pooled one is checked out.
+        """
+        if not self.is_connected():
+            return None
+        conn = self._conn if primary else self.conn
+        if conn is None:
+            return None
+        try:
+            if domains is None:
+                records = conn.getAllDomainStats(stats or self.INVENTORY_STATS, 0)
+            elif domains:
+                records = conn.domainListGetStats(domains, stats or self.INVENTORY_STATS, 0)
+            else:
+                records = []
+        except libvirt.libvirtError as e:
+            if e.get_error_code() != libvirt.VIR_ERR_NO_SUPPORT:
+                print(f"Error fetching domain stats: {e}", file=sys.stderr)
+                return None
+            # Older drivers without the bulk stats API: fall back to per-domain queries
+            return self._fetch_domain_stats_slow(conn, domains)
+
+        # name(), UUIDString() and ID() are served from the domain object itself (no RPC)
+        return [(dom, self._summarize_domain_stats(dom, data)) for dom, data in records]
+
+    def _fetch_domain_stats_slow(self, conn, domains=None):
+        """Per-domain fallback for _fetch_domain_stats (one info() RPC per domain)."""
+        try:
+            if domains is None:
+                domains = conn.listAllDomains(0)
+            records = []
+            for dom in domains:
+                info = dom.info()
+                records.append((dom, self._summarize_domain_stats(dom, {
+                    'state.state': info[0],
+                    'balloon.maximum': info[1],
+                    'balloon.current': info[2],
+                    'vcpu.current': info[3],
+                })))
+            return records
+        except libvirt.libvirtError as e:
+            print(f"Error fetching domain info: {e}", file=sys.stderr)
+            return None
+
+    def _summarize_domain_stats(self, dom, stats):
+        """Converts a flat getAllDomainStats record into a summary dict."""
+        dom_id = dom.ID()
+        state_code = stats.get('state.state', libvirt.VIR_DOMAIN_NOSTATE)
+        block = []
+        for i in range(stats.get('block.count', 0)):
+            prefix = f'block.{i}.'
+            block.append({
+                'name': stats.get(prefix + 'name'),
+                'path': stats.get(prefix + 'path'),
+                'rd_bytes': stats.get(prefix + 'rd.bytes', 0),
+                'wr_bytes': stats.get(prefix + 'wr.bytes', 0),
+                'capacity': stats.get(prefix + 'capacity', 0),
+                'allocation': stats.get(prefix + 'allocation', 0),
+            })
+        net = []
+        for i in range(stats.get('net.count', 0)):
+            prefix = f'net.{i}.'
+            net.append({
+                'name': stats.get(prefix + 'name'),
+                'rx_bytes': stats.get(prefix + 'rx.bytes', 0),
+                'tx_bytes': stats.get(prefix + 'tx.bytes', 0),
+            })
+        return {
+            'name': dom.name(),
+            'uuid': dom.UUIDString(),
+            'id': dom_id if dom_id != -1 else None, # -1 for inactive
+            'state_code': state_code,
+            'state': self._get_vm_state_string(state_code),
+            'vcpu': stats.get('vcpu.current', 0),
+            'max_vcpu': stats.get('vcpu.maximum', stats.get('vcpu.current', 0)),
+            'memory_kb': stats.get('balloon.current', 0),
+            'max_memory_kb': stats.get('balloon.maximum', 0),
+            'cpu_time_ns': stats.get('cpu.time'), # Only with VIR_DOMAIN_STATS_CPU_TOTAL
+            'block': block,
+            'net': net,
+        }
+
+    # --- Inventory cache, dijaga oleh domain events ---
+    def list_vms(self):
+        """
+        Returns summaries of all domains. Served from the event-driven inventory
+        cache when it is ready (no RPC), otherwise fetched with one bulk RPC.
+        Returns None on failure.
+        """
+        if self.inventory.is_ready():
+            return self.inventory.list()
+        return self.get_vm_inventory()
+
+    def find_vm(self, vm_name):
+        """Returns the summary dict of a VM by name (cached when possible), or None."""
+        if self.inventory.is_ready():
+            return self.inventory.get_by_name(vm_name)
+        domain = self.get_domain_by_name(vm_name)
+        if not domain:
+            return None
+        inventory = self.get_vm_inventory([domain])
+        return inventory[0] if inventory else None
+
+    def get_vm_state(self, vm_name):
+        """Returns the cached libvirt state code of a VM, or None if unknown."""
+        if not self.inventory.is_ready():
+            return None
+        vm = self.inventory.get_by_name(vm_name)
+        return vm['state_code'] if vm else None
+
+    def resync_inventory(self):
+        """Refills the inventory cache from one bulk stats RPC. Returns True on success."""
+        # Cached domain objects always belong to the primary connection
+        records = self._fetch_domain_stats(primary=True)
+        if records is None:
+            self.inventory.invalidate()
+            return False
+        self.inventory.replace_all(records)
+        if self._indexer is not None:
+            self._indexer.mark_all()
+        return True
+
+    def check_inventory(self):
+        """
+        Consistency check: compares cached states with a cheap state-only bulk
+        query and resyncs the cache if anything differs (e.g. a missed event).
+        Returns True if the cache was already consistent.
+        """
+        if not self.inventory.is_ready():
+            self.resync_inventory()
+            return False
+        records = self._fetch_domain_stats(stats=libvirt.VIR_DOMAIN_STATS_STATE, primary=True)
+        if records is None:
+            return False
+        current = {summary['uuid']: summary['state_code'] for _, summary in records}
+        if current == self.inventory.states():
+            return True
+        print("Inventory cache out of sync with libvirt, resyncing.", file=sys.stderr)
+        self.resync_inventory()
+        return False
+
+    def _start_inventory_tracking(self):
+        """Registers domain event callbacks, fills the cache and starts the consistency checker."""
+        callbacks = (
+            (libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, self._on_lifecycle_event),
+            (libvirt.VIR_DOMAIN_EVENT_ID_REBOOT, self._on_domain_changed),
+            (libvirt.VIR_DOMAIN_EVENT_ID_DEVICE_ADDED, self._on_device_event),
+            (libvirt.VIR_DOMAIN_EVENT_ID_DEVICE_REMOVED, self._on_device_event),
+        )
+        try:
+            # Keepalives let the event loop notice a dead daemon and fire the close callback
+            self._conn.setKeepAlive(5, 3)
+            self._conn.registerCloseCallback(self._on_connection_closed, None)
+            for event_id, callback in callbacks:
+                self._event_callback_ids.append(
+                    self._conn.domainEventRegisterAny(None, event_id, self._dispatch(callback), None))
+        except libvirt.libvirtError as e:
+            print(f"Error registering domain events, inventory cache disabled: {e}", file=sys.stderr)
+            self._stop_inventory_tracking()
+            return
+        self._register_storage_events()
+
+        self.resync_inventory()
+        self._check_stop = threading.Event()
+        threading.Thread(target=self._inventory_check_loop, args=(self._check_stop,),
+                         name='inventory-check', daemon=True).start()
+        self._indexer = SearchIndexer(self, self.search)
+        self._indexer.start()
+
+    def _dispatch(self, callback):
+        """
+        Wraps an event callback for registration. The callbacks make RPCs, which
+        is fine on the default event loop's own thread but would stall every
+        request if the loop is asyncio's; there they are handed to a single
+        worker thread, which keeps their order.
+        """
+        if not uses_asyncio_event_loop():
+            return callback
+        if self._event_executor is None:
+            self._event_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='libvirt-events')
+        executor = self._event_executor
+
+        def dispatch(*args):
+            executor.submit(callback, *args)
+        return dispatch
+
+    def _register_storage_events(self):
+        """Registers storage pool events; without them the storage index is re-read per query."""
+        pool_callbacks = (
+            (libvirt.VIR_STORAGE_POOL_EVENT_ID_LIFECYCLE, self._on_storage_pool_lifecycle),
+            (libvirt.VIR_STORAGE_POOL_EVENT_ID_REFRESH, self._on_storage_pool_refresh),
+        )
+        try:
+            for event_id, callback in pool_callbacks:
+                self._pool_event_callback_ids.append(
+                    self._conn.storagePoolEventRegisterAny(None, event_id, self._dispatch(callback), None))
+        except (libvirt.libvirtError, AttributeError) as e:
+            print(f"Storage pool events unavailable, storage index not cached: {e}", file=sys.stderr)
+            self._deregister_storage_events()
+
+    def _deregister_storage_events(self):
+        for callback_id in self._pool_event_callback_ids:
+            try:
+                self._conn.storagePoolEventDeregisterAny(callback_id)
+            except libvirt.libvirtError:
+                pass
+        self._pool_event_callback_ids = []
+
+    def _stop_inventory_tracking(self):
+        """Deregisters event callbacks, stops the consistency checker and drops event-fed caches."""
+        if self._check_stop is not None:
+            self._check_stop.set()
+            self._check_stop = None
+        if self._indexer is not None:
+            self._indexer.stop()
+            self._indexer = None
+        if self._conn:
+            for callback_id in self._event_callback_ids:
+                try:
+                    self._conn.domainEventDeregisterAny(callback_id)
+                except libvirt.libvirtError:
+                    pass
+            self._deregister_storage_events()
+            try:
+                self._conn.unregisterCloseCallback()
+            except libvirt.libvirtError:
+                pass
+        self._event_callback_ids = []
+        self._pool_event_callback_ids = []
+        self.inventory.invalidate()
+        # Without events nothing would invalidate parsed XML or the storage index any more
+        self.domain_xml.clear()
+        self.storage.invalidate()
+        self.search.clear()
+
+    def _inventory_check_loop(self, stop):
+        """Runs check_inventory() periodically until `stop` is set."""
+        while not stop.wait(self.INVENTORY_CHECK_INTERVAL):
+            if self._conn:
+                self.check_inventory()
+
+    def _refresh_domain(self, dom):
+        """Re-reads one domain into the cache with a single domainListGetStats RPC."""
+        if self._conn is None:
+            return
+        try:
+            records = self._conn.domainListGetStats([dom], self.INVENTORY_STATS, 0)
+        except libvirt.libvirtError as e:
+            if e.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN:
+                self.inventory.remove(dom.UUIDString())
+            else:
+                print(f"Error refreshing domain '{dom.name()}': {e}", file=sys.stderr)
+            return
+        for record_dom, data in records:
+            self.inventory.update(record_dom, self._summarize_domain_stats(record_dom, data))
+
+    # Callbacks below run on the libvirt event loop thread (or the event worker, see _dispatch)
+    # Lifecycle events after which the (live) domain XML differs
+    XML_CHANGING_EVENTS = (libvirt.VIR_DOMAIN_EVENT_DEFINED, libvirt.VIR_DOMAIN_EVENT_UNDEFINED,
+                           libvirt.VIR_DOMAIN_EVENT_STARTED, libvirt.VIR_DOMAIN_EVENT_STOPPED)
+
+    def _on_lifecycle_event(self, conn, dom, event, detail, opaque):
+        if event in self.XML_CHANGING_EVENTS:
+            self.domain_xml.invalidate(dom.UUIDString())
+        if event == libvirt.VIR_DOMAIN_EVENT_UNDEFINED:
+            self.inventory.remove(dom.UUIDString())
+            self.snapshots.invalidate(dom.UUIDString())
+        else:
+            self._refresh_domain(dom)
+        self._mark_search_dirty(dom)
+
+    def _mark_search_dirty(self, dom):
+        if self._indexer is not None:
+            self._indexer.mark_dirty(dom.UUIDString())
+
+    def _on_domain_changed(self, conn, dom, opaque):
+        self._refresh_domain(dom)
+
+    def _on_device_event(self, conn, dom, dev_alias, opaque):
+        self.domain_xml.invalidate(dom.UUIDString())
+        self._refresh_domain(dom)
+        self._mark_search_dirty(dom)
+
+    def _on_storage_pool_lifecycle(self, conn, pool, event, detail, opaque):
+        if event == libvirt.VIR_STORAGE_POOL_EVENT_UNDEFINED:
+            self.storage.drop_pool(pool.name())
+        elif self.storage.is_loaded():
+            self.storage.refresh_pool(pool)
+
+    def _on_storage_pool_refresh(self, conn, pool, opaque):
+        # pool.refresh() rescans the pool, so allocations may have changed everywhere
+        if self.storage.is_loaded():
+            self.storage.refresh_pool(pool, full=True)
+
+    def _on_connection_closed(self, conn, reason, opaque):
+        print(f"Libvirt connection to '{self.uri}' closed (reason {reason}).", file=sys.stderr)
+        self.inventory.invalidate()
+
     # --- Tambahan untuk mendapatkan detail VM ---
-    def get_vm_details(self, vm_name):
+    def get_domain_model(self, vm_name):
         """
-        Gets detailed information about a VM.
-        Returns a dictionary or None.
+        Returns (DomainModel, autostart) for a VM, parsed from XMLDesc once and then
+        served from the per-UUID cache until an event invalidates it.
+        Returns (None, None) if the VM is unknown or its XML can't be read.
         """
+        vm = self.find_vm(vm_name)
+        if vm is None:
+            return None, None
+        # Without event tracking nothing would invalidate the entry, so always re-read
+        cached = self.domain_xml.get(vm['uuid']) if self.inventory.is_ready() else None
+        if cached is not None:
+            return cached
         domain = self.get_domain_by_name(vm_name)
         if not domain:
+            return None, None
+        try:
+            model = parse_domain_xml(domain.XMLDesc(0))
+            autostart = bool(domain.autostart())
+        except (libvirt.libvirtError, ET.ParseError) as e:
+            print(f"Error reading XML of VM '{vm_name}': {e}", file=sys.stderr)
+            return None, None
+        if self.inventory.is_ready():
+            self.domain_xml.put(vm['uuid'], model, autostart)
+        return model, autostart
+
+    def get_vm_details(self, vm_name):
+        """
+        Gets detailed information about a VM.
+        Returns a dictionary or None. Served from the inventory and XML caches,
+        so repeated calls make no RPCs until the domain changes. 'guest' holds
+        the guest agent collector's cached data, or None; it is never fetched here.
+        """
+        vm = self.find_vm(vm_name)
+        if vm is None:
             return None
-        
-        details = {
-            'name': domain.name(),
-            'uuid': domain.UUIDString(),
-            'id': domain.ID() if domain.ID() != -1 else None, # -1 for inactive
-            'memory_kb': domain.info().memory,
-            'max_memory_kb': domain.info().maxMem,
-            'vcpu': domain.info().nrVirtCpu,
-            'os_type': domain.OSType(),
-            'state': self._get_vm_state_string(domain.info().state),
-            'autostart': domain.autostart(),
-            'devices': [] # This would require parsing XML for disks, nics, etc.
-        }
+        model, autostart = self.get_domain_model(vm_name)
+        if model is None:
+            return None
+        guest = None
+        if self.guest_agent is not None and model.guest_agent:
+            guest = self.guest_agent.get(vm['uuid'])
+            if guest is None:
+                self.guest_agent.request(vm['uuid']) # Someone is looking: poll it soon
 
-        # Parse XML for more details (disks, networks, etc.) - this is more complex
-        # xml_desc = domain.XMLDesc(0)
-        # You'd use an XML parser (e.g., xml.etree.ElementTree) here
-        
-        return details
+        return {
+            'name': vm['name'],
+            'uuid': vm['uuid'],
+            'id': vm['id'],
+            'memory_kb': vm['memory_kb'],
+            'max_memory_kb': vm['max_memory_kb'],
+            'vcpu': vm['vcpu'],
+            'os_type': model.os_type,
+            'arch': model.arch,
+            'machine': model.machine,
+            'state': vm['state'],
+            'autostart': autostart,
+            'cpu_mode': model.cpu_mode,
+            'vcpupins': [pin.to_dict() for pin in model.vcpupins],
+            'emulatorpin': model.emulatorpin,
+            'numatune': {'mode': model.numa_mode, 'nodeset': model.numa_nodeset} if model.numa_nodeset else None,
+            'memory_backing': model.memory_backing.to_dict() if model.memory_backing else None,
+            'tags': list(model.tags),
+            'devices': {
+                'disks': [disk.to_dict() for disk in model.disks],
+                'interfaces': [iface.to_dict() for iface in model.interfaces],
+                'graphics': [graphics.to_dict() for graphics in model.graphics],
+            },
+            'guest_agent': model.guest_agent,
+            'guest': guest,
+        }
 
     def _get_vm_state_string(self, state_code):
         """Helper to convert libvirt state code to readable string."""
@@ -0,0 +1,241 @@
+# app/core/metrics_sampler.py
+
+import queue
+import sys
+import threading
+import time
+
+try:
+    import psutil
+except ImportError: # Host metrics are optional
+    psutil = None
+
+class Subscription:
+    """
+    A subscriber's bounded message queue. If the subscriber falls behind, old
+    messages are dropped and the next message it gets is a full snapshot.
+    `notify`, if given, is called on the sampler thread after each message is
+    queued, so consumers that cannot block in get() (asyncio) know to drain it.
+    """
+
+    def __init__(self, sampler, maxsize=16, notify=None):
+        self._sampler = sampler
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._notify = notify
+        self.needs_snapshot = True
+
+    def get(self, timeout=None):
+        """Returns the next message, or None if nothing arrived within `timeout`."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._sampler.unsubscribe(self)
+
+    def _put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            # Slow consumer: throw away the backlog and resend everything next tick
+            with self._queue.mutex:
+                self._queue.queue.clear()
+            self.needs_snapshot = True
+            return
+        if self._notify is not None:
+            self._notify()
+
+
+class MetricsSampler:
+    """
+    Samples per-domain stats on a fixed tick with one bulk RPC, turns cumulative
+    counters into rates (CPU %, bytes/s) and pushes only the values that changed
+    to every subscriber. However many subscribers there are, libvirt sees one
+    sampler. The sampler runs only while it has subscribers or listeners.
+    """
+
+    def __init__(self, libvirt_manager, interval=2.0):
+        self.libvirt_manager = libvirt_manager
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._listeners = []
+        self._thread = None
+        self._stop = None
+        self._previous = {}   # uuid -> (timestamp, counters) from the last tick
+        self._current = {}    # uuid -> last published values
+        self._host = {}
+
+    def subscribe(self, maxsize=16, notify=None):
+        """Registers a subscriber and starts sampling if needed. Returns a Subscription."""
+        subscription = Subscription(self, maxsize, notify)
+        with self._lock:
+            self._subscribers.add(subscription)
+            self._ensure_running()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+            self._stop_if_idle()
+
+    def add_listener(self, callback):
+        """
+        Registers callback(timestamp, samples) called on the sampler thread every
+        tick with the full {uuid: values} map (e.g. for history storage).
+        Adding the same callback again has no effect.
+        """
+        with self._lock:
+            if callback not in self._listeners:
+                self._listeners.append(callback)
+            self._ensure_running()
+
+    def remove_listener(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+            self._stop_if_idle()
+
+    def snapshot(self):
+        """Returns the latest full sample as a message."""
+        with self._lock:
+            return self._message('snapshot', time.time(), dict(self._current), [], self._host)
+
+    def _ensure_running(self):
+        """Starts the sampler thread. Caller holds the lock."""
+        if self._thread is None:
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,),
+                                            name='metrics-sampler', daemon=True)
+            self._thread.start()
+
+    def _stop_if_idle(self):
+        """Stops the sampler thread when nobody is listening. Caller holds the lock."""
+        if self._thread is not None and not self._subscribers and not self._listeners:
+            self._stop.set()
+            self._thread = None
+            self._previous = {}
+
+    def _run(self, stop):
+        next_tick = time.monotonic()
+        while not stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Metrics sampler error: {e}", file=sys.stderr)
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay < 0: # Sampling took longer than a tick; don't try to catch up
+                next_tick = time.monotonic()
+                delay = 0
+            stop.wait(delay)
+
+    def tick(self):
+        """Takes one sample and publishes the changes. Returns the number of domains sampled."""
+        with self.libvirt_manager.connection():
+            summaries = self.libvirt_manager.sample_vm_stats()
+        if summaries is None:
+            return 0
+        now = time.monotonic()
+        timestamp = time.time()
+        host = self._sample_host()
+
+        samples = {}
+        previous = {}
+        for vm in summaries:
+            counters = self._counters(vm)
+            values = {
+                'name': vm['name'],
+                'state': vm['state'],
+                'vcpu': vm['vcpu'],
+                'memory_kb': vm['memory_kb'],
+            }
+            values.update(self._rates(self._previous.get(vm['uuid']), now, counters, vm['vcpu']))
+            samples[vm['uuid']] = values
+            previous[vm['uuid']] = (now, counters)
+
+        with self._lock:
+            self._previous = previous
+            changed = {}
+            for uuid, values in samples.items():
+                old = self._current.get(uuid, {})
+                delta = {k: v for k, v in values.items() if old.get(k) != v}
+                if delta:
+                    changed[uuid] = delta
+            removed = [uuid for uuid in self._current if uuid not in samples]
+            host_changed = host != self._host
+            self._current = samples
+            self._host = host
+            subscribers = list(self._subscribers)
+            listeners = list(self._listeners)
+
+        if changed or removed or host_changed:
+            delta_message = self._message('delta', timestamp, changed, removed, host if host_changed else None)
+        else:
+            delta_message = None
+        snapshot_message = None
+        for subscription in subscribers:
+            if subscription.needs_snapshot:
+                if snapshot_message is None:
+                    snapshot_message = self._message('snapshot', timestamp, samples, [], host)
+                subscription.needs_snapshot = False
+                subscription._put(snapshot_message)
+            elif delta_message is not None:
+                subscription._put(delta_message)
+
+        for callback in listeners:
+            try:
+                callback(timestamp, samples)
+            except Exception as e:
+                print(f"Metrics listener error: {e}", file=sys.stderr)
+        return len(samples)
+
+    @staticmethod
+    def _message(kind, timestamp, vms, removed, host):
+        message = {'type': kind, 'ts': timestamp, 'vms': vms, 'removed': removed}
+        if host is not None:
+            message['host'] = host
+        return message
+
+    @staticmethod
+    def _counters(vm):
+        return {
+            'cpu_time_ns': vm.get('cpu_time_ns') or 0,
+            'net_rx': sum(n['rx_bytes'] for n in vm['net']),
+            'net_tx': sum(n['tx_bytes'] for n in vm['net']),
+            'disk_rd': sum(b['rd_bytes'] for b in vm['block']),
+            'disk_wr': sum(b['wr_bytes'] for b in vm['block']),
+        }
+
+    @staticmethod
+    def _rates(previous, now, counters, vcpus):
+        """Computes CPU % and bytes/s from two consecutive counter samples."""
+        rates = {'cpu_percent': 0.0, 'net_rx_bps': 0, 'net_tx_bps': 0, 'disk_rd_bps': 0, 'disk_wr_bps': 0}
+        if previous is None:
+            return rates
+        then, old = previous
+        elapsed = now - then
+        if elapsed <= 0:
+            return rates
+
+        def rate(key):
+            # Counters reset when a domain restarts; treat a negative delta as zero
+            return max(0, counters[key] - old[key]) / elapsed
+
+        cpu = rate('cpu_time_ns') / 1e9 / max(1, vcpus) * 100
+        rates['cpu_percent'] = round(min(cpu, 100.0), 1)
+        rates['net_rx_bps'] = int(rate('net_rx'))
+        rates['net_tx_bps'] = int(rate('net_tx'))
+        rates['disk_rd_bps'] = int(rate('disk_rd'))
+        rates['disk_wr_bps'] = int(rate('disk_wr'))
+        return rates
+
+    @staticmethod
+    def _sample_host():
+        if psutil is None:
+            return {}
+        return {
+            'cpu_percent': psutil.cpu_percent(interval=None),
+            'memory_percent': psutil.virtual_memory().percent,
+        }
@@ -0,0 +1,356 @@
+# app/core/migration.py
+
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import libvirt
+
+from app.core.scheduler import HostState, SchedulingError
+
+
+class MigrationError(Exception):
+    """A migration couldn't be started or didn't complete."""
+
+
+class Migration:
+    """One migration, as tracked by the engine while it runs and reported afterwards."""
+
+    __slots__ = ('vm', 'source', 'dest', 'status', 'requested_mib', 'bandwidth_mib', 'progress',
+                 'postcopy', 'stats', 'error', 'started_at', 'finished_at', 'domain')
+
+    WAITING = 'waiting'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    def __init__(self, vm, source, dest, requested_mib=None):
+        self.vm = vm
+        self.source = source
+        self.dest = dest
+        self.status = Migration.WAITING
+        self.requested_mib = requested_mib  # Caller's own cap, MiB/s
+        self.bandwidth_mib = None           # Cap currently applied with migrateSetMaxSpeed
+        self.progress = 0
+        self.postcopy = False
+        self.stats = {}
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.domain = None
+
+    def to_dict(self):
+        return {
+            'vm': self.vm,
+            'source': self.source,
+            'dest': self.dest,
+            'status': self.status,
+            'bandwidth_mib': self.bandwidth_mib,
+            'progress': self.progress,
+            'postcopy': self.postcopy,
+            'stats': self.stats,
+            'error': self.error,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+# jobStats keys worth reporting (bytes, ms, pages/s)
+_STATS_KEYS = ('time_elapsed', 'data_total', 'data_processed', 'data_remaining',
+               'memory_remaining', 'memory_iteration', 'memory_dirty_rate', 'memory_bps', 'downtime')
+
+
+class MigrationEngine:
+    """
+    Live migration between fleet hosts with migrateToURI3 (peer-to-peer: the
+    source libvirtd connects to the destination URI itself).
+
+    At most `max_per_host` migrations touch a host at once, counting both
+    directions; a migration waits until its source and destination both have
+    a free slot and takes the two together, so opposite migrations can't
+    deadlock. Each host may have a network budget in MiB/s, shared evenly by
+    the migrations using it: whenever one starts or finishes, the others are
+    re-capped with migrateSetMaxSpeed, so a drain never exceeds the link and
+    the last migrations speed up as the first ones finish.
+
+    Progress comes from polling jobStats() on the source domain. With
+    postcopy=True the migration starts in pre-copy and is switched to
+    post-copy (migrateStartPostCopy) once pre-copy stops converging.
+    """
+
+    POLL_INTERVAL = 1.0
+    # Pre-copy passes over guest memory before post-copy takes over
+    POSTCOPY_AFTER_ITERATIONS = 3
+
+    def __init__(self, fleet, max_per_host=2, host_bandwidth_mib=None):
+        self.fleet = fleet
+        self.max_per_host = max(1, int(max_per_host))
+        self.host_bandwidth_mib = host_bandwidth_mib  # Default budget per host; None = unlimited
+        self._bandwidth = {}   # host -> budget overriding the default
+        self._cond = threading.Condition()
+        self._speed_lock = threading.Lock()  # Orders migrateSetMaxSpeed calls so the latest share wins
+        self._active = {}      # host -> [Migration] holding a slot on it
+        self._history = []     # finished migrations, newest last
+        self.draining = set()  # hosts being evacuated; the scheduler should skip them
+
+    # --- Limits ---
+    def set_host_bandwidth(self, host, mib):
+        """Sets (or with None clears) a host's migration budget in MiB/s."""
+        with self._cond:
+            if mib is None:
+                self._bandwidth.pop(host, None)
+            else:
+                self._bandwidth[host] = max(1, int(mib))
+            changed = [m for m in self._active.get(host, ())]
+        self._apply_speeds(changed)
+
+    def _budget(self, host):
+        return self._bandwidth.get(host, self.host_bandwidth_mib)
+
+    def _speed_locked(self, migration):
+        """Fair share of the tighter of the two hosts' budgets, capped by the request."""
+        caps = [self._budget(h) / len(self._active[h])
+                for h in (migration.source, migration.dest) if self._budget(h)]
+        if migration.requested_mib:
+            caps.append(migration.requested_mib)
+        return max(1, int(min(caps))) if caps else None
+
+    def _acquire(self, migration, timeout=None):
+        """Takes a slot on both hosts. Returns the migrations now sharing them, or None on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        hosts = (migration.source, migration.dest)
+        with self._cond:
+            while any(len(self._active.get(h, ())) >= self.max_per_host for h in hosts):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            for h in hosts:
+                self._active.setdefault(h, []).append(migration)
+            return self._neighbours_locked(migration)
+
+    def _release(self, migration):
+        with self._cond:
+            for h in (migration.source, migration.dest):
+                active = self._active.get(h, [])
+                if migration in active:
+                    active.remove(migration)
+                if not active:
+                    self._active.pop(h, None)
+            self._history.append(migration)
+            del self._history[:-200]
+            neighbours = self._neighbours_locked(migration)
+            self._cond.notify_all()
+        self._apply_speeds(neighbours)
+
+    def _neighbours_locked(self, migration):
+        seen = []
+        for h in (migration.source, migration.dest):
+            for m in self._active.get(h, ()):
+                if m is not migration and m not in seen:
+                    seen.append(m)
+        return seen
+
+    def _apply_speeds(self, migrations):
+        """(Re-)caps migrations after the set sharing their hosts changed."""
+        with self._speed_lock:
+            for migration in migrations:
+                with self._cond:
+                    domain = migration.domain
+                    if domain is None or migration not in self._active.get(migration.source, ()):
+                        continue
+                    speed = self._speed_locked(migration)
+                if speed is None or speed == migration.bandwidth_mib:
+                    continue
+                try:
+                    domain.migrateSetMaxSpeed(speed, 0)
+                    migration.bandwidth_mib = speed
+                except libvirt.libvirtError as e:
+                    print(f"Error setting migration speed of '{migration.vm}': {e}", file=sys.stderr)
+
+    # --- Migrations ---
+    def active(self):
+        with self._cond:
+            seen = []
+            for migrations in self._active.values():
+                seen.extend(m for m in migrations if m not in seen)
+            return [m.to_dict() for m in seen]
+
+    def history(self, limit=50):
+        with self._cond:
+            return [m.to_dict() for m in reversed(self._history[-limit:])]
+
+    def migrate(self, vm_name, source, dest, live=True, auto_converge=False, postcopy=False,
+                compressed=False, bandwidth_mib=None, max_downtime_ms=None, dest_uri=None,
+                wait_timeout=None, job=None):
+        """
+        Migrates `vm_name` from fleet host `source` to `dest` and blocks until it is done.
+        The domain is defined on the destination and undefined on the source.
+        `dest_uri` overrides the destination's fleet URI, which must be reachable
+        from the source host (e.g. qemu+ssh://node2/system rather than qemu:///system).
+        Returns the Migration as a dict; raises MigrationError on failure.
+        """
+        src, dst = self.fleet.get_manager(source), self.fleet.get_manager(dest)
+        if src is None or dst is None:
+            raise MigrationError(f"Unknown host '{source if src is None else dest}'")
+        if source == dest:
+            raise MigrationError("Source and destination are the same host")
+
+        migration = Migration(vm_name, source, dest, bandwidth_mib)
+        if job is not None:
+            job.set_progress(0, f"Waiting for a migration slot on {source} and {dest}")
+        neighbours = self._acquire(migration, wait_timeout)
+        if neighbours is None:
+            raise MigrationError(f"No migration slot on {source}/{dest} within {wait_timeout}s")
+        try:
+            migration.status = Migration.RUNNING
+            migration.started_at = time.time()
+            self._run(migration, src, dest_uri or dst.uri, live, auto_converge, postcopy,
+                      compressed, max_downtime_ms, job, neighbours)
+            migration.status = Migration.SUCCEEDED
+            migration.progress = 100
+        except (libvirt.libvirtError, MigrationError) as e:
+            migration.status = Migration.FAILED
+            migration.error = str(e)
+            print(f"Migration of '{vm_name}' from {source} to {dest} failed: {e}", file=sys.stderr)
+        finally:
+            migration.finished_at = time.time()
+            with self._cond:
+                migration.domain = None
+            self._release(migration)
+        if migration.status == Migration.FAILED:
+            raise MigrationError(migration.error)
+        if job is not None:
+            job.message = f"VM '{vm_name}' migrated from {source} to {dest}."
+        return migration.to_dict()
+
+    def _run(self, migration, src, dest_uri, live, auto_converge, postcopy, compressed,
+             max_downtime_ms, job, neighbours):
+        if not src.is_connected() and not src.connect():
+            raise MigrationError(f"Cannot connect to {src.uri}")
+        domain = src.get_domain_by_name(migration.vm)
+        if domain is None:
+            raise MigrationError(f"VM '{migration.vm}' not found on {migration.source}")
+
+        flags = (libvirt.VIR_MIGRATE_PEER2PEER | libvirt.VIR_MIGRATE_PERSIST_DEST |
+                 libvirt.VIR_MIGRATE_UNDEFINE_SOURCE)
+        if live:
+            flags |= libvirt.VIR_MIGRATE_LIVE
+        if auto_converge:
+            flags |= libvirt.VIR_MIGRATE_AUTO_CONVERGE
+        if postcopy:
+            flags |= libvirt.VIR_MIGRATE_POSTCOPY
+        if compressed:
+            flags |= libvirt.VIR_MIGRATE_COMPRESSED
+        if max_downtime_ms:
+            domain.migrateSetMaxDowntime(int(max_downtime_ms), 0)
+        with self._cond:
+            migration.domain = domain
+        # Cap this migration before it sends anything; its arrival also shrank
+        # the share of everyone on the same hosts
+        self._apply_speeds([migration] + neighbours)
+
+        outcome = {}
+
+        def run():
+            try:
+                domain.migrateToURI3(dest_uri, {}, flags)
+            except libvirt.libvirtError as e:
+                outcome['error'] = e
+
+        thread = threading.Thread(target=run, name=f"migrate-{migration.vm}", daemon=True)
+        thread.start()
+        while True:
+            thread.join(self.POLL_INTERVAL)
+            if not thread.is_alive():
+                break
+            self._poll(migration, domain, postcopy, job)
+        if 'error' in outcome:
+            raise outcome['error']
+
+    def _poll(self, migration, domain, postcopy, job):
+        try:
+            stats = domain.jobStats(0)
+        except libvirt.libvirtError:
+            return # Job not started yet or just finished
+        if not stats or stats.get('type', libvirt.VIR_DOMAIN_JOB_NONE) == libvirt.VIR_DOMAIN_JOB_NONE:
+            return
+        migration.stats = {key: stats[key] for key in _STATS_KEYS if key in stats}
+        total = stats.get('data_total') or 0
+        if total:
+            # Dirty pages get resent, so processed can exceed total; 100 is set on completion
+            migration.progress = min(99, int(stats.get('data_processed', 0) * 100 / total))
+        if (postcopy and not migration.postcopy
+                and stats.get('memory_iteration', 0) >= self.POSTCOPY_AFTER_ITERATIONS):
+            try:
+                domain.migrateStartPostCopy(0)
+                migration.postcopy = True
+            except libvirt.libvirtError as e:
+                print(f"Error switching '{migration.vm}' to post-copy: {e}", file=sys.stderr)
+        if job is not None:
+            remaining = (stats.get('data_remaining') or 0) // (1024 * 1024)
+            job.set_progress(migration.progress,
+                             f"{migration.vm}: {remaining} MiB left"
+                             + (" (post-copy)" if migration.postcopy else ""))
+
+    def drain(self, source, scheduler, dests=None, policy='spread', parallel=None, job=None, **options):
+        """
+        Evacuates every running VM from `source`. Destinations are chosen by
+        `scheduler` (a PlacementScheduler) from the other hosts, or `dests`;
+        migrations run in parallel within the per-host slot and bandwidth limits.
+        Returns {'source', 'migrated': [{'vm', 'dest'}], 'failed': [{'vm', 'dest', 'error'}]};
+        raises MigrationError if nothing could be moved.
+        """
+        manager = self.fleet.get_manager(source)
+        if manager is None:
+            raise MigrationError(f"Unknown host '{source}'")
+        vms = [vm for vm in (manager.list_vms() or []) if vm['id'] is not None]
+        targets = [h for h in (dests or self.fleet.hosts()) if h != source and h not in self.draining]
+        if not vms:
+            return {'source': source, 'migrated': [], 'failed': []}
+        if not targets:
+            raise MigrationError("No destination hosts available")
+
+        self.draining.add(source)
+        try:
+            results = self.fleet.fan_out(lambda m: HostState.collect(m.uri, m), targets)
+            states = []
+            for name in sorted(results):
+                if results[name].ok:
+                    results[name].value.name = name
+                    states.append(results[name].value)
+
+            # Largest VMs first, while the most room is left
+            vms.sort(key=lambda vm: (vm['max_memory_kb'] or vm['memory_kb'] or 0), reverse=True)
+            plan, failed = [], []
+            for vm in vms:
+                memory_mb = (vm['max_memory_kb'] or vm['memory_kb'] or 0) // 1024
+                try:
+                    placement = scheduler.place(vm['vcpu'] or 1, memory_mb, states, policy)
+                    plan.append((vm['name'], placement.host))
+                except SchedulingError as e:
+                    failed.append({'vm': vm['name'], 'dest': None, 'error': str(e)})
+
+            migrated = []
+            workers = max(1, min(parallel or self.max_per_host, len(plan) or 1))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='drain') as executor:
+                futures = {executor.submit(self.migrate, name, source, dest, **options): (name, dest)
+                           for name, dest in plan}
+                for future in as_completed(futures):
+                    name, dest = futures[future]
+                    try:
+                        future.result()
+                        migrated.append({'vm': name, 'dest': dest})
+                    except MigrationError as e:
+                        failed.append({'vm': name, 'dest': dest, 'error': str(e)})
+                    if job is not None:
+                        done = len(migrated) + len(failed)
+                        job.set_progress(done * 100 / len(vms),
+                                         f"{done}/{len(vms)} processed, {len(failed)} failed")
+        finally:
+            self.draining.discard(source)
+
+        if not migrated and failed:
+            raise MigrationError(f"No VM left {source}; first error: {failed[0]['error']}")
+        return {'source': source, 'migrated': sorted(migrated, key=lambda m: m['vm']), 'failed': failed}
@@ -0,0 +1,255 @@
+# app/core/provisioning.py
+
+import contextvars
+import sys
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from xml.sax.saxutils import escape
+
+import libvirt
+
+_ATTR_ENTITIES = {"'": "&apos;", '"': "&quot;"}
+
+
+class ProvisioningError(Exception):
+    """Raised when a provisioning request can't be planned (bad pool, base image, names)."""
+
+
+class ProvisioningPipeline:
+    """
+    Creates many VMs from one VMProfile: backing volumes through
+    storageVolCreateXML (qcow2 overlays on a shared base image by default, full
+    copies with createXMLFrom on request, blank volumes without a base), then
+    defineXML and optionally create(). Each VM runs its stages on a worker of a
+    bounded pool, so volume creation, defines and starts of different VMs
+    overlap. A VM that fails at any stage is rolled back: started domains are
+    destroyed, defined ones undefined, created volumes deleted. clone() works
+    the same way for copies of an existing domain.
+
+    All RPCs go through the connection given to run(); libvirt connections are
+    safe to share between threads.
+    """
+
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+
+    def run(self, conn, profile, names, pool_name='default', base_image=None, full_copy=False,
+            disk_size_gb=10, start=False, concurrency=None, job=None, metadata='',
+            render_args=None):
+        """
+        Provisions one VM per name. Returns {'requested', 'succeeded': [names],
+        'failed': [{'name', 'stage', 'error'}]}. Raises ProvisioningError if the
+        request can't be planned, or if every VM failed. `metadata` is an XML
+        fragment added to every domain (see domain_builder.metadata_xml);
+        `render_args` maps a name to extra VMProfile.render() arguments (e.g. the
+        tuning/cpuset of a scheduler Placement).
+        """
+        plan = self._plan(conn, pool_name, base_image, disk_size_gb)
+
+        def provision(name):
+            return self._provision_one(conn, profile, plan, name, full_copy, start, metadata,
+                                       (render_args or {}).get(name))
+
+        return self._run_all(names, provision, concurrency, job)
+
+    def _run_all(self, names, func, concurrency, job):
+        """Runs func(name) for every name on the worker pool and collects the outcomes."""
+        total = len(names)
+        done = [0]
+        lock = threading.Lock()
+        succeeded, failed = [], []
+
+        workers = max(1, min(concurrency or self.max_workers, self.max_workers, total))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='provision') as executor:
+            # Each worker runs in a copy of the caller's context (trace, request)
+            futures = {executor.submit(contextvars.copy_context().run, func, name): name for name in names}
+            for future in as_completed(futures):
+                name = futures[future]
+                error = future.result()
+                with lock:
+                    if error is None:
+                        succeeded.append(name)
+                    else:
+                        failed.append({'name': name, 'stage': error[0], 'error': error[1]})
+                    done[0] += 1
+                    if job is not None:
+                        job.set_progress(done[0] * 100 / total,
+                                         f"{done[0]}/{total} processed, {len(failed)} failed")
+
+        result = {'requested': total, 'succeeded': sorted(succeeded), 'failed': failed}
+        if total and not succeeded:
+            raise ProvisioningError(f"All {total} VMs failed; first error: {failed[0]['error']}")
+        return result
+
+    def clone(self, conn, template, names, full_copy=False, start=False, concurrency=None, job=None,
+              plans=None):
+        """
+        Clones the domain behind `template` (a CloneTemplate) once per name: a
+        qcow2 overlay backed by each source disk (linked clone, created in the
+        source disk's pool) or a full copy with createXMLFrom, then defineXML
+        with a fresh UUID and MACs. Runs on the same worker pool and rollback
+        as run(); returns the same result dict and raises ProvisioningError
+        when the source disks can't be resolved or every clone failed.
+        `plans` are the clone_plans() of the template if already looked up.
+        """
+        plans = plans if plans is not None else self.clone_plans(conn, template)
+        taken_macs = set()
+        identities = {name: template.identity(taken_macs) for name in names}
+
+        def clone_one(name):
+            return self._clone_one(conn, template, plans, name, identities[name], full_copy, start)
+
+        return self._run_all(names, clone_one, concurrency, job)
+
+    def clone_plans(self, conn, template):
+        """One plan per cloned disk: its volume, pool, format and capacity."""
+        plans = []
+        for disk in template.disks:
+            try:
+                vol = conn.storageVolLookupByPath(disk['path'])
+                root = ET.fromstring(vol.XMLDesc(0))
+                pool = vol.storagePoolLookupByVolume()
+            except (libvirt.libvirtError, ET.ParseError) as e:
+                raise ProvisioningError(f"Disk {disk['target']} ({disk['path']}) is not a storage volume: {e}")
+            fmt = root.find('./target/format')
+            plans.append({'pool': pool, 'base': vol, 'base_path': disk['path'],
+                          'base_format': fmt.get('type') if fmt is not None else disk['format'],
+                          'capacity': int(root.findtext('./capacity') or 0)})
+        return plans
+
+    def _clone_one(self, conn, template, plans, name, identity, full_copy, start):
+        """Creates one clone's volumes and domain. Returns None on success or (stage, error message)."""
+        volumes = []
+        domain = None
+        stage = 'volume'
+        try:
+            paths, formats = [], []
+            for disk, plan in zip(template.disks, plans):
+                # A full copy keeps the source format; a linked clone is always a qcow2 overlay
+                fmt = plan['base_format'] if full_copy else 'qcow2'
+                vol = self.create_volume(plan, f"{name}-{disk['target']}", {'format': fmt},
+                                         plan['base'], full_copy)
+                volumes.append(vol)
+                paths.append(vol.path())
+                formats.append(fmt)
+
+            stage = 'define'
+            uuid, macs = identity
+            xml = template.render(name, paths, uuid, macs, formats)
+            domain = conn.defineXML(xml)
+
+            if start:
+                stage = 'start'
+                domain.create()
+            return None
+        except (libvirt.libvirtError, ValueError) as e:
+            print(f"Cloning '{name}' failed at {stage}: {e}", file=sys.stderr)
+            self.rollback(name, domain, volumes)
+            return stage, str(e)
+
+    def _plan(self, conn, pool_name, base_image, disk_size_gb):
+        """Looks up the pool and base image once for the whole batch."""
+        try:
+            pool = conn.storagePoolLookupByName(pool_name)
+        except libvirt.libvirtError as e:
+            raise ProvisioningError(f"Storage pool '{pool_name}' not found: {e}")
+        plan = {'pool': pool, 'base': None, 'base_path': None, 'base_format': None,
+                'capacity': int(disk_size_gb) * 1024 ** 3}
+        if base_image:
+            try:
+                if base_image.startswith('/'):
+                    base = conn.storageVolLookupByPath(base_image)
+                else:
+                    base = pool.storageVolLookupByName(base_image)
+                root = ET.fromstring(base.XMLDesc(0))
+            except (libvirt.libvirtError, ET.ParseError) as e:
+                raise ProvisioningError(f"Base image '{base_image}' not found: {e}")
+            fmt = root.find('./target/format')
+            plan['base'] = base
+            plan['base_path'] = root.findtext('./target/path') or base.path()
+            plan['base_format'] = fmt.get('type') if fmt is not None else 'raw'
+            plan['capacity'] = max(plan['capacity'], int(root.findtext('./capacity') or 0))
+        return plan
+
+    def freeze_source(self, conn, template, plans, stamp):
+        """
+        Moves the source domain of `template` onto fresh qcow2 overlays of its
+        disks (named <source>-<target>-<stamp>), so its current images become
+        read-only bases for linked clones. Rolls the overlays back and re-raises
+        libvirtError on failure.
+        """
+        volumes = []
+        try:
+            for disk, plan in zip(template.disks, plans):
+                volumes.append(self.create_volume(
+                    plan, f"{template.source_name}-{disk['target']}-{stamp}", {'format': 'qcow2'},
+                    plan['base'], False))
+            conn.defineXML(template.render(template.source_name, [vol.path() for vol in volumes]))
+        except libvirt.libvirtError:
+            self.rollback(template.source_name, None, volumes)
+            raise
+
+    def _provision_one(self, conn, profile, plan, name, full_copy, start, metadata='', extra=None):
+        """Runs all stages for one VM. Returns None on success or (stage, error message)."""
+        volumes = []
+        domain = None
+        stage = 'volume'
+        try:
+            paths = []
+            for index, disk in enumerate(profile.disks):
+                # Only the boot disk is built from the base image; extra disks start empty
+                base = plan['base'] if index == 0 else None
+                vol = self.create_volume(plan, f"{name}-disk{index}", disk, base, full_copy)
+                volumes.append(vol)
+                paths.append(vol.path())
+
+            stage = 'define'
+            domain = conn.defineXML(profile.render(name, disk_paths=paths, metadata=metadata, **(extra or {})))
+
+            if start:
+                stage = 'start'
+                domain.create()
+            return None
+        except (libvirt.libvirtError, ValueError) as e:
+            print(f"Provisioning '{name}' failed at {stage}: {e}", file=sys.stderr)
+            self.rollback(name, domain, volumes)
+            return stage, str(e)
+
+    def create_volume(self, plan, vol_name, disk, base, full_copy):
+        """
+        Creates one volume in plan['pool']: an overlay on `base`, a full copy of
+        it (full_copy) or, without a base, a blank one. Returns the virStorageVol.
+        """
+        fmt = disk.get('format', 'qcow2')
+        vol_name = f"{vol_name}.{'qcow2' if fmt == 'qcow2' else 'img'}"
+        capacity = plan['capacity']
+        if base is None and disk.get('size_gb'):
+            capacity = int(disk['size_gb']) * 1024 ** 3
+        xml = (f"<volume><name>{escape(vol_name)}</name>"
+               f"<capacity unit='bytes'>{capacity}</capacity>"
+               f"<target><format type='{escape(fmt, _ATTR_ENTITIES)}'/></target>")
+        if base is not None and not full_copy:
+            # Copy-on-write overlay: only blocks the guest writes are stored
+            xml += (f"<backingStore><path>{escape(plan['base_path'])}</path>"
+                    f"<format type='{escape(plan['base_format'], _ATTR_ENTITIES)}'/></backingStore>")
+        xml += "</volume>"
+        if base is not None and full_copy:
+            return plan['pool'].createXMLFrom(xml, base, 0)
+        return plan['pool'].createXML(xml, 0)
+
+    @staticmethod
+    def rollback(name, domain, volumes):
+        """Best-effort cleanup after a failed VM: destroys and undefines `domain`, deletes `volumes`."""
+        if domain is not None:
+            try:
+                if domain.isActive():
+                    domain.destroy()
+                domain.undefine()
+            except libvirt.libvirtError as e:
+                print(f"Rollback of domain '{name}' failed: {e}", file=sys.stderr)
+        for vol in volumes:
+            try:
+                vol.delete(0)
+            except libvirt.libvirtError as e:
+                print(f"Rollback of volume for '{name}' failed: {e}", file=sys.stderr)
@@ -0,0 +1,282 @@
+# app/core/scheduler.py
+
+import sys
+import threading
+import xml.etree.ElementTree as ET
+
+import libvirt
+
+from app.core.domain_xml import _to_kib
+
+POLICIES = ('binpack', 'spread')
+
+
+class SchedulingError(Exception):
+    """No host/cell can take the requested VM."""
+
+
+def parse_cpuset(text):
+    """'0-3,8,10-11' -> {0, 1, 2, 3, 8, 10, 11}. '^n' exclusions are honoured."""
+    ids, excluded = set(), set()
+    for part in (text or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        target = excluded if part.startswith('^') else ids
+        part = part.lstrip('^')
+        if '-' in part:
+            lo, hi = part.split('-', 1)
+            target.update(range(int(lo), int(hi) + 1))
+        else:
+            target.add(int(part))
+    return ids - excluded
+
+def cpuset_string(ids):
+    """{0, 1, 2, 3, 8} -> '0-3,8'."""
+    ids = sorted(ids)
+    parts = []
+    i = 0
+    while i < len(ids):
+        j = i
+        while j + 1 < len(ids) and ids[j + 1] == ids[j] + 1:
+            j += 1
+        parts.append(str(ids[i]) if i == j else f"{ids[i]}-{ids[j]}")
+        i = j + 1
+    return ','.join(parts)
+
+def parse_capabilities(xml_desc):
+    """Returns [(cell id, memory KiB, [cpu ids])] from a capabilities document."""
+    root = ET.fromstring(xml_desc)
+    cells = []
+    for cell in root.findall('./host/topology/cells/cell'):
+        memory = cell.find('memory')
+        cpus = [int(cpu.get('id')) for cpu in cell.findall('./cpus/cpu')]
+        memory_kb = _to_kib(memory.text, memory.get('unit')) if memory is not None else 0
+        cells.append((int(cell.get('id')), memory_kb, cpus))
+    return cells
+
+def tuning_xml(vcpu, cpuset, nodeset, numa_mode='strict'):
+    """<cputune>/<numatune> fragment pinning every vCPU and the emulator to `cpuset`."""
+    lines = ["  <cputune>\n"]
+    lines.extend(f"    <vcpupin vcpu='{i}' cpuset='{cpuset}'/>\n" for i in range(vcpu))
+    lines.append(f"    <emulatorpin cpuset='{cpuset}'/>\n  </cputune>\n")
+    lines.append(f"  <numatune>\n    <memory mode='{numa_mode}' nodeset='{nodeset}'/>\n  </numatune>\n")
+    return ''.join(lines)
+
+
+class CellState:
+    """One NUMA cell: capacity, free memory and what is already placed on it."""
+
+    __slots__ = ('id', 'cpus', 'memory_kb', 'free_kb', 'committed_kb', 'vcpus')
+
+    def __init__(self, id, cpus, memory_kb, free_kb=None, committed_kb=0, vcpus=0):
+        self.id = id
+        self.cpus = list(cpus)
+        self.memory_kb = memory_kb
+        self.free_kb = memory_kb if free_kb is None else free_kb
+        self.committed_kb = committed_kb  # Memory of VMs bound to this cell
+        self.vcpus = vcpus                # vCPUs of VMs pinned to this cell
+
+    def available_kb(self, reserve_kb=0):
+        """Memory a new VM may claim: the lower of actual free and uncommitted memory."""
+        return min(self.free_kb, self.memory_kb - self.committed_kb) - reserve_kb
+
+
+class HostState:
+    """
+    A host as the scheduler sees it: NUMA cells plus host-wide allocations.
+    Build it with collect() from a live LibvirtManager, or directly (simulator).
+    """
+
+    def __init__(self, name, cells, vcpus=0, committed_kb=0):
+        self.name = name
+        self.cells = list(cells)
+        self.vcpus = vcpus                # vCPUs of all running VMs, pinned or not
+        self.committed_kb = committed_kb  # Memory of all running VMs
+
+    @property
+    def cpus(self):
+        return sum(len(c.cpus) for c in self.cells)
+
+    @property
+    def memory_kb(self):
+        return sum(c.memory_kb for c in self.cells)
+
+    def allocate(self, cell_id, vcpu, memory_kb, reserve_kb=0):
+        """
+        Books a placement so later decisions in the same batch see it. With
+        cell_id None (spanning VM) memory is booked against the cells with the
+        most room above `reserve_kb` and vCPUs are shared out evenly.
+        """
+        self.vcpus += vcpu
+        self.committed_kb += memory_kb
+        if cell_id is not None:
+            for cell in self.cells:
+                if cell.id == cell_id:
+                    cell.vcpus += vcpu
+                    cell.committed_kb += memory_kb
+                    cell.free_kb -= memory_kb
+            return
+        remaining = memory_kb
+        for cell in sorted(self.cells, key=lambda c: c.available_kb(), reverse=True):
+            share = min(remaining, max(0, cell.available_kb(reserve_kb)))
+            cell.committed_kb += share
+            cell.free_kb -= share
+            cell.vcpus += vcpu / len(self.cells)
+            remaining -= share
+
+    # Capabilities never change while a host is up; parse them once per URI
+    _caps_lock = threading.Lock()
+    _caps_cache = {}
+
+    @classmethod
+    def collect(cls, name, manager):
+        """
+        Reads a host's state: capabilities (cached), getCellsFreeMemory, getInfo and
+        the running VMs from the inventory, whose <numatune> nodesets bind their
+        memory and vCPUs to cells. Returns None on failure.
+        """
+        conn = manager.conn
+        try:
+            with cls._caps_lock:
+                topology = cls._caps_cache.get(manager.uri)
+            if topology is None:
+                topology = parse_capabilities(conn.getCapabilities())
+                with cls._caps_lock:
+                    cls._caps_cache[manager.uri] = topology
+            info = conn.getInfo()
+            if topology:
+                free = conn.getCellsFreeMemory(0, len(topology))
+                cells = [CellState(cid, cpus, mem_kb, free_b // 1024)
+                         for (cid, mem_kb, cpus), free_b in zip(topology, free)]
+            else:
+                # No NUMA topology reported: one pseudo-cell for the whole host
+                cells = [CellState(0, range(info[2]), info[1] * 1024, conn.getFreeMemory() // 1024)]
+        except (libvirt.libvirtError, ET.ParseError, TypeError, ValueError) as e:
+            print(f"Error reading host state of '{name}': {e}", file=sys.stderr)
+            return None
+
+        host = cls(name, cells)
+        by_id = {c.id: c for c in cells}
+        for vm in manager.list_vms() or []:
+            if vm['id'] is None:
+                continue
+            vcpu, memory_kb = vm['vcpu'] or 0, vm['max_memory_kb'] or vm['memory_kb'] or 0
+            host.vcpus += vcpu
+            host.committed_kb += memory_kb
+            model, _ = manager.get_domain_model(vm['name'])
+            nodes = [by_id[n] for n in parse_cpuset(model.numa_nodeset) if n in by_id] \
+                if model is not None and model.numa_nodeset else []
+            for cell in nodes:
+                cell.committed_kb += memory_kb // len(nodes)
+                cell.vcpus += vcpu / len(nodes)
+        return host
+
+
+class Placement:
+    """Where a VM goes, with the XML fragments the domain builder needs."""
+
+    __slots__ = ('host', 'cell', 'cpuset', 'nodeset', 'tuning')
+
+    def __init__(self, host, cell=None, cpuset=None, nodeset=None, tuning=''):
+        self.host = host
+        self.cell = cell
+        self.cpuset = cpuset
+        self.nodeset = nodeset
+        self.tuning = tuning
+
+    def render_args(self):
+        """Keyword arguments for VMProfile.render()."""
+        return {'tuning': self.tuning, 'cpuset': self.cpuset}
+
+    def to_dict(self):
+        return {'host': self.host, 'cell': self.cell, 'cpuset': self.cpuset, 'nodeset': self.nodeset}
+
+
+class PlacementScheduler:
+    """
+    Chooses a host and NUMA cell for new VMs.
+
+    A VM that fits in one cell (memory and vCPUs, within the vCPU overcommit
+    ratio) is bound to it with <numatune> and pinned to the cell's CPUs with
+    <cputune>, so its memory stays local and neighbours on other cells don't
+    share its memory bandwidth. A VM too big for any cell is placed on a host
+    without pinning. 'binpack' fills the most-used host/cell that still fits
+    (consolidation); 'spread' picks the least used (headroom, isolation).
+    """
+
+    def __init__(self, policy='binpack', cpu_ratio=4.0, reserve_mb=512, numa_mode='strict'):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {', '.join(POLICIES)}")
+        self.policy = policy
+        self.cpu_ratio = cpu_ratio
+        self.reserve_kb = reserve_mb * 1024
+        self.numa_mode = numa_mode
+
+    def _utilization(self, vcpus, cpus, committed_kb, memory_kb):
+        return max(committed_kb / memory_kb if memory_kb else 1.0,
+                   vcpus / (cpus * self.cpu_ratio) if cpus else 1.0)
+
+    def candidates(self, vcpu, memory_mb, hosts):
+        """
+        Yields (host_util, cell_util, host, cell) for every feasible spot; cell is
+        None when the VM only fits by spanning cells. Utilizations are after placement.
+        """
+        memory_kb = memory_mb * 1024
+        for host in hosts:
+            if host.vcpus + vcpu > host.cpus * self.cpu_ratio:
+                continue
+            host_util = self._utilization(host.vcpus + vcpu, host.cpus,
+                                          host.committed_kb + memory_kb, host.memory_kb)
+            fitting = False
+            for cell in host.cells:
+                if (vcpu <= len(cell.cpus)
+                        and cell.vcpus + vcpu <= len(cell.cpus) * self.cpu_ratio
+                        and memory_kb <= cell.available_kb(self.reserve_kb)):
+                    fitting = True
+                    cell_util = self._utilization(cell.vcpus + vcpu, len(cell.cpus),
+                                                  cell.committed_kb + memory_kb, cell.memory_kb)
+                    yield host_util, cell_util, host, cell
+            share = vcpu / len(host.cells)
+            if (not fitting
+                    and all(c.vcpus + share <= len(c.cpus) * self.cpu_ratio for c in host.cells)
+                    and memory_kb <= sum(max(0, c.available_kb(self.reserve_kb)) for c in host.cells)):
+                yield host_util, 0.0, host, None
+
+    def place(self, vcpu, memory_mb, hosts, policy=None):
+        """
+        Picks a spot for one VM and books it in `hosts` (a list of HostState).
+        A NUMA-local spot anywhere in the fleet beats spanning cells; among
+        those the policy decides. Returns a Placement or raises SchedulingError.
+        """
+        policy = policy or self.policy
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {', '.join(POLICIES)}")
+        options = list(self.candidates(vcpu, memory_mb, hosts))
+        if not options:
+            raise SchedulingError(f"No host can fit {vcpu} vCPU / {memory_mb} MB")
+        if policy == 'binpack':
+            _, _, host, cell = max(options, key=lambda o: (o[3] is not None, o[0], o[1]))
+        else:
+            _, _, host, cell = min(options, key=lambda o: (o[3] is None, o[0], o[1]))
+        host.allocate(cell.id if cell else None, vcpu, memory_mb * 1024, self.reserve_kb)
+        if cell is None or len(host.cells) == 1:
+            # Nothing to gain from pinning on a single-cell host
+            return Placement(host.name, cell.id if cell else None)
+        cpuset = cpuset_string(cell.cpus)
+        nodeset = str(cell.id)
+        return Placement(host.name, cell.id, cpuset, nodeset,
+                         tuning_xml(vcpu, cpuset, nodeset, self.numa_mode))
+
+    def place_many(self, requests, hosts, policy=None):
+        """
+        Places [(vcpu, memory_mb)] in order. Returns a list of Placement, or
+        SchedulingError instances for requests that didn't fit.
+        """
+        placements = []
+        for vcpu, memory_mb in requests:
+            try:
+                placements.append(self.place(vcpu, memory_mb, hosts, policy))
+            except SchedulingError as e:
+                placements.append(e)
+        return placements
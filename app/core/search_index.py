@@ -0,0 +1,302 @@
+# app/core/search_index.py
+
+import bisect
+import heapq
+import ipaddress
+import re
+import sys
+import threading
+import time
+
+import libvirt
+
+_UUID_RE = re.compile(r'^[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}$')
+_MAC_RE = re.compile(r'^([0-9a-fA-F]{2}[:-]){5}[0-9a-fA-F]{2}$')
+
+# Query prefixes accepted by SearchIndex.search(), e.g. "mac:52:54:00:..."
+FIELDS = ('uuid', 'name', 'mac', 'ip', 'disk', 'tag')
+
+
+def _norm_mac(mac):
+    return mac.lower().replace('-', ':')
+
+def _norm_uuid(uuid):
+    u = uuid.lower().replace('-', '')
+    return f"{u[:8]}-{u[8:12]}-{u[12:16]}-{u[16:20]}-{u[20:]}" if len(u) == 32 else uuid.lower()
+
+def _is_ip(text):
+    try:
+        ipaddress.ip_address(text)
+        return True
+    except ValueError:
+        return False
+
+
+class SearchIndex:
+    """
+    Secondary indexes over domains: UUID, name prefix, MAC, guest IP, disk
+    source path and metadata tag. Exact lookups are dict hits and name prefixes
+    a bisect over a sorted name list, so queries stay well under a millisecond
+    at 10k domains. Writers replace a domain's entry as a whole (upsert) and the
+    affected postings are adjusted, never rebuilt.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # uuid -> entry dict
+        self._names = []    # sorted (lowercase name, uuid)
+        self._postings = {field: {} for field in ('mac', 'ip', 'disk', 'tag')}  # field -> value -> {uuid}
+        self._ip_sources = {}  # uuid -> {source: [ip]}; the entry holds their union
+        self.generation = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def upsert(self, uuid, name, state=None, macs=None, disks=None, tags=None):
+        """Adds or replaces a domain. Fields left as None keep their indexed values."""
+        with self._lock:
+            old = self._entries.get(uuid)
+            entry = {
+                'uuid': uuid,
+                'name': name,
+                'state': state if state is not None else (old['state'] if old else None),
+                'mac': sorted({_norm_mac(m) for m in macs if m}) if macs is not None else (old['mac'] if old else []),
+                'ip': old['ip'] if old else [],
+                'disk': sorted(set(d for d in disks if d)) if disks is not None else (old['disk'] if old else []),
+                'tag': sorted(set(tags)) if tags is not None else (old['tag'] if old else []),
+            }
+            if entry == old:
+                return
+            self._replace_locked(uuid, old, entry)
+
+    def set_ips(self, uuid, ips, source='lease'):
+        """
+        Replaces the guest IPs one source ('lease', 'agent', ...) reports for a
+        domain; the indexed IPs are the union over sources. Ignored for unknown domains.
+        """
+        with self._lock:
+            old = self._entries.get(uuid)
+            if old is None:
+                return
+            sources = self._ip_sources.setdefault(uuid, {})
+            sources[source] = list(ips)
+            union = sorted({ip for values in sources.values() for ip in values})
+            if union != old['ip']:
+                self._replace_locked(uuid, old, dict(old, ip=union))
+
+    def remove(self, uuid):
+        with self._lock:
+            old = self._entries.get(uuid)
+            if old is not None:
+                self._replace_locked(uuid, old, None)
+
+    def retain(self, uuids):
+        """Drops every domain not in `uuids` (after a full resync)."""
+        uuids = set(uuids)
+        for uuid in [u for u in list(self._entries) if u not in uuids]:
+            self.remove(uuid)
+
+    def uuids(self):
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._ip_sources.clear()
+            self._names = []
+            for postings in self._postings.values():
+                postings.clear()
+            self.generation += 1
+
+    def _replace_locked(self, uuid, old, new):
+        if old is not None:
+            del self._names[bisect.bisect_left(self._names, (old['name'].lower(), uuid))]
+            for field, postings in self._postings.items():
+                for value in old[field]:
+                    owners = postings.get(value)
+                    if owners is not None:
+                        owners.discard(uuid)
+                        if not owners:
+                            del postings[value]
+            del self._entries[uuid]
+            if new is None:
+                self._ip_sources.pop(uuid, None)
+        if new is not None:
+            bisect.insort(self._names, (new['name'].lower(), uuid))
+            for field, postings in self._postings.items():
+                for value in new[field]:
+                    postings.setdefault(value, set()).add(uuid)
+            self._entries[uuid] = new
+        self.generation += 1
+
+    # --- Queries ---
+    def get(self, uuid):
+        entry = self._entries.get(uuid)
+        return dict(entry) if entry else None
+
+    def lookup(self, field, value, limit=50):
+        """
+        Domains whose `field` matches `value`: exact for uuid/mac/ip/disk/tag,
+        case-insensitive prefix for name. Returns a list of (entry, matched value).
+        """
+        with self._lock:
+            if field == 'name':
+                prefix = value.lower()
+                start = bisect.bisect_left(self._names, (prefix, ''))
+                hits = []
+                for name, uuid in self._names[start:start + limit]:
+                    if not name.startswith(prefix):
+                        break
+                    entry = self._entries[uuid]
+                    hits.append((dict(entry), entry['name']))
+                return hits
+            if field == 'uuid':
+                entry = self._entries.get(_norm_uuid(value))
+                return [(dict(entry), entry['uuid'])] if entry else []
+            if field == 'mac':
+                value = _norm_mac(value)
+            owners = self._postings[field].get(value, ())
+            # Popular tags own thousands of domains; pick the first `limit` without a full sort
+            return [(dict(self._entries[uuid]), value) for uuid in heapq.nsmallest(limit, owners)]
+
+    def search(self, query, limit=50):
+        """
+        Free-form search. "field:value" targets one field (see FIELDS); otherwise
+        the field is guessed from the shape of the query (UUID, MAC, IP, path),
+        falling back to name prefix plus exact tag. Returns a list of dicts with
+        the indexed fields plus 'match' (field) and 'value' (what matched).
+        """
+        query = query.strip()
+        if not query:
+            return []
+        field, sep, value = query.partition(':')
+        if sep and field.lower() in FIELDS and not _MAC_RE.match(query) and not _is_ip(query):
+            fields = [field.lower()]
+            query = value.strip()
+        elif _UUID_RE.match(query):
+            fields = ['uuid']
+        elif _MAC_RE.match(query):
+            fields = ['mac']
+        elif _is_ip(query):
+            fields = ['ip']
+        elif query.startswith('/'):
+            fields = ['disk']
+        else:
+            fields = ['name', 'tag']
+
+        results = []
+        seen = set()
+        for field in fields:
+            for entry, matched in self.lookup(field, query, limit):
+                if entry['uuid'] in seen:
+                    continue
+                seen.add(entry['uuid'])
+                entry['match'] = field
+                entry['value'] = matched
+                results.append(entry)
+                if len(results) >= limit:
+                    return results
+        return results
+
+
+class SearchIndexer:
+    """
+    Keeps a SearchIndex in step with a LibvirtManager on a background thread.
+
+    Domains are marked dirty by inventory events and re-indexed from the cached
+    inventory summary and parsed domain XML (one XMLDesc per changed domain).
+    Guest IPs come from the DHCP leases of active libvirt networks, one RPC per
+    network for all domains, refreshed every LEASE_REFRESH_INTERVAL seconds.
+    Other sources (e.g. the guest agent) may call index.set_ips() directly.
+    """
+
+    LEASE_REFRESH_INTERVAL = 60
+
+    def __init__(self, libvirt_manager, index):
+        self.libvirt_manager = libvirt_manager
+        self.index = index
+        self._dirty = set()
+        self._all_dirty = False
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lease_ips = {}  # mac -> [ip]
+
+    def start(self):
+        self.mark_all()
+        self._thread = threading.Thread(target=self._run, name='search-indexer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def mark_dirty(self, uuid):
+        with self._lock:
+            self._dirty.add(uuid)
+        self._wakeup.set()
+
+    def mark_all(self):
+        with self._lock:
+            self._all_dirty = True
+        self._wakeup.set()
+
+    def _run(self):
+        next_leases = 0.0
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            self.process()
+            now = time.monotonic()
+            if now >= next_leases:
+                self.refresh_leases()
+                next_leases = now + self.LEASE_REFRESH_INTERVAL
+            self._wakeup.wait(max(0.0, next_leases - time.monotonic()))
+
+    def process(self):
+        """Re-indexes the dirty domains. Also usable synchronously without the thread."""
+        with self._lock:
+            all_dirty, self._all_dirty = self._all_dirty, False
+            dirty, self._dirty = self._dirty, set()
+        inventory = self.libvirt_manager.inventory
+        if all_dirty:
+            vms = self.libvirt_manager.list_vms() or []
+            self.index.retain(vm['uuid'] for vm in vms)
+        else:
+            vms = [inventory.get(uuid) for uuid in dirty]
+            for uuid in dirty:
+                if inventory.get(uuid) is None:
+                    self.index.remove(uuid)
+        for vm in vms:
+            if vm is None or self._stop.is_set():
+                continue
+            model, _ = self.libvirt_manager.get_domain_model(vm['name'])
+            if model is None:
+                self.index.upsert(vm['uuid'], vm['name'], vm['state'])
+                continue
+            macs = [iface.mac for iface in model.interfaces]
+            self.index.upsert(vm['uuid'], vm['name'], vm['state'], macs=macs,
+                              disks=[disk.source for disk in model.disks], tags=model.tags)
+            self.index.set_ips(vm['uuid'], [ip for mac in macs if mac
+                                            for ip in self._lease_ips.get(mac.lower(), ())])
+
+    def refresh_leases(self):
+        """Reads DHCP leases of all active networks and updates guest IPs by MAC."""
+        conn = self.libvirt_manager._conn
+        if conn is None:
+            return
+        lease_ips = {}
+        try:
+            for network in conn.listAllNetworks(libvirt.VIR_CONNECT_LIST_NETWORKS_ACTIVE):
+                for lease in network.DHCPLeases():
+                    if lease.get('mac') and lease.get('ipaddr'):
+                        lease_ips.setdefault(lease['mac'].lower(), []).append(lease['ipaddr'])
+        except libvirt.libvirtError as e:
+            print(f"Error reading DHCP leases: {e}", file=sys.stderr)
+            return
+        self._lease_ips = lease_ips
+        for uuid in self.index.uuids():
+            entry = self.index.get(uuid)
+            if entry is not None:
+                self.index.set_ips(uuid, [ip for mac in entry['mac'] for ip in lease_ips.get(mac, ())])
@@ -0,0 +1,263 @@
+# app/core/simulator.py
+
+import heapq
+import random
+import sys
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+import libvirt
+
+from app.core.instrumentation import LOCAL_METHODS, WRAPPED_TYPES, register_proxy_type
+
+SIM_SCHEME = 'sim'
+
+# Never failed on purpose: failing these only breaks setup and teardown, not what is under test
+NO_FAILURE_METHODS = frozenset(('close', 'registerCloseCallback', 'unregisterCloseCallback', 'setKeepAlive',
+                                'domainEventRegisterAny', 'domainEventDeregisterAny',
+                                'storagePoolEventRegisterAny', 'storagePoolEventDeregisterAny'))
+EVENT_REGISTER_METHODS = frozenset(('domainEventRegisterAny', 'storagePoolEventRegisterAny'))
+
+DOMAIN_XML = """<domain type='test'>
+  <name>{name}</name>
+  <memory unit='MiB'>512</memory>
+  <vcpu>{vcpu}</vcpu>
+  <os><type arch='x86_64'>hvm</type></os>
+  <devices>
+    <disk type='file' device='disk'>
+      <driver name='qemu' type='qcow2'/>
+      <source file='/var/lib/libvirt/images/{name}.qcow2'/>
+      <target dev='vda' bus='virtio'/>
+    </disk>
+    <interface type='network'>
+      <mac address='{mac}'/>
+      <source network='default'/>
+      <model type='virtio'/>
+    </interface>
+  </devices>
+</domain>"""
+
+
+class SimulationProfile:
+    """
+    How a simulated hypervisor behaves, parsed from a sim:// URI:
+
+        sim:///default?domains=2000&latency_ms=5&jitter_ms=3&failure_rate=0.01
+
+    The path picks the test driver state underneath (sim:///default is
+    test:///default, sim:///tmp/node.xml is test:///tmp/node.xml). Parameters:
+
+    domains         define sim-NNNNN domains until there are this many; 0 adds none
+    running         fraction of the added domains that are started (0.5)
+    latency_ms      base delay of every RPC
+    jitter_ms       mean of an extra, exponentially distributed delay (long tail)
+    failure_rate    probability that an RPC fails with libvirtError
+    connect_ms      delay of opening a connection (ssh/TLS handshake)
+    event_delay_ms  delay before domain/pool event callbacks run
+    serialize       1: one RPC at a time per connection, like a busy daemon
+    seed            random seed, for repeatable jitter and failures
+    """
+
+    def __init__(self, base_uri='test:///default', domains=0, running=0.5, latency_ms=0.0, jitter_ms=0.0,
+                 failure_rate=0.0, connect_ms=0.0, event_delay_ms=0.0, serialize=False, seed=None):
+        self.base_uri = base_uri
+        self.domains = domains
+        self.running = running
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.failure_rate = failure_rate
+        self.connect_delay = connect_ms / 1000.0
+        self.event_delay = event_delay_ms / 1000.0
+        self.serialize = serialize
+        self.random = random.Random(seed)
+
+    @classmethod
+    def from_uri(cls, uri):
+        """Parses a sim:// URI. Raises ValueError on unknown or malformed parameters."""
+        parts = urlsplit(uri)
+        if parts.scheme != SIM_SCHEME:
+            raise ValueError(f"Not a {SIM_SCHEME}:// URI: {uri}")
+        kwargs = {'base_uri': f"test://{parts.path or '/default'}"}
+        types = {'domains': int, 'running': float, 'latency_ms': float, 'jitter_ms': float,
+                 'failure_rate': float, 'connect_ms': float, 'event_delay_ms': float,
+                 'serialize': lambda v: v not in ('0', 'false', 'no', ''), 'seed': int}
+        for key, value in parse_qsl(parts.query, keep_blank_values=True):
+            if key not in types:
+                raise ValueError(f"Unknown {SIM_SCHEME}:// parameter '{key}'")
+            try:
+                kwargs[key] = types[key](value)
+            except ValueError:
+                raise ValueError(f"Invalid value for '{key}': {value!r}")
+        return cls(**kwargs)
+
+    def delay(self):
+        """Seconds one RPC takes."""
+        if not self.jitter:
+            return self.latency
+        return self.latency + self.random.expovariate(1.0 / self.jitter)
+
+    def fails(self):
+        return self.failure_rate > 0 and self.random.random() < self.failure_rate
+
+
+class _Link:
+    """Per-connection state shared by the connection and every object obtained from it."""
+
+    __slots__ = ('profile', 'lock', 'events')
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.lock = threading.Lock() if profile.serialize else None
+        self.events = _EventDelayer(profile.event_delay) if profile.event_delay else None
+
+
+class SimulatedProxy:
+    """
+    Stands in for a libvirt object of a simulated connection. Every call that
+    would be an RPC on a remote daemon sleeps for the profile's latency and
+    may fail with libvirtError; calls the bindings answer locally (name(),
+    UUIDString(), ...) stay instant. libvirt objects it returns are wrapped
+    the same way, and proxies passed as arguments are unwrapped.
+    """
+
+    __slots__ = ('_target', '_link', '_prefix')
+
+    def __init__(self, target, link):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_link', link)
+        object.__setattr__(self, '_prefix', type(target).__name__)
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+        link = self._link
+        if name in LOCAL_METHODS:
+            def local(*args, **kwargs):
+                return _wrap(attr(*args, **kwargs), link)
+            return local
+        method = f"{self._prefix}.{name}"
+        may_fail = name not in NO_FAILURE_METHODS
+        delays_events = link.events is not None and name in EVENT_REGISTER_METHODS
+
+        def call(*args, **kwargs):
+            if args:
+                args = tuple(_unwrap(arg) for arg in args)
+            if kwargs:
+                kwargs = {key: _unwrap(value) for key, value in kwargs.items()}
+            if delays_events and len(args) > 2 and callable(args[2]):
+                args = args[:2] + (link.events.wrap(args[2]),) + args[3:]
+            profile = link.profile
+            if link.lock is not None:
+                with link.lock:
+                    time.sleep(profile.delay())
+            else:
+                time.sleep(profile.delay())
+            if may_fail and profile.fails():
+                raise libvirt.libvirtError(f"Simulated failure in {method}")
+            return _wrap(attr(*args, **kwargs), link)
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+    def __eq__(self, other):
+        return self._target == _unwrap(other)
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __repr__(self):
+        return f"<simulated {self._target!r}>"
+
+register_proxy_type(SimulatedProxy)
+
+def _wrap(value, link):
+    if isinstance(value, WRAPPED_TYPES):
+        return SimulatedProxy(value, link)
+    if isinstance(value, list):
+        return [_wrap(item, link) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_wrap(item, link) for item in value)
+    return value
+
+def _unwrap(value):
+    if isinstance(value, SimulatedProxy):
+        return value._target
+    if isinstance(value, list):
+        return [_unwrap(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_unwrap(item) for item in value)
+    return value
+
+
+class _EventDelayer:
+    """Runs event callbacks `delay` seconds late, in order, on one thread."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self._cond = threading.Condition()
+        self._queue = []  # heap of (due, sequence, callback, args)
+        self._sequence = 0
+        self._thread = None
+
+    def wrap(self, callback):
+        def delayed(*args):
+            self.put(callback, args)
+            return 0
+        return delayed
+
+    def put(self, callback, args):
+        with self._cond:
+            self._sequence += 1
+            heapq.heappush(self._queue, (time.monotonic() + self.delay, self._sequence, callback, args))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sim-events', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    self._cond.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                _, _, callback, args = heapq.heappop(self._queue)
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Error in delayed event callback: {e}", file=sys.stderr)
+
+
+_populate_lock = threading.Lock()
+
+def _populate(conn, profile):
+    """Defines sim-NNNNN domains on the underlying connection until there are `profile.domains`."""
+    with _populate_lock:
+        existing = len([d for d in conn.listAllDomains(0) if d.name().startswith('sim-')])
+        for i in range(existing, profile.domains):
+            dom = conn.defineXML(DOMAIN_XML.format(
+                name=f"sim-{i:05d}", vcpu=1 + i % 4,
+                mac="52:54:00:%02x:%02x:%02x" % ((i >> 16) & 0xff, (i >> 8) & 0xff, i & 0xff)))
+            if int((i + 1) * profile.running) > int(i * profile.running): # Spreads the started ones evenly
+                dom.create()
+
+def open_simulated(uri):
+    """Opens a sim:// URI: the test driver underneath, behind a SimulatedProxy."""
+    profile = SimulationProfile.from_uri(uri)
+    time.sleep(profile.connect_delay)
+    conn = libvirt.open(profile.base_uri)
+    if conn is None:
+        return None
+    if profile.domains:
+        _populate(conn, profile)
+    return SimulatedProxy(conn, _Link(profile))
+
+def open_uri(uri):
+    """Opener for LibvirtManager: sim:// URIs are simulated, anything else goes to libvirt.open."""
+    if uri and uri.startswith(SIM_SCHEME + '://'):
+        try:
+            return open_simulated(uri)
+        except ValueError as e:
+            raise libvirt.libvirtError(f"Invalid simulation URI: {e}")
+    return libvirt.open(uri)
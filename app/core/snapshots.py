@@ -0,0 +1,190 @@
+# app/core/snapshots.py
+
+import io
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
+
+import libvirt
+
+
+def parse_snapshot_xml(xml_desc):
+    """
+    Reads the fields shown in listings from a <domainsnapshot> document. The
+    embedded <domain> definition (the bulk of the document) is skipped.
+    """
+    info = {'name': None, 'description': '', 'state': None, 'created': 0, 'parent': None,
+            'memory': False, 'external': False, 'disks': []}
+    path = []
+    source = io.BytesIO(xml_desc.encode('utf-8') if isinstance(xml_desc, str) else xml_desc)
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            path.append(elem.tag)
+            continue
+        depth = len(path)
+        tag = elem.tag
+        if depth == 2:
+            if tag == 'name':
+                info['name'] = elem.text
+            elif tag == 'description':
+                info['description'] = elem.text or ''
+            elif tag == 'state':
+                info['state'] = elem.text
+            elif tag == 'creationTime':
+                info['created'] = int(elem.text or 0)
+            elif tag == 'memory':
+                info['memory'] = elem.get('snapshot') not in (None, 'no')
+            elem.clear()
+        elif depth == 3 and path[1] == 'parent' and tag == 'name':
+            info['parent'] = elem.text
+        elif depth == 3 and path[1] == 'disks' and tag == 'disk':
+            kind = elem.get('snapshot', 'internal')
+            if kind != 'no':
+                source_elem = elem.find('source')
+                info['disks'].append({'target': elem.get('name'), 'snapshot': kind,
+                                      'source': source_elem.get('file') if source_elem is not None else None})
+            info['external'] = info['external'] or kind == 'external'
+        path.pop()
+    return info
+
+def snapshot_xml(name, description='', disks=None):
+    """
+    <domainsnapshot> for snapshotCreateXML. `disks` maps disk targets to
+    'external', 'internal' or 'no'; unnamed disks take libvirt's default.
+    """
+    parts = [f"<domainsnapshot><name>{escape(name)}</name>"]
+    if description:
+        parts.append(f"<description>{escape(description)}</description>")
+    if disks:
+        parts.append("<disks>")
+        parts.extend(f"<disk name={quoteattr(target)} snapshot={quoteattr(kind)}/>" for target, kind in disks.items())
+        parts.append("</disks>")
+    parts.append("</domainsnapshot>")
+    return ''.join(parts)
+
+
+class SnapshotCache:
+    """
+    Parsed snapshot metadata per domain UUID.
+
+    Snapshot XML embeds the whole domain definition, so each snapshot's XML is
+    fetched once, when it is first seen. A sync costs two RPCs however many
+    snapshots a domain has: listAllSnapshots() for the names and snapshotCurrent()
+    for the current one. Entries younger than `ttl` seconds are served without
+    any RPC; LibvirtManager updates them in place for snapshots it creates,
+    reverts and deletes, so only changes made behind its back wait for the TTL.
+    """
+
+    def __init__(self, ttl=30.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}  # uuid -> {'snapshots': {name: info}, 'current': name, 'synced': monotonic}
+
+    def get(self, uuid):
+        """Returns (snapshots dict, current name) if the entry is fresh, else None."""
+        with self._lock:
+            entry = self._entries.get(uuid)
+            if entry is None or time.monotonic() - entry['synced'] > self.ttl:
+                return None
+            return dict(entry['snapshots']), entry['current']
+
+    def sync(self, uuid, domain):
+        """
+        Re-lists a domain's snapshots, reading XML only for new snapshots and for
+        those whose parent was deleted (libvirt re-parents them). Returns
+        (snapshots dict, current name), or None on error.
+        """
+        with self._lock:
+            entry = self._entries.get(uuid)
+            known = dict(entry['snapshots']) if entry else {}
+        try:
+            handles = {snap.getName(): snap for snap in domain.listAllSnapshots(0)}
+            snapshots = {}
+            for name, snap in handles.items():
+                info = known.get(name)
+                if info is None or (info['parent'] and info['parent'] not in handles):
+                    info = parse_snapshot_xml(snap.getXMLDesc(0))
+                snapshots[name] = info
+            current = self._current(domain) if snapshots else None
+        except (libvirt.libvirtError, ET.ParseError) as e:
+            print(f"Error listing snapshots of '{domain.name()}': {e}", file=sys.stderr)
+            return None
+        with self._lock:
+            self._entries[uuid] = {'snapshots': snapshots, 'current': current, 'synced': time.monotonic()}
+        return dict(snapshots), current
+
+    @staticmethod
+    def _current(domain):
+        try:
+            return domain.snapshotCurrent(0).getName()
+        except libvirt.libvirtError as e:
+            if e.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN_SNAPSHOT:
+                return None
+            raise
+
+    def added(self, uuid, info):
+        """Records a snapshot just created; it becomes the current one."""
+        with self._lock:
+            entry = self._entries.get(uuid)
+            if entry is not None:
+                entry['snapshots'][info['name']] = info
+                entry['current'] = info['name']
+
+    def reverted(self, uuid, name):
+        with self._lock:
+            entry = self._entries.get(uuid)
+            if entry is not None:
+                entry['current'] = name
+
+    def deleted(self, uuid, name, children=False):
+        """
+        Mirrors snapshotDelete: with children=True the whole subtree goes,
+        otherwise children move up to the deleted snapshot's parent. A deleted
+        current snapshot hands 'current' to its parent.
+        """
+        with self._lock:
+            entry = self._entries.get(uuid)
+            if entry is None:
+                return
+            snapshots = entry['snapshots']
+            info = snapshots.pop(name, None)
+            if info is None:
+                return
+            doomed = {name}
+            if children:
+                changed = True
+                while changed:
+                    extra = [n for n, s in snapshots.items() if s['parent'] in doomed]
+                    changed = bool(extra)
+                    for n in extra:
+                        doomed.add(n)
+                        del snapshots[n]
+            else:
+                for n, s in snapshots.items():
+                    if s['parent'] == name:
+                        snapshots[n] = dict(s, parent=info['parent'])
+            if entry['current'] in doomed:
+                entry['current'] = info['parent']
+
+    def invalidate(self, uuid):
+        with self._lock:
+            self._entries.pop(uuid, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def snapshot_tree(snapshots, current=None):
+    """
+    Nests a {name: info} mapping by parent. Returns the roots, oldest first,
+    each a copy of its info with 'current' and 'children' added.
+    """
+    nodes = {name: dict(info, current=name == current, children=[]) for name, info in snapshots.items()}
+    roots = []
+    for node in sorted(nodes.values(), key=lambda n: (n['created'], n['name'])):
+        parent = nodes.get(node['parent'])
+        (parent['children'] if parent is not None else roots).append(node)
+    return roots
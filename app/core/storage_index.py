@@ -0,0 +1,220 @@
+# app/core/storage_index.py
+
+import sys
+import threading
+import xml.etree.ElementTree as ET
+
+import libvirt
+
+_POOL_STATES = {
+    libvirt.VIR_STORAGE_POOL_INACTIVE: 'Inactive',
+    libvirt.VIR_STORAGE_POOL_BUILDING: 'Building',
+    libvirt.VIR_STORAGE_POOL_RUNNING: 'Running',
+    libvirt.VIR_STORAGE_POOL_DEGRADED: 'Degraded',
+    libvirt.VIR_STORAGE_POOL_INACCESSIBLE: 'Inaccessible',
+}
+
+
+def _parse_volume_xml(pool_name, xml_desc):
+    root = ET.fromstring(xml_desc)
+    fmt = root.find('./target/format')
+    backing_fmt = root.find('./backingStore/format')
+    return {
+        'pool': pool_name,
+        'name': root.findtext('name'),
+        'key': root.findtext('key'),
+        'path': root.findtext('./target/path'),
+        'type': root.get('type', 'file'),
+        'format': fmt.get('type') if fmt is not None else None,
+        'capacity': int(root.findtext('capacity') or 0),
+        'allocation': int(root.findtext('allocation') or 0),
+        'backing_path': root.findtext('./backingStore/path'),
+        'backing_format': backing_fmt.get('type') if backing_fmt is not None else None,
+    }
+
+
+class StorageIndex:
+    """
+    In-memory index of storage pools and volumes: capacity/allocation, format,
+    backing files and which domain uses which volume.
+
+    A pool is read with pool.info(), pool.XMLDesc() and listAllVolumes(); only
+    volumes not seen before cost an extra XMLDesc RPC, so refreshing a pool with
+    thousands of unchanged images stays cheap. A full re-read of every volume
+    (fresh allocation figures) happens on pool refresh events or on request.
+    Volume-to-domain usage is supplied by the caller from parsed domain XML.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools = {}    # pool name -> pool dict
+        self._volumes = {}  # volume path -> volume dict
+        self._usage = {}    # volume path -> sorted list of VM names
+        self._loaded = False
+
+    def is_loaded(self):
+        return self._loaded
+
+    def invalidate(self):
+        """Drops everything; the next load() re-reads all pools."""
+        with self._lock:
+            self._pools.clear()
+            self._volumes.clear()
+            self._usage = {}
+            self._loaded = False
+
+    def load(self, conn):
+        """Indexes every storage pool on the connection. Returns True on success."""
+        try:
+            pools = conn.listAllStoragePools(0)
+        except libvirt.libvirtError as e:
+            print(f"Error listing storage pools: {e}", file=sys.stderr)
+            return False
+        names = set()
+        for pool in pools:
+            names.add(pool.name())
+            self.refresh_pool(pool)
+        with self._lock:
+            for name in set(self._pools) - names:
+                self._drop_pool_locked(name)
+            self._loaded = True
+        return True
+
+    def refresh_pool(self, pool, full=False):
+        """
+        Re-reads one pool. Only new volumes are fetched unless full=True.
+        Returns True on success.
+        """
+        name = pool.name()
+        try:
+            state, capacity, allocation, available = pool.info()
+            root = ET.fromstring(pool.XMLDesc(0))
+            active = state == libvirt.VIR_STORAGE_POOL_RUNNING
+            vols = pool.listAllVolumes(0) if active else []
+        except (libvirt.libvirtError, ET.ParseError) as e:
+            print(f"Error reading storage pool '{name}': {e}", file=sys.stderr)
+            return False
+
+        pool_entry = {
+            'name': name,
+            'uuid': pool.UUIDString(),
+            'type': root.get('type'),
+            'path': root.findtext('./target/path'),
+            'state': _POOL_STATES.get(state, 'Unknown'),
+            'active': active,
+            'capacity': capacity,
+            'allocation': allocation,
+            'available': available,
+        }
+        with self._lock:
+            # Volumes are indexed by path but diffed by key: key -> path
+            known = {vol['key']: path for path, vol in self._volumes.items() if vol['pool'] == name}
+        # name()/key() are local to the volume object; the key is the path for file pools
+        current = {vol.key(): vol for vol in vols}
+
+        fetched = {}
+        for key, vol in current.items():
+            if key in known and not full:
+                continue
+            try:
+                entry = _parse_volume_xml(name, vol.XMLDesc(0))
+            except (libvirt.libvirtError, ET.ParseError) as e:
+                print(f"Error reading volume '{vol.name()}' in pool '{name}': {e}", file=sys.stderr)
+                continue
+            entry['key'] = key # Same identifier as the next refresh's listAllVolumes()
+            fetched[key] = entry
+
+        with self._lock:
+            self._pools[name] = pool_entry
+            for key in set(known) - set(current):
+                self._volumes.pop(known[key], None)
+            for key, vol in fetched.items():
+                if key in known and known[key] != (vol['path'] or key):
+                    self._volumes.pop(known[key], None) # Re-read under a new path
+                self._volumes[vol['path'] or key] = vol
+        return True
+
+    def drop_pool(self, name):
+        """Forgets a pool and its volumes (e.g. undefined)."""
+        with self._lock:
+            self._drop_pool_locked(name)
+
+    def _drop_pool_locked(self, name):
+        self._pools.pop(name, None)
+        for path in [p for p, vol in self._volumes.items() if vol['pool'] == name]:
+            del self._volumes[path]
+
+    def set_usage(self, usage):
+        """Replaces the volume path -> [VM names] map."""
+        with self._lock:
+            self._usage = {path: sorted(names) for path, names in usage.items()}
+
+    # --- Queries, all served from memory ---
+    def pools(self):
+        with self._lock:
+            return sorted(self._pools.values(), key=lambda p: p['name'])
+
+    def volumes(self, pool_name=None):
+        with self._lock:
+            vols = [self._with_users(v) for v in self._volumes.values()
+                    if pool_name is None or v['pool'] == pool_name]
+        return sorted(vols, key=lambda v: (v['pool'], v['name'] or ''))
+
+    def volume(self, path):
+        with self._lock:
+            vol = self._volumes.get(path)
+            return self._with_users(vol) if vol else None
+
+    def unattached_volumes(self, pool_name=None):
+        """Volumes no domain uses, directly or as a backing file of a used volume."""
+        with self._lock:
+            needed = set()
+            for path in self._usage:
+                needed.update(self._chain_paths_locked(path))
+            return sorted((self._with_users(v) for p, v in self._volumes.items()
+                           if p not in needed and (pool_name is None or v['pool'] == pool_name)),
+                          key=lambda v: (v['pool'], v['name'] or ''))
+
+    def largest_volumes(self, limit=20, by='allocation'):
+        """The `limit` volumes using the most space (`by` is 'allocation' or 'capacity')."""
+        key = 'capacity' if by == 'capacity' else 'allocation'
+        with self._lock:
+            vols = sorted(self._volumes.values(), key=lambda v: v[key], reverse=True)[:limit]
+            return [self._with_users(v) for v in vols]
+
+    def largest_consumers(self, limit=20):
+        """
+        VMs ranked by the allocation of the volumes attached to them.
+        Shared backing images are not counted, so base images don't inflate every VM.
+        """
+        totals = {}
+        with self._lock:
+            for path, names in self._usage.items():
+                vol = self._volumes.get(path)
+                if vol is None:
+                    continue
+                for name in names:
+                    entry = totals.setdefault(name, {'name': name, 'allocation': 0, 'capacity': 0, 'volumes': 0})
+                    entry['allocation'] += vol['allocation']
+                    entry['capacity'] += vol['capacity']
+                    entry['volumes'] += 1
+        return sorted(totals.values(), key=lambda e: e['allocation'], reverse=True)[:limit]
+
+    def backing_chain(self, path):
+        """Volume dicts from `path` down to its base image, following backing files."""
+        with self._lock:
+            return [self._with_users(self._volumes[p]) if p in self._volumes else {'path': p}
+                    for p in self._chain_paths_locked(path)]
+
+    def _chain_paths_locked(self, path):
+        chain = []
+        while path and path not in chain:
+            chain.append(path)
+            vol = self._volumes.get(path)
+            path = vol['backing_path'] if vol else None
+        return chain
+
+    def _with_users(self, vol):
+        out = dict(vol)
+        out['used_by'] = self._usage.get(vol['path'], [])
+        return out
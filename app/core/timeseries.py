@@ -0,0 +1,160 @@
+# app/core/timeseries.py
+
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+class _TierSeries:
+    """
+    Fixed-size ring of buckets for one VM at one resolution. Slot i holds the
+    bucket number in `buckets` (-1 = empty) and the mean of every metric sampled
+    during that bucket in `values` (row-major, one float32 per metric).
+    """
+
+    __slots__ = ('step', 'capacity', 'buckets', 'values', 'sums', 'count', 'current')
+
+    def __init__(self, step, capacity, metric_count):
+        self.step = step
+        self.capacity = capacity
+        self.buckets = array('q', [-1]) * capacity
+        self.values = array('f', bytes(4 * capacity * metric_count))
+        self.sums = array('d', bytes(8 * metric_count))
+        self.count = 0
+        self.current = -1
+
+    def add(self, timestamp, row):
+        bucket = int(timestamp // self.step)
+        if bucket != self.current:
+            if bucket < self.current:
+                return # Out-of-order sample older than the open bucket
+            self.current = bucket
+            self.count = 0
+            for m in range(len(self.sums)):
+                self.sums[m] = 0.0
+        self.count += 1
+        width = len(self.sums)
+        base = (bucket % self.capacity) * width
+        self.buckets[bucket % self.capacity] = bucket
+        for m in range(width):
+            self.sums[m] += row[m]
+            # The open bucket is always readable as the running mean
+            self.values[base + m] = self.sums[m] / self.count
+
+
+class TimeSeriesStore:
+    """
+    Fixed-memory per-VM metrics history built from preallocated `array` rings.
+
+    Every sample goes into all tiers at once (by default 15 minutes at 1s, 24
+    hours at 1m and 30 days at 1h); coarser tiers keep the mean per bucket.
+    Memory per VM is fixed at creation and the number of VMs is capped (least
+    recently updated VMs are evicted), so memory_bytes() is an upper bound.
+    """
+
+    METRICS = ('cpu_percent', 'memory_kb', 'net_rx_bps', 'net_tx_bps', 'disk_rd_bps', 'disk_wr_bps')
+    TIERS = ((1, 900), (60, 1440), (3600, 720))
+
+    def __init__(self, max_vms=1000, tiers=None, metrics=None):
+        self.max_vms = max_vms
+        self.tiers = tuple(tiers or self.TIERS)
+        self.metrics = tuple(metrics or self.METRICS)
+        self._metric_index = {name: i for i, name in enumerate(self.metrics)}
+        self._lock = threading.Lock()
+        self._series = OrderedDict() # uuid -> [_TierSeries per tier], least recently updated first
+
+    def bytes_per_vm(self):
+        """Size of the preallocated arrays for one VM."""
+        width = len(self.metrics)
+        return sum(capacity * (8 + 4 * width) + 8 * width for _, capacity in self.tiers)
+
+    def memory_bytes(self):
+        """Upper bound of array memory for max_vms VMs."""
+        return self.bytes_per_vm() * self.max_vms
+
+    def ingest(self, uuid, timestamp, values):
+        """Records one sample ({metric: value}) for a VM. Missing metrics count as 0."""
+        row = [float(values.get(name) or 0) for name in self.metrics]
+        with self._lock:
+            tiers = self._series.get(uuid)
+            if tiers is None:
+                if len(self._series) >= self.max_vms:
+                    self._series.popitem(last=False)
+                tiers = [_TierSeries(step, capacity, len(row)) for step, capacity in self.tiers]
+                self._series[uuid] = tiers
+            else:
+                self._series.move_to_end(uuid)
+            for tier in tiers:
+                tier.add(timestamp, row)
+
+    def ingest_samples(self, timestamp, samples):
+        """MetricsSampler listener: records a whole tick of {uuid: values}."""
+        for uuid, values in samples.items():
+            self.ingest(uuid, timestamp, values)
+
+    def forget(self, uuid):
+        with self._lock:
+            self._series.pop(uuid, None)
+
+    def query(self, uuid, start, end, step=None, metrics=None):
+        """
+        Returns {'step': seconds, 'series': {metric: [[t, value], ...]}} for
+        start <= t <= end, or None if the VM has no history. The finest tier that
+        still covers `start` is used; a larger `step` averages consecutive buckets.
+        Empty buckets are left out.
+        """
+        names = [m for m in (metrics or self.metrics) if m in self._metric_index]
+        now = time.time()
+        with self._lock:
+            tiers = self._series.get(uuid)
+            if tiers is None:
+                return None
+            tier = self._pick_tier(tiers, start, now, step)
+            factor = max(1, int((step or tier.step) // tier.step))
+            out_step = tier.step * factor
+            width = len(self.metrics)
+            first = max(int(start // tier.step), tier.current - tier.capacity + 1)
+            last = min(int(end // tier.step), tier.current)
+            series = {name: [] for name in names}
+            columns = [self._metric_index[name] for name in names]
+
+            group = None
+            sums = [0.0] * len(columns)
+            count = 0
+            for bucket in range(first, last + 1):
+                slot = bucket % tier.capacity
+                if tier.buckets[slot] != bucket:
+                    continue
+                g = bucket // factor
+                if g != group:
+                    if count:
+                        self._emit(series, names, group * out_step, sums, count)
+                    group, sums, count = g, [0.0] * len(columns), 0
+                base = slot * width
+                for i, column in enumerate(columns):
+                    sums[i] += tier.values[base + column]
+                count += 1
+            if count:
+                self._emit(series, names, group * out_step, sums, count)
+        return {'step': out_step, 'series': series}
+
+    @staticmethod
+    def _emit(series, names, t, sums, count):
+        for i, name in enumerate(names):
+            series[name].append([t, round(sums[i] / count, 3)])
+
+    @staticmethod
+    def _pick_tier(tiers, start, now, step):
+        """
+        Among the tiers whose retention reaches back to `start`, the coarsest one
+        not coarser than `step` (fewest buckets to average), else the finest one.
+        If no tier reaches back that far, the longest-retention tier.
+        """
+        covering = [t for t in tiers if now - t.step * t.capacity <= start]
+        if not covering:
+            return tiers[-1]
+        if step is not None:
+            fitting = [t for t in covering if t.step <= step]
+            if fitting:
+                return fitting[-1]
+        return covering[0]
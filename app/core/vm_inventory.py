@@ -0,0 +1,94 @@
+# app/core/vm_inventory.py
+
+import threading
+
+class VMInventory:
+    """
+    In-process cache of domain summaries keyed by UUID.
+
+    Entries are the summary dicts produced by LibvirtManager.get_vm_inventory()
+    together with the virDomain object they came from, so lookups by name can
+    hand out a domain without a lookupByName RPC. Entries are replaced, never
+    mutated, so readers may hold on to the dicts they get back.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vms = {}       # uuid -> summary dict
+        self._domains = {}   # uuid -> virDomain
+        self._by_name = {}   # name -> uuid
+        self._ready = False
+        self.generation = 0  # Bumped on every change, usable as a cheap version/ETag
+
+    def is_ready(self):
+        """True once the cache has been filled and is being kept current."""
+        return self._ready
+
+    def invalidate(self):
+        """Marks the cache stale (e.g. connection lost); readers fall back to RPCs."""
+        with self._lock:
+            self._ready = False
+            self._domains.clear()
+            self.generation += 1
+
+    def replace_all(self, records):
+        """Replaces the whole cache with (domain, summary) pairs from a full resync."""
+        with self._lock:
+            self._vms = {summary['uuid']: summary for _, summary in records}
+            self._domains = {summary['uuid']: dom for dom, summary in records}
+            self._by_name = {summary['name']: summary['uuid'] for _, summary in records}
+            self._ready = True
+            self.generation += 1
+
+    def update(self, dom, summary):
+        """Inserts or replaces a single domain entry."""
+        uuid = summary['uuid']
+        with self._lock:
+            old = self._vms.get(uuid)
+            if old is not None and old['name'] != summary['name']:
+                self._by_name.pop(old['name'], None)
+            self._vms[uuid] = summary
+            self._domains[uuid] = dom
+            self._by_name[summary['name']] = uuid
+            # Reboots and device events often leave the summary as it was
+            if old != summary:
+                self.generation += 1
+
+    def remove(self, uuid):
+        """Drops a domain entry (undefined or transient domain gone)."""
+        with self._lock:
+            summary = self._vms.pop(uuid, None)
+            self._domains.pop(uuid, None)
+            if summary is not None:
+                self._by_name.pop(summary['name'], None)
+                self.generation += 1
+
+    def get(self, uuid):
+        """Returns the summary for a UUID, or None."""
+        return self._vms.get(uuid)
+
+    def get_by_name(self, name):
+        """Returns the summary for a domain name, or None."""
+        uuid = self._by_name.get(name)
+        return self._vms.get(uuid) if uuid else None
+
+    def get_domain(self, name):
+        """Returns the cached virDomain object for a domain name, or None."""
+        uuid = self._by_name.get(name)
+        return self._domains.get(uuid) if uuid else None
+
+    def list(self, active=None):
+        """
+        Returns a list of summaries. With active=True/False only running/paused
+        or only inactive domains are returned.
+        """
+        with self._lock:
+            vms = list(self._vms.values())
+        if active is None:
+            return vms
+        return [vm for vm in vms if (vm['id'] is not None) == active]
+
+    def states(self):
+        """Returns {uuid: state_code} for the consistency check."""
+        with self._lock:
+            return {uuid: vm['state_code'] for uuid, vm in self._vms.items()}
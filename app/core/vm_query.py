@@ -0,0 +1,151 @@
+# app/core/vm_query.py
+
+import base64
+import json
+import zlib
+
+# Sortable fields of a listed VM (see VMQuery.row())
+SORT_KEYS = ('name', 'state', 'vcpu', 'memory_mb', 'uuid')
+# Type of each field's value in a cursor key; the second item is always the uuid
+_KEY_TYPES = {'name': str, 'state': str, 'uuid': str, 'vcpu': int, 'memory_mb': int}
+
+
+def _state_token(state):
+    """'Running' / 'running', 'No State' / 'nostate' compare equal."""
+    return state.lower().replace(' ', '')
+
+def encode_cursor(sort, key):
+    """Opaque, URL-safe cursor for the last row of a page."""
+    raw = json.dumps([sort, key], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Returns (sort, key) or raises ValueError for a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort, key = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(sort, str) or not isinstance(key, list) or len(key) != 2:
+        raise ValueError("Invalid cursor")
+    expected = _KEY_TYPES.get(sort.lstrip('-'))
+    if expected is None:
+        raise ValueError("Invalid cursor: unknown sort field")
+    value, uuid = key
+    # bool is an int subclass, but never a valid vcpu or memory value
+    if not isinstance(value, expected) or isinstance(value, bool) or not isinstance(uuid, str):
+        raise ValueError("Invalid cursor: key does not match the sort field")
+    return sort, (value, uuid)
+
+
+class VMQuery:
+    """
+    Filter, sort and keyset-paginate the VM list.
+
+    Pages are addressed by the sort key of the last row returned rather than an
+    offset, so VMs appearing or disappearing between polls don't shift or
+    repeat rows. Invalid parameters raise ValueError.
+    """
+
+    MAX_LIMIT = 1000
+
+    def __init__(self, states=None, name_prefix=None, min_memory_mb=None, max_memory_mb=None,
+                 min_vcpu=None, max_vcpu=None, sort='name', limit=None, cursor=None):
+        descending = sort.startswith('-')
+        field = sort.lstrip('-')
+        if field not in SORT_KEYS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)} (prefix '-' for descending)")
+        if limit is not None and not 1 <= limit <= self.MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {self.MAX_LIMIT}")
+        self.states = {_state_token(s) for s in states} if states else None
+        self.name_prefix = name_prefix or None
+        self.min_memory_mb = min_memory_mb
+        self.max_memory_mb = max_memory_mb
+        self.min_vcpu = min_vcpu
+        self.max_vcpu = max_vcpu
+        self.sort = sort
+        self.field = field
+        self.descending = descending
+        self.limit = limit
+        self.after = None
+        if cursor:
+            cursor_sort, self.after = decode_cursor(cursor)
+            if cursor_sort != sort:
+                raise ValueError("Cursor belongs to a different sort order")
+
+    @classmethod
+    def from_args(cls, args):
+        """Builds a query from request args (a werkzeug MultiDict)."""
+        states = []
+        for value in args.getlist('state'):
+            states.extend(s for s in value.split(',') if s)
+        try:
+            return cls(states=states,
+                       name_prefix=args.get('name_prefix'),
+                       min_memory_mb=args.get('min_memory_mb', type=int),
+                       max_memory_mb=args.get('max_memory_mb', type=int),
+                       min_vcpu=args.get('min_vcpu', type=int),
+                       max_vcpu=args.get('max_vcpu', type=int),
+                       sort=args.get('sort', 'name'),
+                       limit=int(args['limit']) if 'limit' in args else None,
+                       cursor=args.get('cursor'))
+        except (TypeError, ValueError) as e:
+            raise ValueError(str(e))
+
+    def fingerprint(self):
+        """Stable checksum of the normalized query, for ETags."""
+        parts = (sorted(self.states or ()), self.name_prefix, self.min_memory_mb, self.max_memory_mb,
+                 self.min_vcpu, self.max_vcpu, self.sort, self.limit, self.after)
+        return '%08x' % zlib.crc32(json.dumps(parts, default=list).encode())
+
+    @staticmethod
+    def row(vm):
+        """The listing representation of an inventory summary."""
+        state_string = vm['state']
+        return {
+            "name": vm['name'],
+            "status": state_string,
+            "icon": "🟢" if state_string == "Running" else ("⏸️" if state_string == "Paused" else "⚫"),
+            "vcpu": vm['vcpu'],
+            "memory_mb": int(vm['memory_kb'] / 1024),  # Convert KB to MB
+            "uuid": vm['uuid'],
+        }
+
+    def _matches(self, row):
+        if self.states is not None and _state_token(row['status']) not in self.states:
+            return False
+        if self.name_prefix is not None and not row['name'].startswith(self.name_prefix):
+            return False
+        if self.min_memory_mb is not None and row['memory_mb'] < self.min_memory_mb:
+            return False
+        if self.max_memory_mb is not None and row['memory_mb'] > self.max_memory_mb:
+            return False
+        if self.min_vcpu is not None and row['vcpu'] < self.min_vcpu:
+            return False
+        if self.max_vcpu is not None and row['vcpu'] > self.max_vcpu:
+            return False
+        return True
+
+    def _key(self, row):
+        # uuid breaks ties so the order (and the cursor) is total
+        value = row['status'] if self.field == 'state' else row[self.field]
+        return (value, row['uuid'])
+
+    def apply(self, inventory):
+        """
+        Runs the query over inventory summaries.
+        Returns (rows, total, next_cursor); total counts all matches, not just this page.
+        """
+        rows = [row for row in map(self.row, inventory) if self._matches(row)]
+        rows.sort(key=self._key, reverse=self.descending)
+        total = len(rows)
+        if self.after is not None:
+            if self.descending:
+                rows = [row for row in rows if self._key(row) < self.after]
+            else:
+                rows = [row for row in rows if self._key(row) > self.after]
+        next_cursor = None
+        if self.limit is not None and len(rows) > self.limit:
+            rows = rows[:self.limit]
+            next_cursor = encode_cursor(self.sort, list(self._key(rows[-1])))
+        return rows, total, next_cursor
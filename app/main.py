@@ -1,14 +1,199 @@
 # src/main.py
 
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request
+import json
 import os
-from app.core.libvirt_manager import LibvirtManager
+import sys
+import time
+from app.core.config_manager import ConfigManager
+from app.core.domain_builder import VMProfile, metadata_xml
+from app.core.fleet import FleetManager
+from app.core.guest_agent import GuestAgentCollector
+from app.core.instrumentation import RPCStats, begin_trace, end_trace
+from app.core.jobs import JobManager
+from app.core.libvirt_manager import LibvirtManager, format_version
+from app.core.metrics_sampler import MetricsSampler
+from app.core.migration import MigrationEngine
+from app.core.provisioning import ProvisioningPipeline
+from app.core.scheduler import HostState, PlacementScheduler, POLICIES, SchedulingError
+from app.core.timeseries import TimeSeriesStore
+from app.core.vm_query import VMQuery
 
 app = Flask(__name__,
             template_folder=os.path.join(os.path.dirname(__file__), 'web/templates'),
             static_folder=os.path.join(os.path.dirname(__file__), 'web/static'))
 
-libvirt_manager = LibvirtManager()
+# Counts and times every libvirt call, per method and per request (served at
+# /metrics); GRENADE_RPC_STATS=0 turns it off.
+rpc_stats = RPCStats() if os.environ.get('GRENADE_RPC_STATS', '1') != '0' else None
+# A request calling one libvirt method this many times is logged as a likely N+1 loop
+RPC_REPEAT_WARN = int(os.environ.get('GRENADE_RPC_REPEAT_WARN', 50))
+
+# Each worker process keeps a bounded pool of libvirt connections; every API
+# request checks one out for its thread (see before/teardown hooks below).
+libvirt_manager = LibvirtManager(os.environ.get('GRENADE_LIBVIRT_URI', 'qemu:///system'),
+                                 pool_size=int(os.environ.get('GRENADE_POOL_SIZE', 4)),
+                                 rpc_stats=rpc_stats)
+
+# Lifecycle actions run here instead of inside the HTTP request; each job checks
+# out its own pooled connection and actions on the same VM are serialized.
+job_manager = JobManager(max_workers=int(os.environ.get('GRENADE_JOB_WORKERS', 8)),
+                         context=libvirt_manager.connection)
+
+# One shared sampler feeds every metrics stream, however many clients are connected
+metrics_sampler = MetricsSampler(libvirt_manager,
+                                 interval=float(os.environ.get('GRENADE_SAMPLE_INTERVAL', 2.0)))
+
+# Bounded per-VM metrics history, fed by the sampler on every tick (see start_background)
+metrics_history = TimeSeriesStore(max_vms=int(os.environ.get('GRENADE_HISTORY_MAX_VMS', 1000)))
+
+# Guest IPs, OS info and filesystem usage from qemu-guest-agent, polled in the
+# background for all running VMs; GRENADE_AGENT_INTERVAL=0 turns it off.
+GUEST_AGENT_INTERVAL = float(os.environ.get('GRENADE_AGENT_INTERVAL', 30.0))
+guest_agent = GuestAgentCollector(libvirt_manager, interval=GUEST_AGENT_INTERVAL or 30.0,
+                                  max_interval=float(os.environ.get('GRENADE_AGENT_MAX_INTERVAL', 300.0)),
+                                  timeout=float(os.environ.get('GRENADE_AGENT_TIMEOUT', 5.0)),
+                                  workers=int(os.environ.get('GRENADE_AGENT_WORKERS', 8)))
+
+def start_background():
+    """
+    Starts the background work: the metrics sampler feeding metrics_history and
+    the guest agent collector. Nothing runs on import; the server entry points
+    call this (__main__ below, the ASGI lifespan, and gunicorn.conf.py's
+    post_worker_init hook for each gunicorn worker). Safe to call more than once.
+    """
+    metrics_sampler.add_listener(metrics_history.ingest_samples)
+    if GUEST_AGENT_INTERVAL > 0:
+        libvirt_manager.guest_agent = guest_agent
+        guest_agent.start()
+
+def stop_background():
+    """Stops what start_background() started."""
+    metrics_sampler.remove_listener(metrics_history.ingest_samples)
+    if libvirt_manager.guest_agent is not None:
+        guest_agent.stop()
+        libvirt_manager.guest_agent = None
+
+# Compiled once; /api/vm/create only substitutes per-VM values.
+# The emulator is left to libvirt unless GRENADE_QEMU_EMULATOR is set.
+DEFAULT_PROFILE = VMProfile(emulator=os.environ.get('GRENADE_QEMU_EMULATOR'))
+
+config_manager = ConfigManager()
+provisioning = ProvisioningPipeline(max_workers=int(os.environ.get('GRENADE_PROVISION_WORKERS', 16)))
+# Upper bound for VMs per provisioning request
+PROVISION_MAX_COUNT = int(os.environ.get('GRENADE_PROVISION_MAX', 1000))
+
+# Other hypervisor nodes, queried concurrently. The local manager is host 'local';
+# remote hosts come from the 'fleet_hosts' config ({name: uri}) and
+# GRENADE_FLEET_HOSTS ("name=uri,name=uri").
+fleet = FleetManager(timeout=float(os.environ.get('GRENADE_FLEET_TIMEOUT', 10.0)),
+                     manager_factory=lambda uri: LibvirtManager(uri, rpc_stats=rpc_stats))
+
+# Host/NUMA placement for new VMs ('binpack' consolidates, 'spread' balances)
+scheduler = PlacementScheduler(policy=os.environ.get('GRENADE_PLACEMENT_POLICY', 'binpack'),
+                               cpu_ratio=float(os.environ.get('GRENADE_CPU_OVERCOMMIT', 4.0)))
+
+# Live migrations between fleet hosts: a few at a time per host, optionally
+# sharing a per-host network budget (MiB/s)
+migration_engine = MigrationEngine(
+    fleet, max_per_host=int(os.environ.get('GRENADE_MIGRATIONS_PER_HOST', 2)),
+    host_bandwidth_mib=int(os.environ['GRENADE_MIGRATION_BANDWIDTH_MIB'])
+    if os.environ.get('GRENADE_MIGRATION_BANDWIDTH_MIB') else None)
+
+def configure_fleet():
+    fleet.add_host('local', manager=libvirt_manager)
+    for name, uri in config_manager.get('fleet_hosts', {}).items():
+        fleet.add_host(name, uri)
+    for entry in filter(None, os.environ.get('GRENADE_FLEET_HOSTS', '').split(',')):
+        name, _, uri = entry.partition('=')
+        fleet.add_host(name.strip(), uri.strip())
+
+configure_fleet()
+
+def get_profile(name):
+    """Returns the stored VMProfile called `name` ('default' falls back to DEFAULT_PROFILE), or None."""
+    data = config_manager.get('profiles', {}).get(name)
+    if data is not None:
+        return VMProfile.from_dict(data)
+    return DEFAULT_PROFILE if name == 'default' else None
+
+@app.before_request
+def begin_request_trace():
+    """Starts recording the libvirt calls this request makes."""
+    if rpc_stats is not None:
+        begin_trace()
+
+@app.before_request
+def checkout_libvirt_connection():
+    """Pins a pooled libvirt connection to the request thread for API calls."""
+    if request.path.startswith('/api/'):
+        libvirt_manager.checkout()
+
+@app.teardown_request
+def release_libvirt_connection(exc):
+    """Returns the request thread's libvirt connection to the pool."""
+    libvirt_manager.release()
+
+def report_trace(trace, response_headers, endpoint, method, status, path, debug=False):
+    """
+    Records a finished request trace in rpc_stats and adds its headers:
+    X-Libvirt-Calls (count) and Server-Timing always, X-Libvirt-Call-Methods
+    (calls per method) with `debug`. Logs methods called RPC_REPEAT_WARN times.
+    """
+    rpc_stats.record_request(endpoint, method, status, trace.elapsed(), trace.calls)
+    response_headers['X-Libvirt-Calls'] = str(trace.calls)
+    response_headers['Server-Timing'] = trace.server_timing()
+    if debug:
+        response_headers['X-Libvirt-Call-Methods'] = trace.breakdown()
+    repeated = trace.repeated(RPC_REPEAT_WARN)
+    if repeated:
+        calls = ', '.join(f"{name} x{count}" for name, count in sorted(repeated.items()))
+        print(f"{method} {path} called {calls} (possible N+1 loop)", file=sys.stderr)
+
+@app.after_request
+def finish_request_trace(response):
+    """
+    Reports the request's libvirt calls (see report_trace); the per-method
+    header is sent in debug mode or when the request has X-Debug-Libvirt: 1.
+    Calls made while a streamed body is generated happen after the headers
+    are sent and are not included.
+    """
+    trace = end_trace()
+    if trace is not None:
+        report_trace(trace, response.headers, request.url_rule.rule if request.url_rule else 'unmatched',
+                     request.method, response.status_code, request.path,
+                     debug=app.debug or request.headers.get('X-Debug-Libvirt') == '1')
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint: libvirt call and HTTP request counters, pool and job gauges."""
+    if rpc_stats is None:
+        return jsonify({"error": "RPC statistics are disabled"}), 404
+    gauges = {}
+    pool = libvirt_manager.pool_metrics()
+    if pool is not None:
+        gauges['grenade_libvirt_pool_connections'] = (
+            "Pooled libvirt connections by state.", {'in_use': pool['in_use'], 'idle': pool['idle']}, 'state')
+        gauges['grenade_libvirt_pool_waiting'] = ("Threads waiting for a pooled connection.", pool['waiting'])
+    jobs = job_manager.stats()
+    gauges['grenade_jobs'] = ("Jobs queued or running.",
+                              {'queued': jobs['queued'], 'running': jobs['running']}, 'status')
+    if libvirt_manager.guest_agent is not None:
+        agent = guest_agent.stats()
+        gauges['grenade_guest_agent_polls'] = ("Guest agent polls by outcome since start.",
+                                               {'ok': agent['polls'] - agent['failures'], 'failed': agent['failures'],
+                                                'timeout': agent['timeouts']}, 'outcome')
+        gauges['grenade_guest_agent_vms'] = ("Running VMs tracked by the guest agent collector, and those with data.",
+                                             {'tracked': agent['tracked'], 'cached': agent['cached']}, 'state')
+    return Response(rpc_stats.prometheus(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/metrics/libvirt')
+def get_libvirt_call_metrics():
+    """Returns libvirt calls per method and per endpoint, busiest first (same data as /metrics)."""
+    if rpc_stats is None:
+        return jsonify({"error": "RPC statistics are disabled"}), 404
+    return jsonify({"methods": rpc_stats.methods(), "endpoints": rpc_stats.endpoints()})
 
 @app.route('/')
 def index():
@@ -22,68 +207,859 @@ def get_status():
     status = "Connected" if connected else "Disconnected"
     return jsonify({"libvirt_status": status, "connected": connected})
 
+@app.route('/api/metrics/pool')
+def get_pool_metrics():
+    """Returns libvirt connection pool size, wait time and checkout latency metrics."""
+    metrics = libvirt_manager.pool_metrics()
+    if metrics is None:
+        return jsonify({"error": "Connection pooling is disabled"}), 404
+    return jsonify(metrics)
+
 @app.route('/api/vms')
 def get_vms():
-    """Returns a list of all virtual machines (active and inactive) with basic details."""
+    """
+    Returns virtual machines (active and inactive) with basic details.
+    Query: state (repeatable or comma-separated), name_prefix, min/max_memory_mb,
+    min/max_vcpu, sort (name|state|vcpu|memory_mb|uuid, '-' for descending),
+    limit and cursor (the next_cursor of the previous page).
+    While the inventory cache is live the response carries an ETag derived from
+    its generation, and a matching If-None-Match gets an empty 304.
+    """
     if not libvirt_manager.is_connected():
         return jsonify({"error": "Not connected to libvirt"}), 500
-
-    all_vms = []
     try:
-        # Get all domains (active and inactive)
-        domains = libvirt_manager.conn.listAllDomains(libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE | libvirt.VIR_CONNECT_LIST_DOMAINS_INACTIVE)
-        
-        for dom in domains:
-            state_code, _ = dom.state()
-            state_string = libvirt_manager._get_vm_state_string(state_code)
-            all_vms.append({
-                "name": dom.name(),
-                "status": state_string,
-                "icon": "🟢" if state_string == "Running" else ("⏸️" if state_string == "Paused" else "⚫"),
-                # You can add more simple details here without parsing XML heavily
-                "vcpu": dom.info().nrVirtCpu,
-                "memory_mb": int(dom.info().memory / 1024), # Convert KB to MB
-                "uuid": dom.UUIDString()
-            })
-    except Exception as e:
-        return jsonify({"error": f"Failed to retrieve VMs: {e}"}), 500
-    
-    return jsonify({"vms": all_vms})
+        query = VMQuery.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Read the generation before the list: a change in between only costs one extra full reply
+    etag = None
+    if libvirt_manager.inventory.is_ready():
+        etag = f"g{libvirt_manager.inventory.generation}-{query.fingerprint()}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+    # Served from the event-driven inventory cache; one bulk stats RPC if it is not ready
+    inventory = libvirt_manager.list_vms()
+    if inventory is None:
+        return jsonify({"error": "Failed to retrieve VMs. Check logs for details."}), 500
+
+    vms, total, next_cursor = query.apply(inventory)
+    response = jsonify({"vms": vms, "total": total, "next_cursor": next_cursor})
+    if etag is not None:
+        response.set_etag(etag)
+        # Let browsers revalidate every time instead of serving a stale list
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# action -> (LibvirtManager method, success message, failure message)
+VM_ACTIONS = {
+    'start': ('start_vm', 'started successfully', 'failed to start'),
+    'stop': ('stop_vm', 'shutting down gracefully', 'failed to shut down gracefully'),
+    'destroy': ('destroy_vm', 'forcefully powered off', 'failed to power off'),
+    'suspend': ('suspend_vm', 'suspended', 'failed to suspend'),
+    'resume': ('resume_vm', 'resumed', 'failed to resume'),
+    'delete': ('delete_vm', 'deleted', 'failed to delete'),
+}
+
+def run_vm_action(name, action, job=None):
+    """Runs one lifecycle action; used as a job body. Returns True on success."""
+    method, ok_text, fail_text = VM_ACTIONS[action]
+    success = getattr(libvirt_manager, method)(name)
+    if job is not None:
+        job.message = f"VM '{name}' {ok_text if success else fail_text}."
+    return success
 
 @app.route('/api/vm/<name>/<action>', methods=['POST'])
 def vm_action(name, action):
-    """Performs an action (start/stop/destroy/suspend/resume) on a specific VM."""
+    """
+    Queues an action (start/stop/destroy/suspend/resume/delete) on a specific VM.
+    Returns 202 with a job id right away; poll /api/jobs/<id> for the outcome.
+    """
+    if action not in VM_ACTIONS:
+        return jsonify({"error": "Invalid action"}), 400
     if not libvirt_manager.is_connected():
         return jsonify({"error": "Not connected to libvirt"}), 500
 
-    success = False
-    message = ""
-
-    if action == 'start':
-        success = libvirt_manager.start_vm(name)
-        message = f"VM '{name}' {'started successfully' if success else 'failed to start'}."
-    elif action == 'stop':
-        success = libvirt_manager.stop_vm(name)
-        message = f"VM '{name}' {'shutting down gracefully' if success else 'failed to shut down gracefully'}."
-    elif action == 'destroy':
-        success = libvirt_manager.destroy_vm(name)
-        message = f"VM '{name}' {'forcefully powered off' if success else 'failed to power off'}."
-    elif action == 'suspend':
-        success = libvirt_manager.suspend_vm(name)
-        message = f"VM '{name}' {'suspended' if success else 'failed to suspend'}."
-    elif action == 'resume':
-        success = libvirt_manager.resume_vm(name)
-        message = f"VM '{name}' {'resumed' if success else 'failed to resume'}."
-    elif action == 'delete':
-        success = libvirt_manager.delete_vm(name)
-        message = f"VM '{name}' {'deleted' if success else 'failed to delete'}."
-    else:
+    job = job_manager.submit(name, action, run_vm_action, args=(name, action), pass_job=True)
+    if job is None:
+        return jsonify({"error": "Too many pending jobs, try again later", "success": False}), 429
+    return jsonify({
+        "message": f"Action '{action}' on VM '{name}' queued.",
+        "success": True,
+        "job_id": job.id,
+        "status_url": f"/api/jobs/{job.id}",
+    }), 202
+
+# Upper bound for the per-request concurrency of batch actions
+BATCH_MAX_CONCURRENCY = int(os.environ.get('GRENADE_BATCH_MAX_CONCURRENCY', 32))
+
+@app.route('/api/vms/batch', methods=['POST'])
+def batch_vm_action():
+    """
+    Runs one action on many VMs in parallel.
+    Body: {"action": "stop", "names": [...], "uuids": [...],
+           "selector": {"state": "Running", "name_prefix": "lab-", "tag": "web", "bridge": "virbr0"},
+           "concurrency": 8}
+    Streams one JSON line per VM as it completes (application/x-ndjson),
+    followed by a summary line.
+    """
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    if action not in VM_ACTIONS:
         return jsonify({"error": "Invalid action"}), 400
+    names = data.get('names') or []
+    uuids = data.get('uuids') or []
+    selector = data.get('selector') or {}
+    if not isinstance(names, list) or not isinstance(uuids, list) or not isinstance(selector, dict):
+        return jsonify({"error": "'names' and 'uuids' must be lists and 'selector' an object"}), 400
+    try:
+        concurrency = max(1, min(int(data.get('concurrency', 8)), BATCH_MAX_CONCURRENCY))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'concurrency' must be an integer"}), 400
+    if not libvirt_manager.is_connected():
+        return jsonify({"error": "Not connected to libvirt"}), 500
+
+    targets, missing = libvirt_manager.select_vms(names, uuids, selector)
+    if not targets and not missing:
+        return jsonify({"error": "No VMs matched the request"}), 400
+    method, ok_text, fail_text = VM_ACTIONS[action]
+
+    def generate():
+        succeeded = failed = 0
+        for target in missing:
+            failed += 1
+            yield json.dumps({"name": target, "action": action, "success": False,
+                              "message": f"VM '{target}' not found."}) + "\n"
+        for name, success in libvirt_manager.run_many(method, targets, concurrency):
+            if success:
+                succeeded += 1
+            else:
+                failed += 1
+            yield json.dumps({"name": name, "action": action, "success": success,
+                              "message": f"VM '{name}' {ok_text if success else fail_text}."}) + "\n"
+        yield json.dumps({"done": True, "action": action, "total": succeeded + failed,
+                          "succeeded": succeeded, "failed": failed}) + "\n"
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/api/jobs')
+def list_jobs():
+    """Lists recent jobs, newest first. Optional ?status= and ?limit= filters."""
+    status = request.args.get('status')
+    limit = request.args.get('limit', 100, type=int)
+    return jsonify({
+        "jobs": [job.to_dict() for job in job_manager.list(status, limit)],
+        "stats": job_manager.stats(),
+    })
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """Returns the status, progress and outcome of a job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/stream/metrics')
+def stream_metrics():
+    """
+    Server-Sent Events stream of per-VM metrics (CPU %, memory, net/disk bytes/s).
+    The first event is a full snapshot; later events carry only changed values.
+    """
+    subscription = metrics_sampler.subscribe()
+
+    def generate():
+        try:
+            while True:
+                message = subscription.get(timeout=15)
+                if message is None:
+                    yield ": keepalive\n\n" # Keeps proxies from closing an idle stream
+                    continue
+                yield f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+        finally:
+            subscription.close()
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/vms/<name>')
+def get_vm_details(name):
+    """Returns detailed information about a VM (devices, CPU pinning, memory backing)."""
+    if not libvirt_manager.is_connected():
+        return jsonify({"error": "Not connected to libvirt"}), 500
+    details = libvirt_manager.get_vm_details(name)
+    if details is None:
+        return jsonify({"error": f"VM '{name}' not found"}), 404
+    return jsonify(details)
+
+@app.route('/api/vms/<name>/metrics')
+def get_vm_metrics(name):
+    """
+    Returns metric history for a VM.
+    Query: from/to (epoch seconds, default the last hour), step (seconds),
+    metric (repeatable, default all).
+    """
+    vm = libvirt_manager.find_vm(name)
+    if vm is None:
+        return jsonify({"error": f"VM '{name}' not found"}), 404
+    end = request.args.get('to', time.time(), type=float)
+    start = request.args.get('from', end - 3600, type=float)
+    step = request.args.get('step', type=int)
+    if start > end or (step is not None and step <= 0):
+        return jsonify({"error": "Invalid time range or step"}), 400
+    result = metrics_history.query(vm['uuid'], start, end, step, request.args.getlist('metric') or None)
+    if result is None:
+        return jsonify({"name": name, "uuid": vm['uuid'], "step": step, "series": {}})
+    return jsonify({"name": name, "uuid": vm['uuid'], "from": start, "to": end, **result})
+
+def _flag(value):
+    """Query-string boolean: 1/true/yes/on."""
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+def _queue_vm_job(name, action, func, kwargs, message):
+    job = job_manager.submit(name, action, func, args=(name,), kwargs=kwargs)
+    if job is None:
+        return jsonify({"error": "Too many pending jobs, try again later", "success": False}), 429
+    return jsonify({
+        "message": message,
+        "success": True,
+        "job_id": job.id,
+        "status_url": f"/api/jobs/{job.id}",
+    }), 202
+
+def _external_snapshot_conflict(names, snapshot, action):
+    """
+    A 409 response if `snapshot` is external on any of `names` and this
+    libvirt can't `action` ('revert'/'delete') external snapshots, else None.
+    """
+    blocked = libvirt_manager.unsupported_snapshot_vms(names, snapshot, action)
+    if not blocked:
+        return None
+    required = (LibvirtManager.EXTERNAL_SNAPSHOT_REVERT_VERSION if action == 'revert'
+                else LibvirtManager.EXTERNAL_SNAPSHOT_DELETE_VERSION)
+    hint = " Delete it with metadata_only=1 to keep the disks and forget the snapshot." if action == 'delete' else ""
+    return jsonify({
+        "error": f"Snapshot '{snapshot}' is external (disk-only) and libvirt "
+                 f"{format_version(libvirt_manager.libvirt_version())} can only {action} external snapshots "
+                 f"from {format_version(required)}.{hint}",
+        "vms": blocked,
+    }), 409
 
-    if success:
-        return jsonify({"message": message, "success": True})
+@app.route('/api/vms/<name>/snapshots')
+def list_vm_snapshots(name):
+    """
+    Lists a VM's snapshots, oldest first. Query: tree=1 nests them by parent,
+    refresh=1 bypasses the snapshot cache.
+    """
+    if not libvirt_manager.is_connected():
+        return jsonify({"error": "Not connected to libvirt"}), 500
+    refresh = _flag(request.args.get('refresh'))
+    if _flag(request.args.get('tree')):
+        snapshots = libvirt_manager.get_snapshot_tree(name, refresh)
     else:
-        return jsonify({"message": message, "success": False}), 500
+        snapshots = libvirt_manager.list_snapshots(name, refresh)
+    if snapshots is None:
+        return jsonify({"error": f"Snapshots of VM '{name}' not available"}), 404
+    return jsonify({"name": name, "snapshots": snapshots})
+
+@app.route('/api/vms/<name>/snapshots', methods=['POST'])
+def create_vm_snapshot(name):
+    """
+    Queues a snapshot of a VM.
+    Body: {"name": "before-upgrade", "description": "", "disk_only": false, "quiesce": null}
+    """
+    data = request.get_json(silent=True) or {}
+    if not libvirt_manager.is_connected():
+        return jsonify({"error": "Not connected to libvirt"}), 500
+    kwargs = {'snapshot_name': data.get('name'), 'description': data.get('description', ''),
+              'disk_only': bool(data.get('disk_only', False)), 'quiesce': data.get('quiesce')}
+    return _queue_vm_job(name, 'snapshot', libvirt_manager.create_snapshot, kwargs,
+                         f"Snapshot of VM '{name}' queued.")
+
+@app.route('/api/vms/<name>/snapshots/<snapshot>/revert', methods=['POST'])
+def revert_vm_snapshot(name, snapshot):
+    """Queues a revert to a snapshot. Body: {"running": true|false|null}."""
+    data = request.get_json(silent=True) or {}
+    if not libvirt_manager.is_connected():
+        return jsonify({"error": "Not connected to libvirt"}), 500
+    conflict = _external_snapshot_conflict([name], snapshot, 'revert')
+    if conflict is not None:
+        return conflict
+    return _queue_vm_job(name, 'revert', libvirt_manager.revert_snapshot,
+                         {'snapshot_name': snapshot, 'running': data.get('running')},
+                         f"Revert of VM '{name}' to '{snapshot}' queued.")
+
+@app.route('/api/vms/<name>/snapshots/<snapshot>', methods=['DELETE'])
+def delete_vm_snapshot(name, snapshot):
+    """Queues a snapshot deletion. Query: children=1, metadata_only=1."""
+    if not libvirt_manager.is_connected():
+        return jsonify({"error": "Not connected to libvirt"}), 500
+    metadata_only = _flag(request.args.get('metadata_only'))
+    if not metadata_only:
+        conflict = _external_snapshot_conflict([name], snapshot, 'delete')
+        if conflict is not None:
+            return conflict
+    return _queue_vm_job(name, 'delete_snapshot', libvirt_manager.delete_snapshot,
+                         {'snapshot_name': snapshot,
+                          'children': _flag(request.args.get('children')),
+                          'metadata_only': metadata_only},
+                         f"Deletion of snapshot '{snapshot}' of VM '{name}' queued.")
+
+@app.route('/api/vms/snapshots/batch', methods=['POST'])
+def batch_snapshot_action():
+    """
+    Snapshots, reverts or deletes a same-named snapshot on many VMs in parallel,
+    e.g. a whole test lab.
+    Body: {"action": "create" | "revert" | "delete", "snapshot": "baseline",
+           "names": [...], "uuids": [...], "selector": {...}, "concurrency": 8,
+           "description": "", "disk_only": null, "quiesce": null, "running": null,
+           "children": false, "metadata_only": false}
+    disk_only=null takes disk-only snapshots only where libvirt can revert them
+    (9.9+) and internal ones otherwise, so the batch can always be rolled back.
+    A revert or delete that libvirt can't do on external snapshots is refused
+    with 409 before any VM is touched.
+    Streams one JSON line per VM as it completes, then a summary line.
+    """
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    snapshot = data.get('snapshot')
+    if action not in ('create', 'revert', 'delete'):
+        return jsonify({"error": "action must be create, revert or delete"}), 400
+    if not snapshot and action != 'create':
+        return jsonify({"error": "snapshot is required"}), 400
+    names = data.get('names') or []
+    uuids = data.get('uuids') or []
+    selector = data.get('selector') or {}
+    if not isinstance(names, list) or not isinstance(uuids, list) or not isinstance(selector, dict):
+        return jsonify({"error": "'names' and 'uuids' must be lists and 'selector' an object"}), 400
+    try:
+        concurrency = max(1, min(int(data.get('concurrency', 8)), BATCH_MAX_CONCURRENCY))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'concurrency' must be an integer"}), 400
+    if not libvirt_manager.is_connected():
+        return jsonify({"error": "Not connected to libvirt"}), 500
+
+    targets, missing = libvirt_manager.select_vms(names, uuids, selector)
+    if not targets and not missing:
+        return jsonify({"error": "No VMs matched the request"}), 400
+    if action == 'create':
+        # One name across the batch, so the lab can be rolled back as a unit
+        snapshot = snapshot or time.strftime('snap-%Y%m%d-%H%M%S')
+        disk_only = data.get('disk_only')
+        if disk_only is None:
+            disk_only = libvirt_manager.external_snapshot_support()['revert']
+        method, kwargs = 'create_snapshot', {
+            'snapshot_name': snapshot, 'description': data.get('description', ''),
+            'disk_only': bool(disk_only), 'quiesce': data.get('quiesce')}
+    elif action == 'revert':
+        conflict = _external_snapshot_conflict(targets, snapshot, 'revert')
+        if conflict is not None:
+            return conflict
+        method, kwargs = 'revert_snapshot', {'snapshot_name': snapshot, 'running': data.get('running')}
+    else:
+        metadata_only = bool(data.get('metadata_only', False))
+        conflict = None if metadata_only else _external_snapshot_conflict(targets, snapshot, 'delete')
+        if conflict is not None:
+            return conflict
+        method, kwargs = 'delete_snapshot', {'snapshot_name': snapshot, 'metadata_only': metadata_only,
+                                             'children': bool(data.get('children', False))}
+
+    def generate():
+        succeeded = failed = 0
+        for target in missing:
+            failed += 1
+            yield json.dumps({"name": target, "action": action, "success": False,
+                              "message": f"VM '{target}' not found."}) + "\n"
+        for name, result in libvirt_manager.run_many(method, targets, concurrency, **kwargs):
+            line = {"name": name, "action": action, "snapshot": snapshot, "success": bool(result)}
+            if isinstance(result, dict):
+                line["quiesced"] = result.get('quiesced')
+            if result:
+                succeeded += 1
+            else:
+                failed += 1
+            yield json.dumps(line) + "\n"
+        yield json.dumps({"done": True, "action": action, "snapshot": snapshot,
+                          "total": succeeded + failed, "succeeded": succeeded, "failed": failed}) + "\n"
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/api/vms/<name>/clone', methods=['POST'])
+def clone_vm(name):
+    """
+    Clones a shut-off VM as a background job: linked clones (qcow2 overlays on
+    the source's disks) by default, full copies with "full_copy": true.
+    Body: {"names": ["web-01", ...]} or {"count": 100, "name_pattern": "web-{index:03d}",
+           "start_index": 1}, plus "full_copy", "start", "concurrency".
+    Returns 202 with a job id; the job result lists succeeded and failed clones.
+    """
+    data = request.get_json(silent=True) or {}
+    names = data.get('names')
+    try:
+        concurrency = max(1, min(int(data.get('concurrency', provisioning.max_workers)), provisioning.max_workers))
+        if names is None:
+            count = int(data.get('count', 1))
+            start_index = int(data.get('start_index', 1))
+            if not 1 <= count <= PROVISION_MAX_COUNT:
+                return jsonify({"error": f"count must be between 1 and {PROVISION_MAX_COUNT}"}), 400
+            pattern = data.get('name_pattern', name + '-clone-{index:03d}')
+            names = [pattern.format(index=i) for i in range(start_index, start_index + count)]
+    except (TypeError, ValueError):
+        return jsonify({"error": "count, start_index and concurrency must be integers"}), 400
+    except (KeyError, IndexError) as e:
+        return jsonify({"error": f"Invalid name_pattern: {e}"}), 400
+    if not isinstance(names, list) or not names or len(names) > PROVISION_MAX_COUNT:
+        return jsonify({"error": f"names must be a list of 1 to {PROVISION_MAX_COUNT} names"}), 400
+    if len(set(names)) != len(names):
+        return jsonify({"error": "Clone names must be unique (use {index} in name_pattern)"}), 400
+    if not libvirt_manager.is_connected():
+        return jsonify({"error": "Not connected to libvirt"}), 500
+    known = {vm['name'] for vm in libvirt_manager.list_vms() or []}
+    if name not in known:
+        return jsonify({"error": f"VM '{name}' not found"}), 404
+    existing = [n for n in names if n in known]
+    if existing:
+        return jsonify({"error": f"VMs already exist: {', '.join(existing[:10])}"}), 409
+
+    def run(job=None):
+        return libvirt_manager.clone_many(name, names, full_copy=bool(data.get('full_copy', False)),
+                                          start=bool(data.get('start', False)),
+                                          concurrency=concurrency, job=job)
+
+    # Keyed on the source, so clones never overlap another action on it
+    job = job_manager.submit(name, 'clone', run, target=f"{len(names)} x {name}", pass_job=True)
+    if job is None:
+        return jsonify({"error": "Too many pending jobs, try again later", "success": False}), 429
+    return jsonify({
+        "message": f"Cloning {len(names)} VMs from '{name}' queued.",
+        "success": True,
+        "job_id": job.id,
+        "status_url": f"/api/jobs/{job.id}",
+    }), 202
+
+@app.route('/api/profiles')
+def list_profiles():
+    """Lists stored VM profiles."""
+    profiles = dict(config_manager.get('profiles', {}))
+    profiles.setdefault('default', DEFAULT_PROFILE.to_dict())
+    return jsonify({"profiles": profiles})
+
+@app.route('/api/profiles', methods=['POST'])
+def save_profile():
+    """Validates and stores a VM profile (body: profile fields including 'name')."""
+    data = request.get_json(silent=True) or {}
+    if not data.get('name'):
+        return jsonify({"error": "Profile name is required"}), 400
+    try:
+        profile = VMProfile.from_dict(data)
+    except (TypeError, ValueError, KeyError) as e:
+        return jsonify({"error": f"Invalid profile: {e}"}), 400
+    profiles = dict(config_manager.get('profiles', {}))
+    profiles[profile.name] = profile.to_dict()
+    config_manager.set('profiles', profiles)
+    return jsonify({"message": f"Profile '{profile.name}' saved.", "success": True})
+
+@app.route('/api/vms/provision', methods=['POST'])
+def provision_vms():
+    """
+    Provisions `count` VMs from a profile as a background job.
+    Body: {"count": 200, "profile": "lab" | {...inline profile...},
+           "name_pattern": "lab-{index:03d}", "start_index": 1, "pool": "default",
+           "base_image": "golden.qcow2", "full_copy": false, "disk_size_gb": 10,
+           "start": true, "concurrency": 16, "tags": ["lab", "team-a"],
+           "placement": "binpack" | "spread"}
+    Returns 202 with a job id; the job result lists succeeded and failed VMs.
+    """
+    data = request.get_json(silent=True) or {}
+    profile_spec = data.get('profile', 'default')
+    if isinstance(profile_spec, dict):
+        try:
+            profile = VMProfile.from_dict(profile_spec)
+        except (TypeError, ValueError, KeyError) as e:
+            return jsonify({"error": f"Invalid profile: {e}"}), 400
+    else:
+        profile = get_profile(profile_spec)
+        if profile is None:
+            return jsonify({"error": f"Profile '{profile_spec}' not found"}), 404
+
+    try:
+        count = int(data.get('count', 1))
+        start_index = int(data.get('start_index', 1))
+        concurrency = int(data.get('concurrency', provisioning.max_workers))
+        disk_size_gb = int(data.get('disk_size_gb', 10))
+    except (TypeError, ValueError):
+        return jsonify({"error": "count, start_index, concurrency and disk_size_gb must be integers"}), 400
+    if not 1 <= count <= PROVISION_MAX_COUNT:
+        return jsonify({"error": f"count must be between 1 and {PROVISION_MAX_COUNT}"}), 400
+
+    pattern = data.get('name_pattern', profile.name + '-{index:03d}')
+    try:
+        names = [pattern.format(index=i) for i in range(start_index, start_index + count)]
+    except (KeyError, IndexError, ValueError) as e:
+        return jsonify({"error": f"Invalid name_pattern: {e}"}), 400
+    if len(set(names)) != len(names):
+        return jsonify({"error": "name_pattern must produce unique names (use {index})"}), 400
+    if not libvirt_manager.is_connected():
+        return jsonify({"error": "Not connected to libvirt"}), 500
+    known = {vm['name'] for vm in libvirt_manager.list_vms() or []}
+    existing = [name for name in names if name in known]
+    if existing:
+        return jsonify({"error": f"VMs already exist: {', '.join(existing[:10])}"}), 409
+
+    pool_name = data.get('pool', 'default')
+    tags = data.get('tags') or []
+    if not isinstance(tags, list):
+        return jsonify({"error": "tags must be a list"}), 400
+
+    # Optional NUMA placement on this host, decided up front for the whole batch
+    render_args = None
+    policy = data.get('placement')
+    if policy:
+        if policy not in POLICIES:
+            return jsonify({"error": f"placement must be one of {', '.join(POLICIES)}"}), 400
+        host = HostState.collect('local', libvirt_manager)
+        if host is None:
+            return jsonify({"error": "Failed to read host topology"}), 500
+        placements = scheduler.place_many([(profile.vcpu, profile.memory_mb)] * count, [host], policy)
+        unplaced = sum(1 for p in placements if isinstance(p, SchedulingError))
+        if unplaced:
+            return jsonify({"error": f"{unplaced} of {count} VMs don't fit on this host"}), 409
+        render_args = {name: p.render_args() for name, p in zip(names, placements)}
+
+    def run(job=None):
+        # Runs on a job thread with its own checked-out connection
+        try:
+            return provisioning.run(libvirt_manager.conn, profile, names,
+                                    pool_name=pool_name,
+                                    base_image=data.get('base_image'),
+                                    full_copy=bool(data.get('full_copy', False)),
+                                    disk_size_gb=disk_size_gb,
+                                    start=bool(data.get('start', False)),
+                                    concurrency=concurrency, job=job,
+                                    metadata=metadata_xml(tags),
+                                    render_args=render_args)
+        finally:
+            # Volume creation fires no storage event; pick up the new disks
+            if libvirt_manager.storage.is_loaded():
+                libvirt_manager.refresh_storage_pool(pool_name)
+
+    job = job_manager.submit(f"provision:{names[0]}", 'provision', run,
+                             target=f"{count} x {profile.name}", pass_job=True)
+    if job is None:
+        return jsonify({"error": "Too many pending jobs, try again later", "success": False}), 429
+    return jsonify({
+        "message": f"Provisioning {count} VMs queued.",
+        "success": True,
+        "job_id": job.id,
+        "status_url": f"/api/jobs/{job.id}",
+    }), 202
+
+def _gb(size_bytes):
+    return round(size_bytes / (1024 ** 3), 2)
+
+def _volume_json(vol):
+    vol = dict(vol)
+    vol['capacity_gb'] = _gb(vol['capacity'])
+    vol['allocation_gb'] = _gb(vol['allocation'])
+    return vol
+
+@app.route('/api/storage/pools')
+def list_storage_pools():
+    """Lists storage pools with capacity and usage."""
+    index = libvirt_manager.get_storage_index()
+    if index is None:
+        return jsonify({"error": "Not connected to libvirt"}), 500
+    pools = []
+    for pool in index.pools():
+        pools.append({
+            "name": pool['name'],
+            "uuid": pool['uuid'],
+            "type": pool['type'],
+            "status": pool['state'],
+            "active": pool['active'],
+            "path": pool['path'],
+            "capacity_gb": _gb(pool['capacity']),
+            "used_gb": _gb(pool['allocation']),
+            "available_gb": _gb(pool['available']),
+            "volume_count": len(index.volumes(pool['name'])),
+        })
+    return jsonify({"pools": pools})
+
+@app.route('/api/storage/pools/<name>/volumes')
+def list_pool_volumes(name):
+    """Lists volumes of one pool with format, backing file and the VMs using them."""
+    index = libvirt_manager.get_storage_index()
+    if index is None:
+        return jsonify({"error": "Not connected to libvirt"}), 500
+    if not any(pool['name'] == name for pool in index.pools()):
+        return jsonify({"error": f"Storage pool '{name}' not found"}), 404
+    return jsonify({"pool": name, "volumes": [_volume_json(v) for v in index.volumes(name)]})
+
+@app.route('/api/storage/pools/<name>/refresh', methods=['POST'])
+def refresh_storage_pool(name):
+    """Re-reads every volume of a pool (fresh allocation figures)."""
+    if not libvirt_manager.refresh_storage_pool(name, full=True):
+        return jsonify({"error": f"Failed to refresh storage pool '{name}'", "success": False}), 500
+    return jsonify({"message": f"Storage pool '{name}' refreshed.", "success": True})
+
+@app.route('/api/storage/volumes/unattached')
+def list_unattached_volumes():
+    """Volumes no VM uses, directly or as a backing image. Query: pool."""
+    index = libvirt_manager.get_storage_index()
+    if index is None:
+        return jsonify({"error": "Not connected to libvirt"}), 500
+    vols = index.unattached_volumes(request.args.get('pool'))
+    return jsonify({"volumes": [_volume_json(v) for v in vols],
+                    "total_allocation_gb": _gb(sum(v['allocation'] for v in vols))})
+
+@app.route('/api/storage/volumes/largest')
+def list_largest_volumes():
+    """The biggest volumes. Query: limit (default 20), by=allocation|capacity."""
+    index = libvirt_manager.get_storage_index()
+    if index is None:
+        return jsonify({"error": "Not connected to libvirt"}), 500
+    limit = max(1, min(request.args.get('limit', 20, type=int), 1000))
+    by = request.args.get('by', 'allocation')
+    if by not in ('allocation', 'capacity'):
+        return jsonify({"error": "by must be 'allocation' or 'capacity'"}), 400
+    return jsonify({"volumes": [_volume_json(v) for v in index.largest_volumes(limit, by)]})
+
+@app.route('/api/storage/consumers')
+def list_storage_consumers():
+    """VMs using the most storage. Query: limit (default 20)."""
+    index = libvirt_manager.get_storage_index()
+    if index is None:
+        return jsonify({"error": "Not connected to libvirt"}), 500
+    limit = max(1, min(request.args.get('limit', 20, type=int), 1000))
+    consumers = index.largest_consumers(limit)
+    for entry in consumers:
+        entry['allocation_gb'] = _gb(entry['allocation'])
+        entry['capacity_gb'] = _gb(entry['capacity'])
+    return jsonify({"consumers": consumers})
+
+@app.route('/api/storage/volumes/chain')
+def get_backing_chain():
+    """Backing chain of a volume, top to base. Query: path."""
+    path = request.args.get('path')
+    if not path:
+        return jsonify({"error": "path is required"}), 400
+    index = libvirt_manager.get_storage_index()
+    if index is None:
+        return jsonify({"error": "Not connected to libvirt"}), 500
+    chain = index.backing_chain(path)
+    if not chain or 'pool' not in chain[0]:
+        return jsonify({"error": f"Volume '{path}' not found"}), 404
+    return jsonify({"chain": [_volume_json(v) if 'pool' in v else v for v in chain]})
+
+def _fleet_status(results):
+    return {name: result.to_dict() for name, result in sorted(results.items())}
+
+@app.route('/api/fleet/hosts')
+def list_fleet_hosts():
+    """Per-host capacity, allocation and reachability. Query: timeout (seconds)."""
+    per_host, totals, results = fleet.host_metrics(timeout=request.args.get('timeout', type=float))
+    hosts = []
+    for name in fleet.hosts():
+        manager = fleet.get_manager(name)
+        entry = {"name": name, "uri": manager.uri if manager else None}
+        entry.update(results[name].to_dict() if name in results else {})
+        entry["metrics"] = per_host.get(name)
+        hosts.append(entry)
+    return jsonify({"hosts": hosts, "totals": totals})
+
+@app.route('/api/fleet/hosts', methods=['POST'])
+def add_fleet_host():
+    """Adds a host. Body: {"name": "node1", "uri": "qemu+ssh://node1/system"}."""
+    data = request.get_json(silent=True) or {}
+    name, uri = data.get('name'), data.get('uri')
+    if not name or not uri:
+        return jsonify({"error": "name and uri are required"}), 400
+    if not fleet.add_host(name, uri):
+        return jsonify({"error": f"Host '{name}' already exists"}), 409
+    hosts = dict(config_manager.get('fleet_hosts', {}))
+    hosts[name] = uri
+    config_manager.set('fleet_hosts', hosts)
+    return jsonify({"message": f"Host '{name}' added.", "success": True}), 201
+
+@app.route('/api/fleet/hosts/<name>', methods=['DELETE'])
+def remove_fleet_host(name):
+    """Removes a configured host (the local host can't be removed)."""
+    if name == 'local':
+        return jsonify({"error": "The local host can't be removed"}), 400
+    if not fleet.remove_host(name):
+        return jsonify({"error": f"Host '{name}' not found"}), 404
+    hosts = dict(config_manager.get('fleet_hosts', {}))
+    if hosts.pop(name, None) is not None:
+        config_manager.set('fleet_hosts', hosts)
+    return jsonify({"message": f"Host '{name}' removed.", "success": True})
+
+@app.route('/api/fleet/vms')
+def list_fleet_vms():
+    """
+    VMs of every host, merged. Query: host (repeatable, default all), timeout (seconds).
+    Unreachable hosts are listed under 'hosts' with their error; the rest are returned.
+    """
+    vms, results = fleet.list_vms(hosts=request.args.getlist('host') or None,
+                                  timeout=request.args.get('timeout', type=float))
+    rows = [dict(VMQuery.row(vm), host=vm['host']) for vm in vms]
+    return jsonify({"vms": rows, "total": len(rows), "hosts": _fleet_status(results)})
+
+@app.route('/api/search')
+def search_vms():
+    """
+    Searches VMs on every fleet host by UUID, name prefix, MAC, guest IP, disk
+    path or tag. Query: q (optionally "field:value", field one of uuid, name,
+    mac, ip, disk, tag), limit (default 50), host (repeatable).
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    limit = max(1, min(request.args.get('limit', 50, type=int), 1000))
+    matches, results = fleet.search(query, limit, hosts=request.args.getlist('host') or None)
+    return jsonify({"query": query, "results": matches, "hosts": _fleet_status(results)})
+
+def collect_host_states(hosts=None):
+    """
+    HostState of every reachable fleet host (or the named ones), fetched
+    concurrently. Hosts being drained are left out.
+    """
+    hosts = [h for h in (hosts or fleet.hosts()) if h not in migration_engine.draining]
+    results = fleet.fan_out(lambda m: HostState.collect(m.uri, m), hosts)
+    states = []
+    for name, result in sorted(results.items()):
+        if result.ok:
+            result.value.name = name
+            states.append(result.value)
+    return states, results
+
+@app.route('/api/scheduler/plan', methods=['POST'])
+def plan_placement():
+    """
+    Dry run: where would `count` VMs of this size go?
+    Body: {"vcpu": 2, "memory_mb": 2048, "count": 1, "policy": "binpack", "hosts": [...]}
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        vcpu = int(data.get('vcpu', 1))
+        memory_mb = int(data.get('memory_mb', 1024))
+        count = int(data.get('count', 1))
+    except (TypeError, ValueError):
+        return jsonify({"error": "vcpu, memory_mb and count must be integers"}), 400
+    policy = data.get('policy', scheduler.policy)
+    if policy not in POLICIES:
+        return jsonify({"error": f"policy must be one of {', '.join(POLICIES)}"}), 400
+    if not 1 <= count <= PROVISION_MAX_COUNT or vcpu <= 0 or memory_mb <= 0:
+        return jsonify({"error": "vcpu, memory_mb and count must be positive (count within limits)"}), 400
+    states, results = collect_host_states(data.get('hosts'))
+    placements = scheduler.place_many([(vcpu, memory_mb)] * count, states, policy)
+    return jsonify({
+        "policy": policy,
+        "placements": [p.to_dict() if not isinstance(p, SchedulingError) else {"error": str(p)}
+                       for p in placements],
+        "hosts": _fleet_status(results),
+    })
+
+# Options accepted by migration requests, passed on to MigrationEngine.migrate()
+MIGRATION_OPTIONS = {'live': bool, 'auto_converge': bool, 'postcopy': bool, 'compressed': bool,
+                     'bandwidth_mib': int, 'max_downtime_ms': int, 'dest_uri': str}
+
+def _migration_options(data):
+    """Picks and converts the migration options out of a request body. Raises ValueError."""
+    options = {}
+    for key, convert in MIGRATION_OPTIONS.items():
+        if data.get(key) is not None:
+            try:
+                options[key] = convert(data[key])
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid value for '{key}'")
+    return options
+
+@app.route('/api/vms/<name>/migrate', methods=['POST'])
+def migrate_vm(name):
+    """
+    Live-migrates a VM to another fleet host as a background job.
+    Body: {"source": "local", "dest": "node2", "live": true, "auto_converge": false,
+           "postcopy": false, "compressed": false, "bandwidth_mib": 500,
+           "max_downtime_ms": 300, "dest_uri": "qemu+ssh://node2/system"}
+    Returns 202 with a job id; the job reports progress from the migration's jobStats.
+    """
+    data = request.get_json(silent=True) or {}
+    source, dest = data.get('source', 'local'), data.get('dest')
+    if not dest:
+        return jsonify({"error": "dest is required"}), 400
+    if fleet.get_manager(source) is None or fleet.get_manager(dest) is None:
+        return jsonify({"error": "Unknown source or destination host"}), 404
+    if source == dest:
+        return jsonify({"error": "Source and destination are the same host"}), 400
+    try:
+        options = _migration_options(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Same key as other actions on a local VM, so a migration never overlaps them
+    key = name if source == 'local' else f"{source}/{name}"
+    job = job_manager.submit(key, 'migrate', migration_engine.migrate, args=(name, source, dest),
+                             kwargs=options, target=f"{name} ({source} -> {dest})", pass_job=True)
+    if job is None:
+        return jsonify({"error": "Too many pending jobs, try again later", "success": False}), 429
+    return jsonify({
+        "message": f"Migration of VM '{name}' to '{dest}' queued.",
+        "success": True,
+        "job_id": job.id,
+        "status_url": f"/api/jobs/{job.id}",
+    }), 202
+
+@app.route('/api/fleet/hosts/<name>/drain', methods=['POST'])
+def drain_fleet_host(name):
+    """
+    Evacuates every running VM from a host as one background job. Destinations
+    are picked by the placement scheduler among `hosts` (default: all others).
+    Body: {"policy": "spread", "hosts": [...], "parallel": 4, "bandwidth_mib": 1000,
+           plus the per-migration options of /api/vms/<name>/migrate}
+    A bandwidth_mib here sets the host's migration budget, shared by its migrations.
+    """
+    data = request.get_json(silent=True) or {}
+    if fleet.get_manager(name) is None:
+        return jsonify({"error": f"Host '{name}' not found"}), 404
+    if name in migration_engine.draining:
+        return jsonify({"error": f"Host '{name}' is already being drained"}), 409
+    policy = data.get('policy', 'spread')
+    if policy not in POLICIES:
+        return jsonify({"error": f"policy must be one of {', '.join(POLICIES)}"}), 400
+    try:
+        options = _migration_options(data)
+        parallel = int(data['parallel']) if data.get('parallel') is not None else None
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    options.pop('dest_uri', None)  # differs per destination
+    budget = options.pop('bandwidth_mib', None)
+    if budget:
+        migration_engine.set_host_bandwidth(name, budget)
+
+    job = job_manager.submit(f"drain:{name}", 'drain', migration_engine.drain, args=(name, scheduler),
+                             kwargs=dict(options, dests=data.get('hosts'), policy=policy, parallel=parallel),
+                             target=name, pass_job=True)
+    if job is None:
+        return jsonify({"error": "Too many pending jobs, try again later", "success": False}), 429
+    return jsonify({
+        "message": f"Drain of host '{name}' queued.",
+        "success": True,
+        "job_id": job.id,
+        "status_url": f"/api/jobs/{job.id}",
+    }), 202
+
+@app.route('/api/migrations')
+def list_migrations():
+    """Running migrations (with their current speed cap and progress) and recent ones."""
+    return jsonify({
+        "active": migration_engine.active(),
+        "recent": migration_engine.history(request.args.get('limit', 50, type=int)),
+        "draining": sorted(migration_engine.draining),
+    })
 
 @app.route('/api/vm/create', methods=['POST'])
 def create_new_vm():
@@ -106,58 +1082,37 @@ def create_new_vm():
     if not vm_name:
         return jsonify({"error": "VM name is required"}), 400
 
-    # Basic XML template for a new VM (QEMU/KVM)
-    # This is a very basic template and should be expanded for more options
-    xml_config = f"""
-    <domain type='kvm'>
-      <name>{vm_name}</name>
-      <uuid>{libvirt.virDomainGenerateUUID()}</uuid>
-      <memory unit='MiB'>{memory_mb}</memory>
-      <currentMemory unit='MiB'>{memory_mb}</currentMemory>
-      <vcpu placement='static'>{vcpu}</vcpu>
-      <os>
-        <type arch='x86_64' machine='pc'>hvm</type>
-      </os>
-      <features>
-        <acpi/>
-        <apic/>
-      </features>
-      <cpu mode='host-passthrough' check='partial'/>
-      <clock offset='utc'/>
-      <on_poweroff>destroy</on_poweroff>
-      <on_reboot>restart</on_reboot>
-      <on_crash>destroy</on_crash>
-      <devices>
-        <emulator>/usr/local/bin/qemu-system-x86_64</emulator> <disk type='file' device='disk'>
-          <driver name='qemu' type='qcow2'/>
-          <source file='{disk_path}'/>
-          <target dev='vda' bus='virtio'/>
-          <address type='pci' domain='0x0000' bus='0x00' slot='0x07' function='0x0'/>
-        </disk>
-        <interface type='bridge'>
-          <source bridge='{network_bridge}'/>
-          <model type='virtio'/>
-          <address type='pci' domain='0x0000' bus='0x00' slot='0x03' function='0x0'/>
-        </interface>
-        <graphics type='vnc' port='-1' autoport='yes' listen='0.0.0.0'>
-          <listen type='address' address='0.0.0.0'/>
-        </graphics>
-        <console type='pty'>
-          <target type='serial' port='0'/>
-        </console>
-        <channel type='spicevmc'>
-          <target type='virtio' name='com.redhat.spice.0'/>
-        </channel>
-      </devices>
-    </domain>
-    """
-    # Note: Disk creation (qcow2 file) itself is not handled by libvirt.
+    # Optional placement: {"placement": "binpack"|"spread", "hosts": [...]} picks the
+    # fleet host and NUMA cell; without it the VM is defined here, unpinned.
+    manager, placement = libvirt_manager, None
+    policy = data.get('placement')
+    if policy:
+        if policy not in POLICIES:
+            return jsonify({"error": f"placement must be one of {', '.join(POLICIES)}"}), 400
+        states, _ = collect_host_states(data.get('hosts'))
+        try:
+            placement = scheduler.place(int(vcpu), int(memory_mb), states, policy)
+        except (TypeError, ValueError):
+            return jsonify({"error": "memory_mb and vcpu must be integers"}), 400
+        except SchedulingError as e:
+            return jsonify({"error": str(e)}), 409
+        manager = fleet.get_manager(placement.host)
+
+    try:
+        xml_config = DEFAULT_PROFILE.render(vm_name, memory_mb=memory_mb, vcpu=vcpu,
+                                            disk_paths=[disk_path], interface_sources=[network_bridge],
+                                            iso_path=os_iso_path,
+                                            **(placement.render_args() if placement else {}))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # Note: Disk creation (qcow2 file) itself is not handled here.
     # You'd typically create the disk image first using qemu-img.
     # E.g., qemu-img create -f qcow2 /var/lib/libvirt/images/new_vm.qcow2 10G
 
-    domain = libvirt_manager.create_vm(xml_config)
+    domain = manager.create_vm(xml_config)
     if domain:
-        return jsonify({"message": f"VM '{vm_name}' created successfully!", "success": True})
+        return jsonify({"message": f"VM '{vm_name}' created successfully!", "success": True,
+                        "placement": placement.to_dict() if placement else None})
     else:
         return jsonify({"error": f"Failed to create VM '{vm_name}'. Check logs for details."}), 500
 
@@ -166,5 +1121,8 @@ if __name__ == '__main__':
     if not libvirt_manager.is_connected():
         print("Attempting initial connection to libvirt...")
         libvirt_manager.connect()
-    
-    app.run(debug=True, host='0.0.0.0', port=5000) # Run in debug mode for development
+    start_background()
+
+    # Development server; GRENADE_DEBUG=1 enables the debugger and reloader.
+    # For many concurrent clients and streams use the ASGI app (app/asgi.py).
+    app.run(debug=os.environ.get('GRENADE_DEBUG') == '1', host='0.0.0.0', port=5000, threaded=True)
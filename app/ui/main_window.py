@@ -1,12 +1,25 @@
 # app/ui/main_window.py
 
-from PyQt5.QtWidgets import QMainWindow, QVBoxLayout, QWidget, QPushButton, QLabel, QMessageBox, QTabWidget, QListWidget, QListWidgetItem
-from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import (QMainWindow, QVBoxLayout, QWidget, QPushButton, QLabel, QMessageBox, QTabWidget,
+                             QTableView, QAbstractItemView, QHeaderView)
+from PyQt5.QtCore import Qt, QThread, QTimer, QSortFilterProxyModel, pyqtSignal
+import libvirt
 from app.core.libvirt_manager import LibvirtManager # Import LibvirtManager
+from app.ui.task_runner import TaskRunner
+from app.ui.vm_table_model import VMTableModel
+from app.ui.workers import VMListWorker
 import os
 import platform
+import sys
 
 class ArmoraGrenadeMainWindow(QMainWindow):
+    # Milliseconds between VM list polls (served from the inventory cache)
+    VM_LIST_REFRESH_MS = 2000
+
+    # Queued to the VM list worker thread
+    vm_list_requested = pyqtSignal()
+    vm_list_reload_requested = pyqtSignal()
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Armora Grenade - Virtualization Management")
@@ -15,7 +28,15 @@ class ArmoraGrenadeMainWindow(QMainWindow):
         self.libvirt_manager = LibvirtManager() # Inisialisasi LibvirtManager
         self.connect_to_libvirt()
 
+        # VM actions run off the GUI thread, one at a time per VM
+        self.task_runner = TaskRunner(parent=self)
+        self.task_runner.task_started.connect(self.on_task_started)
+        self.task_runner.task_finished.connect(self.on_task_finished)
+        self.task_runner.task_cancelled.connect(self.on_task_cancelled)
+        self.task_runner.busy_changed.connect(self.on_vm_busy_changed)
+
         self.init_ui()
+        self.start_vm_list_worker()
         self.load_vm_list() # Muat daftar VM saat aplikasi dimulai
 
     def connect_to_libvirt(self):
@@ -61,9 +82,27 @@ class ArmoraGrenadeMainWindow(QMainWindow):
         self.vms_tab.setLayout(vms_layout)
         self.tab_widget.addTab(self.vms_tab, "Virtual Machines")
 
-        # VM List
-        self.vm_list_widget = QListWidget()
-        vms_layout.addWidget(self.vm_list_widget)
+        # VM List: model keyed by UUID behind a sorting proxy
+        self.vm_model = VMTableModel(self)
+        self.vm_proxy = QSortFilterProxyModel(self)
+        self.vm_proxy.setSourceModel(self.vm_model)
+        self.vm_proxy.setSortRole(VMTableModel.SortRole)
+        self.vm_table = QTableView()
+        self.vm_table.setModel(self.vm_proxy)
+        self.vm_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.vm_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.vm_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.vm_table.setSortingEnabled(True)
+        self.vm_table.sortByColumn(0, Qt.AscendingOrder)
+        self.vm_table.verticalHeader().setVisible(False)
+        self.vm_table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.vm_table.horizontalHeader().setStretchLastSection(True)
+        vms_layout.addWidget(self.vm_table)
+
+        self.vm_list_message = QLabel("")
+        self.vm_list_message.setAlignment(Qt.AlignCenter)
+        self.vm_list_message.hide()
+        vms_layout.addWidget(self.vm_list_message)
 
         # VM Actions Buttons
         vm_buttons_layout = QVBoxLayout() # Menggunakan QVBoxLayout agar tombol ke bawah
@@ -78,18 +117,23 @@ class ArmoraGrenadeMainWindow(QMainWindow):
         self.btn_stop_vm.clicked.connect(self.stop_selected_vm)
         self.btn_stop_vm.setEnabled(False) # Awalnya nonaktif
 
+        self.btn_cancel_queued = QPushButton("Cancel Queued Actions")
+        self.btn_cancel_queued.clicked.connect(self.cancel_queued_actions)
+        self.btn_cancel_queued.setEnabled(False)
+
         self.btn_create_vm = QPushButton("Create New VM (Not Implemented)")
         self.btn_create_vm.setEnabled(False) # Nonaktifkan sementara
         
         vm_buttons_layout.addWidget(self.btn_refresh_vms)
         vm_buttons_layout.addWidget(self.btn_start_vm)
         vm_buttons_layout.addWidget(self.btn_stop_vm)
+        vm_buttons_layout.addWidget(self.btn_cancel_queued)
         vm_buttons_layout.addWidget(self.btn_create_vm)
         
         vms_layout.addLayout(vm_buttons_layout)
 
         # Connect list selection to button state
-        self.vm_list_widget.itemSelectionChanged.connect(self.update_vm_button_state)
+        self.vm_table.selectionModel().selectionChanged.connect(self.update_vm_button_state)
 
         # --- Other Tabs (Placeholders) ---
         storage_tab = QWidget()
@@ -123,91 +167,100 @@ class ArmoraGrenadeMainWindow(QMainWindow):
         else:
             print(f"Warning: Stylesheet not found at {qss_path}")
 
+    def start_vm_list_worker(self):
+        """Starts the worker thread that loads the VM list, plus the periodic refresh timer."""
+        self.vm_list_thread = QThread(self)
+        self.vm_list_worker = VMListWorker(self.libvirt_manager)
+        self.vm_list_worker.moveToThread(self.vm_list_thread)
+        self.vm_list_requested.connect(self.vm_list_worker.load)
+        self.vm_list_reload_requested.connect(self.vm_list_worker.reload)
+        self.vm_list_worker.loaded.connect(self.on_vm_list_loaded)
+        self.vm_list_worker.failed.connect(self.on_vm_list_failed)
+        self.vm_list_worker.connection_changed.connect(self.on_connection_changed)
+        self.vm_list_thread.finished.connect(self.vm_list_worker.deleteLater)
+        self.vm_list_thread.start()
+
+        self.vm_list_timer = QTimer(self)
+        self.vm_list_timer.timeout.connect(self.vm_list_requested.emit)
+        self.vm_list_timer.start(self.VM_LIST_REFRESH_MS)
+
     def load_vm_list(self):
-        """Loads and displays the list of virtual machines."""
-        self.vm_list_widget.clear()
-        if not self.libvirt_manager.is_connected():
-            self.vm_list_widget.addItem("Not connected to libvirt. Please check connection.")
-            return
+        """Asks the worker thread for a fresh VM list; the table updates when it arrives."""
+        self.vm_list_reload_requested.emit()
+
+    def on_vm_list_loaded(self, vms):
+        """Applies a listing from the worker as row-level diffs (selection and scroll are kept)."""
+        self.vm_model.apply(vms)
+        if vms:
+            self.vm_list_message.hide()
+        else:
+            self.vm_list_message.setText("No virtual machines found.")
+            self.vm_list_message.show()
+        self.update_vm_button_state()
+
+    def on_vm_list_failed(self, message):
+        self.vm_model.clear()
+        self.vm_list_message.setText(message)
+        self.vm_list_message.show()
+        self.update_vm_button_state()
+
+    def on_connection_changed(self, connected):
+        if connected:
+            self.status_label.setText("Libvirt Status: Connected")
+            self.status_label.setStyleSheet("color: #28a745; font-weight: bold;") # Green
+        else:
+            self.status_label.setText("Libvirt Status: Disconnected")
+            self.status_label.setStyleSheet("color: #dc3545; font-weight: bold;") # Red
 
-        try:
-            active_domains = self.libvirt_manager.list_active_vms()
-            inactive_domains = self.libvirt_manager.list_inactive_vms()
-
-            if not active_domains and not inactive_domains:
-                self.vm_list_widget.addItem("No virtual machines found.")
-                return
-
-            if active_domains:
-                self.vm_list_widget.addItem("--- Active VMs ---")
-                for vm_name in active_domains:
-                    self.vm_list_widget.addItem(f"🟢 {vm_name} (Running)")
-            
-            if inactive_domains:
-                if active_domains: # Add separator if both exist
-                    self.vm_list_widget.addItem("-----------------")
-                self.vm_list_widget.addItem("--- Inactive VMs ---")
-                for vm_name in inactive_domains:
-                    self.vm_list_widget.addItem(f"⚫ {vm_name} (Stopped)")
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load VM list: {e}")
+    def get_selected_vm_uuid(self):
+        """Returns the UUID of the currently selected VM, or None."""
+        rows = self.vm_table.selectionModel().selectedRows()
+        if not rows:
+            return None
+        return self.vm_proxy.mapToSource(rows[0]).data(VMTableModel.UuidRole)
 
     def get_selected_vm_name(self):
         """Returns the name of the currently selected VM."""
-        selected_items = self.vm_list_widget.selectedItems()
-        if not selected_items:
-            return None
-        
-        # Extract VM name from the list item text (e.g., "🟢 MyVM (Running)")
-        item_text = selected_items[0].text()
-        if "---" in item_text: # Avoid selecting header items
-            return None
-        
-        # Simple regex or string splitting might be needed for robust parsing
-        # For now, let's assume format "🟢 Name (State)" or "⚫ Name (State)"
-        vm_name = item_text.split('(')[0].strip()
-        if vm_name.startswith('🟢') or vm_name.startswith('⚫'):
-             vm_name = vm_name[1:].strip()
-        return vm_name
+        uuid = self.get_selected_vm_uuid()
+        vm = self.vm_model.vm_by_uuid(uuid) if uuid else None
+        return vm['name'] if vm else None
 
     def update_vm_button_state(self):
-        """Enables/disables VM action buttons based on selection."""
-        selected_vm_name = self.get_selected_vm_name()
-        
+        """
+        Enables/disables VM action buttons based on selection and the cached state
+        in the table model (no libvirt call). While an action is in flight for the
+        VM both actions stay available and are queued behind it.
+        """
         self.btn_start_vm.setEnabled(False)
         self.btn_stop_vm.setEnabled(False)
+        self.btn_cancel_queued.setEnabled(False)
 
-        if selected_vm_name and self.libvirt_manager.is_connected():
-            try:
-                domain = self.libvirt_manager.get_domain_by_name(selected_vm_name)
-                if domain:
-                    state, reason = domain.state()
-                    if state == libvirt.VIR_DOMAIN_RUNNING:
-                        self.btn_stop_vm.setEnabled(True)
-                    elif state == libvirt.VIR_DOMAIN_SHUTOFF or state == libvirt.VIR_DOMAIN_PAUSED:
-                        self.btn_start_vm.setEnabled(True)
-            except Exception as e:
-                print(f"Error checking VM state for button update: {e}")
-                # Fallback to disabled state if error occurs
-                self.btn_start_vm.setEnabled(False)
-                self.btn_stop_vm.setEnabled(False)
+        uuid = self.get_selected_vm_uuid()
+        vm = self.vm_model.vm_by_uuid(uuid) if uuid else None
+        if vm is None:
+            return
+        if self.task_runner.is_busy(uuid):
+            self.btn_start_vm.setEnabled(True)
+            self.btn_stop_vm.setEnabled(True)
+            self.btn_cancel_queued.setEnabled(self.task_runner.queued_count(uuid) > 0)
+            return
+        state = vm['state_code']
+        if state == libvirt.VIR_DOMAIN_RUNNING:
+            self.btn_stop_vm.setEnabled(True)
+        elif state == libvirt.VIR_DOMAIN_SHUTOFF or state == libvirt.VIR_DOMAIN_PAUSED:
+            self.btn_start_vm.setEnabled(True)
 
     def start_selected_vm(self):
-        """Starts the selected virtual machine."""
+        """Starts the selected virtual machine in the background."""
         vm_name = self.get_selected_vm_name()
         if not vm_name:
             QMessageBox.warning(self, "No VM Selected", "Please select a virtual machine to start.")
             return
-
-        if self.libvirt_manager.start_vm(vm_name):
-            QMessageBox.information(self, "VM Started", f"Virtual machine '{vm_name}' started successfully.")
-            self.load_vm_list() # Refresh list
-        else:
-            QMessageBox.critical(self, "Error", f"Failed to start virtual machine '{vm_name}'.")
+        self.task_runner.submit(self.get_selected_vm_uuid(), f"Starting '{vm_name}'",
+                                self.libvirt_manager.start_vm, vm_name)
 
     def stop_selected_vm(self):
-        """Stops (shuts down) the selected virtual machine."""
+        """Stops (shuts down) the selected virtual machine in the background."""
         vm_name = self.get_selected_vm_name()
         if not vm_name:
             QMessageBox.warning(self, "No VM Selected", "Please select a virtual machine to stop.")
@@ -217,15 +270,57 @@ class ArmoraGrenadeMainWindow(QMainWindow):
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if reply == QMessageBox.No:
             return
+        self.task_runner.submit(self.get_selected_vm_uuid(), f"Stopping '{vm_name}'",
+                                self.libvirt_manager.stop_vm, vm_name)
 
-        if self.libvirt_manager.stop_vm(vm_name):
-            QMessageBox.information(self, "VM Stopped", f"Virtual machine '{vm_name}' stopped successfully.")
-            self.load_vm_list() # Refresh list
-        else:
-            QMessageBox.critical(self, "Error", f"Failed to stop virtual machine '{vm_name}'.")
+    def cancel_queued_actions(self):
+        """Cancels actions still waiting behind a running one for the selected VM."""
+        uuid = self.get_selected_vm_uuid()
+        if uuid:
+            self.task_runner.cancel_queued(uuid)
+
+    # --- Task runner signals (GUI thread) ---
+    def on_task_started(self, task_id, uuid, label):
+        self.vm_model.set_pending(uuid, label)
+        self.show_task_status()
+
+    def on_task_finished(self, task_id, uuid, label, success, error):
+        self.vm_model.set_pending(uuid, self.task_runner.running_label(uuid))
+        self.show_task_status(f"{label}: {'done' if success else 'failed'}")
+        if not success:
+            detail = f"\n\n{error}" if error else ""
+            QMessageBox.critical(self, "Error", f"{label} failed.{detail}")
+        # Domain events update the inventory; this just picks the change up sooner
+        self.vm_list_requested.emit()
+
+    def on_task_cancelled(self, task_id, uuid, label):
+        self.show_task_status(f"{label}: cancelled")
+
+    def on_vm_busy_changed(self, uuid, busy):
+        if uuid == self.get_selected_vm_uuid():
+            self.update_vm_button_state()
+
+    def show_task_status(self, last=None):
+        """In-flight indicator in the status bar."""
+        running = self.task_runner.running_count()
+        queued = self.task_runner.queued_count()
+        parts = [last] if last else []
+        if running or queued:
+            parts.append(f"{running} running, {queued} queued")
+        self.statusBar().showMessage(" | ".join(parts))
 
     def closeEvent(self, event):
         """Handles application close event, ensuring libvirt connection is closed."""
-        if self.libvirt_manager:
+        self.vm_list_timer.stop()
+        # Queued actions are dropped; running ones get a few seconds to finish
+        finished = self.task_runner.wait(5000)
+        self.vm_list_thread.quit()
+        self.vm_list_thread.wait()
+        if not finished:
+            # Closing the connection under a running call can crash the bindings;
+            # the process exit closes it once those calls return
+            print(f"Warning: {self.task_runner.pool.activeThreadCount()} action(s) still running, "
+                  "leaving the libvirt connection open.", file=sys.stderr)
+        elif self.libvirt_manager:
             self.libvirt_manager.disconnect()
         event.accept()
@@ -0,0 +1,142 @@
+# app/ui/task_runner.py
+
+import itertools
+from collections import deque
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class _TaskSignals(QObject):
+    # QRunnable isn't a QObject, so each task carries one of these.
+    # Emitted from pool threads; receivers in the GUI thread get them queued.
+    done = pyqtSignal(int, bool, str)  # task id, success, error message
+
+
+class Task(QRunnable):
+    """One call submitted to a TaskRunner."""
+
+    def __init__(self, task_id, key, label, func, args):
+        super().__init__()
+        self.id = task_id
+        self.key = key
+        self.label = label
+        self.func = func
+        self.args = args
+        self.signals = _TaskSignals()
+
+    def run(self):
+        try:
+            result = self.func(*self.args)
+        except Exception as e:
+            self.signals.done.emit(self.id, False, str(e))
+            return
+        # LibvirtManager methods report failure by returning False/None
+        self.signals.done.emit(self.id, result not in (False, None), '')
+
+
+class TaskRunner(QObject):
+    """
+    Runs blocking calls (libvirt actions) on a QThreadPool and reports back via
+    signals, so Qt slots never wait on the daemon.
+
+    Tasks sharing a key (e.g. a VM UUID) run one at a time in submission order;
+    later ones stay queued and can be cancelled before they start. A call that is
+    already running can't be interrupted (libvirt has no cancellation for
+    shutdown/create), its result is still reported. All signals are delivered
+    on the thread that owns the runner, i.e. the GUI thread, which is also the
+    only thread that touches its bookkeeping.
+    """
+
+    task_started = pyqtSignal(int, str, str)        # task id, key, label
+    task_finished = pyqtSignal(int, str, str, bool, str)  # task id, key, label, success, error
+    task_cancelled = pyqtSignal(int, str, str)      # task id, key, label
+    busy_changed = pyqtSignal(str, bool)            # key, has running/queued tasks
+
+    def __init__(self, max_threads=4, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self._ids = itertools.count(1)
+        self._running = {}  # key -> Task
+        self._queued = {}   # key -> deque of Task
+        self._tasks = {}    # id -> Task
+
+    def submit(self, key, label, func, *args):
+        """Queues func(*args) under `key`; returns the task id."""
+        task = Task(next(self._ids), key, label, func, args)
+        task.signals.done.connect(self._on_done)
+        was_busy = self.is_busy(key)
+        self._tasks[task.id] = task
+        if key in self._running:
+            self._queued.setdefault(key, deque()).append(task)
+        else:
+            self._start(task)
+        if not was_busy:
+            self.busy_changed.emit(key, True)
+        return task.id
+
+    def cancel(self, task_id):
+        """Cancels a queued task. Returns False if it is unknown or already running."""
+        task = self._tasks.get(task_id)
+        queue = self._queued.get(task.key) if task else None
+        if not queue or task not in queue:
+            return False
+        queue.remove(task)
+        if not queue:
+            del self._queued[task.key]
+        self._forget(task)
+        self.task_cancelled.emit(task.id, task.key, task.label)
+        return True
+
+    def cancel_queued(self, key=None):
+        """Cancels every queued task (for one key, or all). Returns how many were cancelled."""
+        keys = [key] if key is not None else list(self._queued)
+        count = 0
+        for k in keys:
+            for task in list(self._queued.get(k, ())):
+                count += self.cancel(task.id)
+        return count
+
+    def is_busy(self, key):
+        return key in self._running or bool(self._queued.get(key))
+
+    def running_label(self, key):
+        task = self._running.get(key)
+        return task.label if task else None
+
+    def queued_count(self, key=None):
+        if key is not None:
+            return len(self._queued.get(key, ()))
+        return sum(len(q) for q in self._queued.values())
+
+    def running_count(self):
+        return len(self._running)
+
+    def wait(self, msecs=-1):
+        """Drops queued tasks and waits for running ones (e.g. on window close)."""
+        self.cancel_queued()
+        return self.pool.waitForDone(msecs)
+
+    def _start(self, task):
+        self._running[task.key] = task
+        self.task_started.emit(task.id, task.key, task.label)
+        self.pool.start(task)
+
+    def _forget(self, task):
+        self._tasks.pop(task.id, None)
+        task.signals.done.disconnect(self._on_done)
+        if not self.is_busy(task.key):
+            self.busy_changed.emit(task.key, False)
+
+    def _on_done(self, task_id, success, error):
+        task = self._tasks.get(task_id)
+        if task is None:
+            return
+        del self._running[task.key]
+        queue = self._queued.get(task.key)
+        if queue:
+            self._start(queue.popleft())
+            if not queue:
+                del self._queued[task.key]
+        self._forget(task)
+        self.task_finished.emit(task.id, task.key, task.label, success, error)
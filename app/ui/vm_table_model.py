@@ -0,0 +1,141 @@
+# app/ui/vm_table_model.py
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+STATE_ICONS = {'Running': '🟢', 'Paused': '⏸️'}
+
+
+class VMTableModel(QAbstractTableModel):
+    """
+    Table model over VM inventory summaries, keyed by UUID.
+
+    apply() diffs a fresh listing against the current rows and emits only
+    row removals, insertions and dataChanged for rows that differ, so views
+    keep their selection, current index and scroll position across refreshes.
+    Rows are kept in arrival order; sorting is left to a QSortFilterProxyModel.
+    """
+
+    # (header, summary key)
+    COLUMNS = (
+        ('Name', 'name'),
+        ('State', 'state'),
+        ('vCPU', 'vcpu'),
+        ('Memory (MB)', 'memory_kb'),
+        ('UUID', 'uuid'),
+    )
+    UuidRole = Qt.UserRole
+    # Raw value for sorting (numbers sort numerically, not as display text)
+    SortRole = Qt.UserRole + 1
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []   # summary dicts
+        self._index = {}  # uuid -> row number
+        self._pending = {}  # uuid -> label of the action in flight
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section][0]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        vm = self._rows[index.row()]
+        key = self.COLUMNS[index.column()][1]
+        if role == Qt.DisplayRole:
+            if key == 'name':
+                return f"{STATE_ICONS.get(vm['state'], '⚫')} {vm['name']}"
+            if key == 'memory_kb':
+                return int(vm['memory_kb'] / 1024)
+            if key == 'state' and vm['uuid'] in self._pending:
+                return f"{vm['state']} ({self._pending[vm['uuid']]}…)"
+            return vm[key]
+        if role == self.SortRole:
+            return vm[key]
+        if role == self.UuidRole:
+            return vm['uuid']
+        return None
+
+    # --- Lookups by identity ---
+    def vm_at(self, row):
+        """The summary dict at a source row, or None."""
+        return self._rows[row] if 0 <= row < len(self._rows) else None
+
+    def row_of(self, uuid):
+        """Source row of a UUID, or -1."""
+        return self._index.get(uuid, -1)
+
+    def vm_by_uuid(self, uuid):
+        row = self._index.get(uuid)
+        return self._rows[row] if row is not None else None
+
+    def set_pending(self, uuid, label):
+        """Shows (label) or clears (None) an in-flight action in the State column."""
+        if label:
+            self._pending[uuid] = label
+        else:
+            self._pending.pop(uuid, None)
+        row = self._index.get(uuid)
+        if row is not None:
+            state_column = [key for _, key in self.COLUMNS].index('state')
+            self.dataChanged.emit(self.index(row, state_column), self.index(row, state_column))
+
+    def apply(self, vms):
+        """Brings the model in line with `vms` (a list of summaries) using row-level diffs."""
+        fresh = {vm['uuid']: vm for vm in vms}
+
+        # Removals, bottom-up in contiguous runs so each run is one signal
+        gone = sorted((row for uuid, row in self._index.items() if uuid not in fresh), reverse=True)
+        i = 0
+        while i < len(gone):
+            last = first = gone[i]
+            while i + 1 < len(gone) and gone[i + 1] == first - 1:
+                i += 1
+                first = gone[i]
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self._rows[first:last + 1]
+            self.endRemoveRows()
+            i += 1
+        if gone:
+            self._index = {vm['uuid']: row for row, vm in enumerate(self._rows)}
+
+        # Updates, coalesced into runs of adjacent changed rows
+        changed = []
+        for row, vm in enumerate(self._rows):
+            new = fresh[vm['uuid']]
+            if new != vm:
+                self._rows[row] = new
+                changed.append(row)
+        last_column = len(self.COLUMNS) - 1
+        i = 0
+        while i < len(changed):
+            first = last = changed[i]
+            while i + 1 < len(changed) and changed[i + 1] == last + 1:
+                i += 1
+                last = changed[i]
+            self.dataChanged.emit(self.index(first, 0), self.index(last, last_column))
+            i += 1
+
+        # Insertions, appended in one run
+        added = [vm for uuid, vm in fresh.items() if uuid not in self._index]
+        if added:
+            start = len(self._rows)
+            self.beginInsertRows(QModelIndex(), start, start + len(added) - 1)
+            for offset, vm in enumerate(added):
+                self._rows.append(vm)
+                self._index[vm['uuid']] = start + offset
+            self.endInsertRows()
+
+    def clear(self):
+        if self._rows:
+            self.beginResetModel()
+            self._rows = []
+            self._index = {}
+            self.endResetModel()
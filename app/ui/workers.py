@@ -0,0 +1,58 @@
+# app/ui/workers.py
+
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
+
+
+class VMListWorker(QObject):
+    """
+    Loads the VM list off the GUI thread. Lives in its own QThread; trigger it
+    through a queued signal connected to load().
+
+    Listings come from the LibvirtManager inventory cache, and nothing is
+    emitted while the cache generation is unchanged, so periodic refreshes of a
+    quiet host cost neither RPCs nor model work.
+    """
+
+    loaded = pyqtSignal(list)
+    failed = pyqtSignal(str)
+    connection_changed = pyqtSignal(bool)
+
+    def __init__(self, libvirt_manager):
+        super().__init__()
+        self.libvirt_manager = libvirt_manager
+        self._last_generation = None
+        self._connected = None
+
+    @pyqtSlot()
+    def load(self):
+        self._load(force=False)
+
+    @pyqtSlot()
+    def reload(self):
+        """Like load() but always emits, e.g. for an explicit refresh."""
+        self._load(force=True)
+
+    def _load(self, force):
+        connected = bool(self.libvirt_manager.is_connected())
+        if connected != self._connected:
+            self._connected = connected
+            self.connection_changed.emit(connected)
+        if not connected:
+            self._last_generation = None
+            self.failed.emit("Not connected to libvirt. Please check connection.")
+            return
+
+        inventory = self.libvirt_manager.inventory
+        generation = inventory.generation if inventory.is_ready() else None
+        if not force and generation is not None and generation == self._last_generation:
+            return
+        try:
+            vms = self.libvirt_manager.list_vms()
+        except Exception as e:
+            self.failed.emit(f"Failed to load VM list: {e}")
+            return
+        if vms is None:
+            self.failed.emit("Failed to load VM list. Check logs for details.")
+            return
+        self._last_generation = generation
+        self.loaded.emit(vms)
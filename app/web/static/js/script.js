@@ -101,6 +101,7 @@ document.addEventListener('DOMContentLoaded', () => {
                         <p><i class="fas fa-microchip"></i> ${vm.vcpu} vCPU</p>
                         <p><i class="fas fa-memory"></i> ${vm.memory_mb} MB RAM</p>
                         <p><i class="fas fa-fingerprint"></i> ${vm.uuid}</p>
+                        <p class="vm-live" data-metrics-uuid="${vm.uuid}"><i class="fas fa-chart-line"></i> <span>-</span></p>
                         </div>
                 `;
                 vmListContainer.appendChild(vmCard);
@@ -108,6 +109,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
             // Attach event listeners to newly created buttons
             attachVmButtonListeners();
+            renderLiveMetrics();
 
         } catch (error) {
             console.error('Error fetching VM list:', error);
@@ -115,6 +117,43 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // --- Live metrics (Server-Sent Events) ---
+    const liveMetrics = {};
+
+    function formatRate(bytesPerSecond) {
+        if (bytesPerSecond >= 1048576) return `${(bytesPerSecond / 1048576).toFixed(1)} MB/s`;
+        if (bytesPerSecond >= 1024) return `${(bytesPerSecond / 1024).toFixed(1)} KB/s`;
+        return `${bytesPerSecond} B/s`;
+    }
+
+    function renderLiveMetrics() {
+        document.querySelectorAll('[data-metrics-uuid]').forEach(el => {
+            const m = liveMetrics[el.dataset.metricsUuid];
+            if (!m) return;
+            el.querySelector('span').textContent =
+                `CPU ${m.cpu_percent}% | Net ${formatRate(m.net_rx_bps)} in, ${formatRate(m.net_tx_bps)} out | ` +
+                `Disk ${formatRate(m.disk_rd_bps)} read, ${formatRate(m.disk_wr_bps)} write`;
+        });
+    }
+
+    function applyMetricsMessage(event) {
+        const message = JSON.parse(event.data);
+        if (message.type === 'snapshot') {
+            Object.keys(liveMetrics).forEach(uuid => delete liveMetrics[uuid]);
+        }
+        Object.entries(message.vms).forEach(([uuid, values]) => {
+            liveMetrics[uuid] = Object.assign(liveMetrics[uuid] || {}, values);
+        });
+        message.removed.forEach(uuid => delete liveMetrics[uuid]);
+        renderLiveMetrics();
+    }
+
+    if (window.EventSource) {
+        const metricsSource = new EventSource('/api/stream/metrics');
+        metricsSource.addEventListener('snapshot', applyMetricsMessage);
+        metricsSource.addEventListener('delta', applyMetricsMessage);
+    }
+
     function attachVmButtonListeners() {
         document.querySelectorAll('.start-btn').forEach(button => {
             button.onclick = () => performVmAction(button.dataset.vmName, 'start');
@@ -159,18 +198,38 @@ document.addEventListener('DOMContentLoaded', () => {
                 }
             });
             const data = await response.json();
-            if (data.success) {
-                alert(data.message);
-                fetchVmList(); // Refresh VM list after action
+            if (!response.ok || !data.job_id) {
+                alert('Error: ' + (data.message || data.error));
+                return;
+            }
+            // The action runs as a background job; poll until it finishes
+            const job = await waitForJob(data.job_id);
+            if (job.status === 'succeeded') {
+                alert(job.message);
             } else {
-                alert('Error: ' + data.message);
+                alert('Error: ' + (job.message || job.error));
             }
+            fetchVmList(); // Refresh VM list after action
         } catch (error) {
             console.error(`Error performing ${action} on ${vmName}:`, error);
             alert(`An error occurred while trying to ${action} VM.`);
         }
     }
 
+    async function waitForJob(jobId, intervalMs = 500) {
+        while (true) {
+            const response = await fetch(`/api/jobs/${jobId}`);
+            const job = await response.json();
+            if (!response.ok) {
+                throw new Error(job.error || 'Failed to fetch job status');
+            }
+            if (job.status === 'succeeded' || job.status === 'failed') {
+                return job;
+            }
+            await new Promise(resolve => setTimeout(resolve, intervalMs));
+        }
+    }
+
     async function handleCreateVm(event) {
         event.preventDefault(); // Prevent default form submission
 
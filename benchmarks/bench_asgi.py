@@ -0,0 +1,218 @@
+# benchmarks/bench_asgi.py
+#
+# Flask (threaded development server, as app/main.py runs it) vs the ASGI app
+# (app/asgi.py under uvicorn) on the test driver. Each server runs in a child
+# process holding --domains synthetic domains. The load generator opens
+# --clients keep-alive connections that request --path back to back for
+# --duration seconds, while --streams more clients hold /api/stream/metrics
+# open the whole time. Reports requests/s, p50/p99 latency, errors and how many
+# streams got their first event and stayed open to the end. The Flask development server closes
+# the connection after every response, so its clients reconnect each time;
+# that is part of what is measured.
+#
+# Usage: python -m benchmarks.bench_asgi --clients 200 --streams 1000 --domains 500
+
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+from benchmarks.bench_vm_listing import populate
+
+HOST = '127.0.0.1'
+REQUEST_TIMEOUT = 30.0
+
+
+def serve(kind, port, domains):
+    """Child process: runs one server with `domains` domains defined on the test driver."""
+    from app.main import app as flask_app, libvirt_manager, start_background
+
+    def fill():
+        with libvirt_manager.connection():
+            populate(libvirt_manager.conn, domains)
+            libvirt_manager.resync_inventory()
+
+    if kind == 'flask':
+        import logging
+        from werkzeug.serving import run_simple
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        fill()
+        start_background() # As app.main's __main__ does
+        run_simple(HOST, port, flask_app, threaded=True)
+    else:
+        import uvicorn
+        from app import asgi
+
+        def fill_after_startup():
+            # Connecting first would register libvirt's default event loop; the
+            # lifespan hooks events to uvicorn's loop and then connects
+            deadline = time.monotonic() + REQUEST_TIMEOUT
+            while not libvirt_manager.is_alive() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            fill()
+
+        threading.Thread(target=fill_after_startup, daemon=True).start()
+        uvicorn.run(asgi.app, host=HOST, port=port, log_level='warning', backlog=4096)
+    return 0
+
+
+async def read_response(reader):
+    """
+    Reads one HTTP/1.1 response with a Content-Length body. Returns (status,
+    keep_alive); keep_alive is False if the server closes the connection.
+    """
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    length, keep_alive = 0, True
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        name = name.lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'connection' and value.strip().lower() == 'close':
+            keep_alive = False
+    if length:
+        await reader.readexactly(length)
+    return status, keep_alive
+
+
+async def client(port, path, deadline, latencies, errors):
+    request = f"GET {path} HTTP/1.1\r\nHost: {HOST}\r\n\r\n".encode()
+    writer = None
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(HOST, port), REQUEST_TIMEOUT)
+            writer.write(request)
+            status, keep_alive = await asyncio.wait_for(read_response(reader), REQUEST_TIMEOUT)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+            errors.append('connection')
+            if writer is not None:
+                writer.close()
+                writer = None
+            await asyncio.sleep(0.01)
+            continue
+        latencies.append(time.perf_counter() - start)
+        if status >= 400:
+            errors.append(status)
+        if not keep_alive:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def stream(port, deadline, alive):
+    """
+    Holds a metrics stream open until `deadline`. It counts as live if it got
+    its first event (the snapshot) and the server kept it open to the end.
+    """
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(HOST, port), REQUEST_TIMEOUT)
+        writer.write(f"GET /api/stream/metrics HTTP/1.1\r\nHost: {HOST}\r\n\r\n".encode())
+        await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), REQUEST_TIMEOUT)
+        received = b''
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                chunk = await asyncio.wait_for(reader.read(65536), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                alive.append(False) # Closed by the server
+                return
+            received = received or chunk
+        writer.close()
+        alive.append(b'event:' in received)
+    except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+        alive.append(False)
+
+
+async def load(port, path, clients, streams, duration):
+    deadline = time.perf_counter() + duration
+    latencies, errors, alive = [], [], []
+    tasks = [asyncio.create_task(stream(port, deadline, alive)) for _ in range(streams)]
+    await asyncio.sleep(min(1.0, duration / 4)) # Let the streams connect first
+    start = time.perf_counter()
+    await asyncio.gather(*(client(port, path, deadline, latencies, errors) for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    await asyncio.gather(*tasks)
+    return latencies, errors, sum(alive), elapsed
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def wait_ready(port, domains, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://{HOST}:{port}/api/vms?limit=1", timeout=5) as response:
+                if b'"total":%d' % domains in response.read().replace(b' ', b''):
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.25)
+    return False
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Flask and ASGI servers.")
+    parser.add_argument('--uri', default='test:///default')
+    parser.add_argument('--servers', default='flask,asgi')
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--streams', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--domains', type=int, default=500)
+    parser.add_argument('--path', default='/api/vms?limit=50')
+    parser.add_argument('--port', type=int, default=5810)
+    parser.add_argument('--serve', choices=('flask', 'asgi'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    raise_fd_limit()
+    if args.serve:
+        return serve(args.serve, args.port, args.domains)
+
+    print(f"{'server':>6} {'clients':>7} {'streams':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>7} {'live streams':>12}")
+    for offset, kind in enumerate(args.servers.split(',')):
+        port = args.port + offset
+        env = dict(os.environ, GRENADE_LIBVIRT_URI=args.uri)
+        child = subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_asgi', '--serve', kind,
+                                  '--port', str(port), '--domains', str(args.domains)], env=env)
+        try:
+            if not wait_ready(port, args.domains):
+                print(f"{kind}: server did not come up", file=sys.stderr)
+                return 1
+            latencies, errors, alive, elapsed = asyncio.run(
+                load(port, args.path, args.clients, args.streams, args.duration))
+        finally:
+            child.terminate()
+            child.wait()
+        print(f"{kind:>6} {args.clients:7d} {args.streams:7d} {len(latencies) / elapsed:9.1f} "
+              f"{percentile(latencies, 0.5) * 1000:8.1f} {percentile(latencies, 0.99) * 1000:8.1f} "
+              f"{len(errors):7d} {alive:>6d}/{args.streams}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
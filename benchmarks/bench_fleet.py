@@ -0,0 +1,71 @@
+# benchmarks/bench_fleet.py
+#
+# Whole-fleet listing time, sequential vs FleetManager fan-out. Each simulated
+# host is a test:/// connection whose list_vms() is delayed by a per-host
+# latency (spread between --min-latency and --max-latency); optionally some
+# hosts hang. Fan-out should track the slowest healthy host (capped by the
+# timeout), sequential the sum of all hosts.
+#
+# Usage: python -m benchmarks.bench_fleet --hosts 24 --hung 2
+
+import argparse
+import sys
+import time
+
+from app.core.fleet import FleetManager
+from app.core.libvirt_manager import LibvirtManager
+
+
+class DelayedManager(LibvirtManager):
+    """LibvirtManager with an artificial per-call delay, standing in for a remote host."""
+
+    def __init__(self, uri, delay):
+        super().__init__(uri, use_events=False)
+        self.delay = delay
+
+    def list_vms(self):
+        time.sleep(self.delay)
+        return super().list_vms()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark fleet-wide VM listing.")
+    parser.add_argument('--uri', default='test:///default')
+    parser.add_argument('--hosts', type=int, default=24)
+    parser.add_argument('--min-latency', type=float, default=0.05)
+    parser.add_argument('--max-latency', type=float, default=0.4)
+    parser.add_argument('--hung', type=int, default=0, help="Hosts that take far longer than the timeout")
+    parser.add_argument('--timeout', type=float, default=2.0)
+    args = parser.parse_args(argv)
+
+    fleet = FleetManager(timeout=args.timeout)
+    step = (args.max_latency - args.min_latency) / max(1, args.hosts - 1)
+    for i in range(args.hosts):
+        delay = args.timeout * 5 if i < args.hung else args.min_latency + i * step
+        fleet.add_host(f"host-{i:02d}", manager=DelayedManager(args.uri, delay))
+    for i in range(args.hosts):
+        manager = fleet.get_manager(f"host-{i:02d}")
+        if not manager.connect():
+            return 1
+
+    healthy = [fleet.get_manager(h) for h in fleet.hosts()][args.hung:]
+    start = time.perf_counter()
+    for manager in healthy:
+        manager.list_vms()
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vms, results = fleet.list_vms()
+    fanned = time.perf_counter() - start
+    failed = sorted(name for name, r in results.items() if not r.ok)
+
+    print(f"hosts: {args.hosts} ({args.hung} hung), timeout {args.timeout:g}s")
+    print(f"sequential (healthy hosts only): {sequential:8.3f} s")
+    print(f"fan-out (all hosts):             {fanned:8.3f} s  ({len(vms)} VMs, {len(failed)} failed)")
+    print(f"slowest healthy host:            {max(m.delay for m in healthy):8.3f} s")
+    fleet.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
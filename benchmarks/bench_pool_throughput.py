@@ -0,0 +1,73 @@
+# benchmarks/bench_pool_throughput.py
+#
+# Load test for the LibvirtManager connection pool: N worker threads each check
+# out a connection per "request" (as the Flask hooks do) and run a bulk stats
+# listing plus a domain lookup. Reports throughput and pool wait/checkout figures
+# per thread count. Against test:///default the work is CPU-bound in-process, so
+# point --uri at a real daemon (e.g. qemu+ssh://host/system) to see RPC overlap.
+#
+# Usage: python -m benchmarks.bench_pool_throughput --threads 1,2,4,8,16
+
+import argparse
+import sys
+import threading
+import time
+
+from app.core.libvirt_manager import LibvirtManager
+from benchmarks.bench_vm_listing import populate
+
+
+def simulated_request(manager, vm_name):
+    """One API request's worth of libvirt work on a checked-out connection."""
+    with manager.connection():
+        manager.get_vm_inventory()
+        manager.get_domain_by_name(vm_name)
+
+
+def run(manager, threads, requests_per_thread, vm_name):
+    """Runs the load with `threads` workers; returns requests per second."""
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        barrier.wait()
+        for _ in range(requests_per_thread):
+            simulated_request(manager, vm_name)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return threads * requests_per_thread / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Connection pool throughput load test.")
+    parser.add_argument('--uri', default='test:///default')
+    parser.add_argument('--threads', default='1,2,4,8,16')
+    parser.add_argument('--pool-size', type=int, default=None,
+                        help="Pool size (default: same as the thread count)")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per thread")
+    parser.add_argument('--domains', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    print(f"{'threads':>7} {'pool':>5} {'req/s':>10} {'waits':>7} {'wait ms':>9} {'avg checkout ms':>16}")
+    for threads in (int(t) for t in args.threads.split(',')):
+        manager = LibvirtManager(args.uri, use_events=False, pool_size=args.pool_size or threads)
+        if not manager.connect():
+            return 1
+        populate(manager.conn, args.domains)
+        vm_name = manager.get_vm_inventory()[0]['name']
+        throughput = run(manager, threads, args.requests, vm_name)
+        m = manager.pool_metrics()
+        print(f"{threads:>7} {m['size']:>5} {throughput:>10.1f} {m['wait_count']:>7} "
+              f"{m['wait_time_total_ms']:>9.1f} {m['checkout_latency_avg_ms']:>16.3f}")
+        manager.disconnect()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# benchmarks/bench_qt_responsiveness.py
+#
+# Measures how long the Qt event loop stalls while VM actions run against a
+# slow connection. A 60 Hz "frame" timer records the gap between ticks while a
+# burst of start/stop actions is issued either synchronously in the slot (the
+# old MainWindow behaviour) or through the TaskRunner. Reports the worst and
+# p99 frame gaps and how many frames blew the budget.
+#
+# Runs headless (QT_QPA_PLATFORM=offscreen) and needs PyQt5. By default the
+# actions just sleep and libvirt is not needed; with --uri they go through a
+# real LibvirtManager, e.g. on a simulated slow hypervisor (app.core.simulator).
+#
+# Usage: python -m benchmarks.bench_qt_responsiveness --actions 20 --latency 0.5
+#        python -m benchmarks.bench_qt_responsiveness --uri 'sim:///default?domains=500&latency_ms=20&jitter_ms=10'
+
+import argparse
+import os
+import sys
+import time
+
+FRAME_MS = 1000 / 60
+
+
+class SlowManager:
+    """Stands in for LibvirtManager: every action blocks like a slow remote daemon."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def start_vm(self, vm_name):
+        time.sleep(self.latency)
+        return True
+
+    def stop_vm(self, vm_name):
+        time.sleep(self.latency)
+        return True
+
+
+def measure(app, issue_actions, settle):
+    """Runs the event loop until `settle()` is true; returns the frame gaps in ms."""
+    from PyQt5.QtCore import QTimer
+
+    gaps = []
+    last = [time.perf_counter()]
+
+    def frame():
+        now = time.perf_counter()
+        gaps.append((now - last[0]) * 1000)
+        last[0] = now
+        if settle():
+            app.quit()
+
+    timer = QTimer()
+    timer.timeout.connect(frame)
+    timer.start(int(FRAME_MS))
+    QTimer.singleShot(50, issue_actions)
+    app.exec_()
+    timer.stop()
+    return gaps
+
+
+def report(label, gaps, budget_ms, elapsed):
+    gaps = sorted(gaps)
+    p99 = gaps[min(len(gaps) - 1, int(len(gaps) * 0.99))] if gaps else 0.0
+    over = sum(1 for g in gaps if g > budget_ms)
+    print(f"{label:>8} {elapsed:9.2f} {len(gaps):7d} {gaps[-1] if gaps else 0:11.1f} {p99:9.1f} {over:6d}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Qt event loop responsiveness under slow VM actions.")
+    parser.add_argument('--actions', type=int, default=20)
+    parser.add_argument('--vms', type=int, default=5, help="Distinct VMs the actions are spread over")
+    parser.add_argument('--latency', type=float, default=0.5, help="Seconds each action blocks")
+    parser.add_argument('--uri', default=None, help="Run the actions through LibvirtManager on this URI")
+    parser.add_argument('--threads', type=int, default=4, help="TaskRunner pool size")
+    parser.add_argument('--budget-ms', type=float, default=2 * FRAME_MS,
+                        help="A gap above this counts as a dropped frame")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt5.QtWidgets import QApplication
+    except ImportError:
+        print("PyQt5 is required for this benchmark.", file=sys.stderr)
+        return 1
+    from app.ui.task_runner import TaskRunner
+
+    app = QApplication.instance() or QApplication([])
+    if args.uri:
+        from app.core.libvirt_manager import LibvirtManager
+        manager = LibvirtManager(args.uri, use_events=False)
+        if not manager.connect():
+            return 1
+        stopped = sorted(vm['name'] for vm in manager.get_vm_inventory() or [] if vm['state'] != 'Running')
+        if not stopped:
+            print("No stopped domains to start.", file=sys.stderr)
+            return 1
+        vm_names = stopped[:args.vms]
+        stop = manager.destroy_vm # Immediate on every driver, so the next start succeeds
+    else:
+        manager = SlowManager(args.latency)
+        vm_names = [f"vm-{i}" for i in range(args.vms)]
+        stop = manager.stop_vm
+    actions = [(vm_names[i % len(vm_names)], manager.start_vm if i % 2 == 0 else stop)
+               for i in range(args.actions)]
+
+    print(f"{'mode':>8} {'elapsed s':>9} {'frames':>7} {'max gap ms':>11} {'p99 ms':>9} {'over':>6}")
+
+    done = []
+    def run_sync():
+        for vm_name, action in actions:
+            action(vm_name)
+            done.append(vm_name)
+    start = time.perf_counter()
+    gaps = measure(app, run_sync, lambda: len(done) == len(actions))
+    report('sync', gaps, args.budget_ms, time.perf_counter() - start)
+
+    runner = TaskRunner(max_threads=args.threads)
+    finished = []
+    runner.task_finished.connect(lambda *a: finished.append(a))
+    def run_async():
+        for vm_name, action in actions:
+            runner.submit(vm_name, action.__name__, action, vm_name)
+    start = time.perf_counter()
+    gaps = measure(app, run_async, lambda: len(finished) == len(actions))
+    report('runner', gaps, args.budget_ms, time.perf_counter() - start)
+    runner.wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+# benchmarks/bench_search_index.py
+#
+# Build and query cost of the VM search index. Fills a SearchIndex with
+# synthetic domains (name, MACs, IPs, disk paths, tags), then times lookups of
+# each kind plus an incremental re-index of single domains, as done on events.
+#
+# Usage: python -m benchmarks.bench_search_index --domains 10000
+
+import argparse
+import random
+import sys
+import time
+import uuid as uuid_lib
+
+from app.core.search_index import SearchIndex
+
+TAGS = ('web', 'db', 'cache', 'prod', 'staging', 'team-a', 'team-b', 'gpu')
+
+
+def synthetic_domains(count, seed=1):
+    rng = random.Random(seed)
+    domains = []
+    for i in range(count):
+        macs = [f"52:54:00:{i >> 16 & 0xff:02x}:{i >> 8 & 0xff:02x}:{i & 0xff:02x}"]
+        domains.append({
+            'uuid': str(uuid_lib.UUID(int=rng.getrandbits(128))),
+            'name': f"{rng.choice(('web', 'db', 'lab', 'ci'))}-{i:05d}",
+            'macs': macs,
+            'ips': [f"10.{i >> 16 & 0xff}.{i >> 8 & 0xff}.{i & 0xff}"],
+            'disks': [f"/var/lib/libvirt/images/vm-{i:05d}-{d}.qcow2" for d in range(2)],
+            'tags': rng.sample(TAGS, 2),
+        })
+    return domains
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the VM search index.")
+    parser.add_argument('--domains', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    domains = synthetic_domains(args.domains)
+    index = SearchIndex()
+    start = time.perf_counter()
+    for d in domains:
+        index.upsert(d['uuid'], d['name'], 'Running', macs=d['macs'], disks=d['disks'], tags=d['tags'])
+        index.set_ips(d['uuid'], d['ips'])
+    build = time.perf_counter() - start
+    print(f"indexed {len(index)} domains in {build * 1000:.1f} ms "
+          f"({build / len(domains) * 1e6:.1f} us/domain)")
+
+    probe = domains[len(domains) // 2]
+    queries = [
+        ('uuid', probe['uuid']),
+        ('name prefix', probe['name'][:6]),
+        ('mac', probe['macs'][0].upper()),
+        ('ip', probe['ips'][0]),
+        ('disk', probe['disks'][1]),
+        ('tag (limit 50)', 'tag:' + probe['tags'][0]),
+        ('no match', 'zzz-nothing'),
+    ]
+    print(f"{'query':>16} {'us/lookup':>10} {'hits':>5}")
+    for label, q in queries:
+        hits = len(index.search(q))
+        print(f"{label:>16} {timed(lambda: index.search(q), args.repeat):10.1f} {hits:5d}")
+
+    # Event-driven re-index of one domain (e.g. a NIC hot-plugged)
+    def reindex():
+        d = domains[random.randrange(len(domains))]
+        index.upsert(d['uuid'], d['name'], 'Running', macs=d['macs'] + ['52:54:00:ff:ff:ff'],
+                     disks=d['disks'], tags=d['tags'])
+        index.upsert(d['uuid'], d['name'], 'Running', macs=d['macs'], disks=d['disks'], tags=d['tags'])
+    print(f"{'re-index x2':>16} {timed(reindex, args.repeat):10.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
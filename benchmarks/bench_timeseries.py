@@ -0,0 +1,69 @@
+# benchmarks/bench_timeseries.py
+#
+# Ingest rate, query latency and memory footprint of the metrics history store
+# for a fleet of synthetic VMs. Needs no libvirt connection.
+#
+# Usage: python -m benchmarks.bench_timeseries --vms 500 --ticks 600
+
+import argparse
+import random
+import sys
+import time
+
+from app.core.timeseries import TimeSeriesStore
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the metrics time-series store.")
+    parser.add_argument('--vms', type=int, default=500)
+    parser.add_argument('--ticks', type=int, default=600, help="Samples per VM (one per simulated second)")
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    store = TimeSeriesStore(max_vms=args.vms)
+    uuids = [f"vm-{i:05d}" for i in range(args.vms)]
+    rng = random.Random(42)
+    start_ts = time.time() - args.ticks
+
+    print(f"Preallocated per VM: {store.bytes_per_vm() / 1024:.1f} KiB, "
+          f"upper bound for {args.vms} VMs: {store.memory_bytes() / 2**20:.1f} MiB")
+
+    start = time.perf_counter()
+    for tick in range(args.ticks):
+        ts = start_ts + tick
+        store.ingest_samples(ts, {uuid: {
+            'cpu_percent': rng.random() * 100,
+            'memory_kb': 1048576,
+            'net_rx_bps': rng.randrange(1 << 20),
+            'net_tx_bps': rng.randrange(1 << 20),
+            'disk_rd_bps': rng.randrange(1 << 22),
+            'disk_wr_bps': rng.randrange(1 << 22),
+        } for uuid in uuids})
+    elapsed = time.perf_counter() - start
+    samples = args.vms * args.ticks
+    print(f"Ingest: {samples} samples in {elapsed:.2f}s = {samples / elapsed:,.0f} samples/s "
+          f"({elapsed / args.ticks * 1000:.2f} ms per {args.vms}-VM tick)")
+
+    now = time.time()
+    cases = (
+        ("last 5 min @ 1s", 300, None),
+        ("last 15 min @ 10s", 900, 10),
+        ("last 1 h @ 1m", 3600, 60),
+        ("last 24 h @ 1m", 86400, 60),
+        ("last 24 h @ 1h", 86400, 3600),
+    )
+    for label, span, step in cases:
+        timings = []
+        for _ in range(args.queries):
+            uuid = rng.choice(uuids)
+            t0 = time.perf_counter()
+            store.query(uuid, now - span, now, step)
+            timings.append((time.perf_counter() - t0) * 1000)
+        timings.sort()
+        print(f"Query {label:<20} p50 {timings[len(timings) // 2]:.3f} ms, "
+              f"p99 {timings[int(len(timings) * 0.99) - 1]:.3f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
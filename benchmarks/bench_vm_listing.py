@@ -0,0 +1,126 @@
+# benchmarks/bench_vm_listing.py
+#
+# Compares the old per-domain /api/vms loop with the bulk getAllDomainStats
+# inventory against libvirt's test driver, reporting RPCs and latency per listing.
+#
+# Usage: python -m benchmarks.bench_vm_listing --sizes 10,100,400
+
+import argparse
+import sys
+import time
+
+import libvirt
+
+from app.core.libvirt_manager import LibvirtManager
+
+# Methods answered from the local virDomain object, not over the wire
+LOCAL_METHODS = {'name', 'UUIDString', 'ID', 'connect'}
+
+DOMAIN_XML = """
+<domain type='test'>
+  <name>{name}</name>
+  <memory unit='MiB'>256</memory>
+  <vcpu>1</vcpu>
+  <os><type arch='x86_64'>hvm</type></os>
+</domain>
+"""
+
+
+class CountingProxy:
+    """Wraps a libvirt object and counts calls that would reach libvirtd."""
+
+    def __init__(self, target, counter):
+        self._target = target
+        self._counter = counter
+
+    def __getattr__(self, attr):
+        value = getattr(self._target, attr)
+        if not callable(value):
+            return value
+
+        def wrapper(*args, **kwargs):
+            if attr not in LOCAL_METHODS:
+                self._counter[0] += 1
+            return self._wrap(value(*args, **kwargs))
+        return wrapper
+
+    def _wrap(self, result):
+        if isinstance(result, (libvirt.virDomain, libvirt.virConnect)):
+            return CountingProxy(result, self._counter)
+        if isinstance(result, list):
+            return [self._wrap(item) for item in result]
+        return result
+
+
+def legacy_listing(manager):
+    """The pre-bulk /api/vms loop: several RPCs per domain."""
+    all_vms = []
+    domains = manager.conn.listAllDomains(libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE | libvirt.VIR_CONNECT_LIST_DOMAINS_INACTIVE)
+    for dom in domains:
+        state_code, _ = dom.state()
+        all_vms.append({
+            "name": dom.name(),
+            "status": manager._get_vm_state_string(state_code),
+            "vcpu": dom.info()[3],
+            "memory_mb": int(dom.info()[2] / 1024),
+            "uuid": dom.UUIDString()
+        })
+    return all_vms
+
+
+def bulk_listing(manager):
+    """The current /api/vms path: one getAllDomainStats RPC."""
+    return manager.get_vm_inventory()
+
+
+def populate(conn, count):
+    """Defines synthetic domains until the connection holds `count` of them; starts every other one."""
+    existing = len(conn.listAllDomains(0))
+    for i in range(existing, count):
+        dom = conn.defineXML(DOMAIN_XML.format(name=f"bench-{i:05d}"))
+        if i % 2 == 0:
+            dom.create()
+
+
+def measure(manager, listing, repeat):
+    """Returns (rpcs per listing, best latency in ms) for one listing function."""
+    counter = [0]
+    raw_conn = manager.conn
+    manager.conn = CountingProxy(raw_conn, counter)
+    try:
+        listing(manager)
+        rpcs = counter[0]
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            listing(manager)
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        manager.conn = raw_conn
+    return rpcs, min(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark /api/vms listing strategies.")
+    parser.add_argument('--uri', default='test:///default')
+    parser.add_argument('--sizes', default='10,50,100,400')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    manager = LibvirtManager(args.uri)
+    if not manager.connect():
+        return 1
+
+    print(f"{'N':>6} {'legacy RPCs':>12} {'legacy ms':>10} {'bulk RPCs':>10} {'bulk ms':>8}")
+    for size in sorted(int(s) for s in args.sizes.split(',')):
+        populate(manager.conn, size)
+        legacy_rpcs, legacy_ms = measure(manager, legacy_listing, args.repeat)
+        bulk_rpcs, bulk_ms = measure(manager, bulk_listing, args.repeat)
+        print(f"{size:>6} {legacy_rpcs:>12} {legacy_ms:>10.2f} {bulk_rpcs:>10} {bulk_ms:>8.2f}")
+
+    manager.disconnect()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
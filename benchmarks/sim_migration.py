@@ -0,0 +1,88 @@
+# benchmarks/sim_migration.py
+#
+# Drain simulator for the migration engine. Runs MigrationEngine.drain()
+# against simulated hosts whose domains model pre-copy live migration: memory
+# is sent at the speed set by migrateSetMaxSpeed while the guest keeps
+# dirtying pages, so busy guests need several passes (or post-copy) to finish.
+# Time is scaled (--scale simulated seconds per real second).
+#
+# Checks the limits the engine promises while the drain runs:
+#
+#   - no host has more than --per-host migrations in flight
+#   - the caps of a host's migrations never add up to more than its budget
+#   - every VM leaves the drained host
+#
+# and reports the drain time, peak bandwidth per host and post-copy switches.
+# Exits non-zero if a limit is broken.
+#
+# Usage: python -m benchmarks.sim_migration --hosts 4 --vms 24 --bandwidth 1000
+
+import argparse
+import random
+import sys
+import time
+
+from app.core.fleet import FleetManager
+from app.core.migration import MigrationEngine
+from app.core.scheduler import PlacementScheduler
+from tests.migration_harness import TICK, SimDomain, SimHost, Simulation
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate draining a host with the migration engine.")
+    parser.add_argument('--hosts', type=int, default=4, help="Hosts including the drained one")
+    parser.add_argument('--vms', type=int, default=24)
+    parser.add_argument('--per-host', type=int, default=2)
+    parser.add_argument('--bandwidth', type=int, default=1000, help="Per-host budget in MiB/s (0 = none)")
+    parser.add_argument('--parallel', type=int, default=8)
+    parser.add_argument('--postcopy', action='store_true')
+    parser.add_argument('--auto-converge', action='store_true')
+    parser.add_argument('--scale', type=float, default=50.0, help="Simulated seconds per real second")
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    sim = Simulation(args.scale, args.per_host, args.bandwidth or None)
+    fleet = FleetManager(manager_factory=lambda uri: sim.hosts[uri])
+    for h in range(args.hosts):
+        host = SimHost(f"host-{h}")
+        sim.hosts[host.uri] = host
+        fleet.add_host(host.name, host.uri)
+    source = sim.hosts['sim://host-0']
+    for i in range(args.vms):
+        memory = rng.choice((1024, 2048, 4096, 8192))
+        # A few busy guests dirty memory faster than their share of the link
+        dirty = rng.choice((10, 50, 100, 400)) if i % 6 else 900
+        source.domains[f"vm-{i:03d}"] = SimDomain(sim, source, f"vm-{i:03d}", memory, dirty)
+    busy = {d.name for d in source.domains.values() if d.dirty_mib_s >= 900}
+
+    engine = MigrationEngine(fleet, max_per_host=args.per_host, host_bandwidth_mib=args.bandwidth or None)
+    engine.POLL_INTERVAL = TICK * 5
+    start = time.perf_counter()
+    try:
+        result = engine.drain('host-0', PlacementScheduler('spread'), parallel=args.parallel,
+                              postcopy=args.postcopy, auto_converge=args.auto_converge)
+    except Exception as e:
+        result = {'migrated': [], 'failed': [{'vm': '*', 'dest': None, 'error': str(e)}]}
+    elapsed = (time.perf_counter() - start) * args.scale
+    fleet.close()
+
+    switched = sorted(d.name for h in sim.hosts.values() for d in h.domains.values() if d.switched)
+    print(f"migrated {len(result['migrated'])}/{args.vms} in {elapsed:.0f} simulated s, "
+          f"{len(result['failed'])} failed, {len(switched)} switched to post-copy")
+    for host in sorted(sim.peak):
+        print(f"  {host}: peak {sim.peak[host]:.0f} MiB/s, {len(sim.hosts['sim://' + host].domains)} VMs")
+    failures = list(dict.fromkeys(sim.errors))
+    # Without post-copy or auto-converge the busiest guests may legitimately fail
+    stuck = set(source.domains) - (set() if args.postcopy or args.auto_converge else busy)
+    if stuck:
+        failures.append(f"{len(stuck)} VMs left on host-0")
+    for entry in result['failed']:
+        print(f"  failed {entry['vm']}: {entry['error']}")
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
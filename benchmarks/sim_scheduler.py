@@ -0,0 +1,112 @@
+# benchmarks/sim_scheduler.py
+#
+# Placement simulator for the scheduler. Builds a synthetic fleet of NUMA
+# hosts, feeds a random stream of VM requests through each policy and checks
+# the invariants every placement must keep:
+#
+#   - no cell is committed beyond its memory (minus the reserve)
+#   - no cell or host exceeds the vCPU overcommit ratio
+#   - pinned VMs get exactly their cell's CPUs and node
+#   - binpack never uses more hosts than spread
+#
+# Then reports consolidation (hosts in use, utilization) and how many VMs
+# had to span cells. Exits non-zero if an invariant is broken, so it can run
+# in CI next to the benchmarks.
+#
+# Usage: python -m benchmarks.sim_scheduler --hosts 20 --vms 600 --seed 7
+
+import argparse
+import random
+import sys
+
+from app.core.scheduler import CellState, HostState, PlacementScheduler, SchedulingError, cpuset_string
+
+# (vcpu, memory_mb) shapes and how often they are requested
+SHAPES = ((1, 1024), (2, 2048), (2, 4096), (4, 8192), (8, 16384), (16, 65536))
+WEIGHTS = (30, 30, 20, 12, 6, 2)
+
+
+def build_fleet(hosts, cells, cpus_per_cell, memory_gb_per_cell):
+    fleet = []
+    for h in range(hosts):
+        fleet.append(HostState(f"host-{h:02d}", [
+            CellState(c, range(c * cpus_per_cell, (c + 1) * cpus_per_cell), memory_gb_per_cell * 1024 ** 2)
+            for c in range(cells)]))
+    return fleet
+
+
+def check(fleet, placements, requests, scheduler):
+    """Returns a list of invariant violations (empty if all good)."""
+    errors = []
+    for host in fleet:
+        if host.vcpus > host.cpus * scheduler.cpu_ratio + 1e-9:
+            errors.append(f"{host.name}: {host.vcpus} vCPUs over ratio")
+        for cell in host.cells:
+            if cell.committed_kb > cell.memory_kb - scheduler.reserve_kb:
+                errors.append(f"{host.name}/cell{cell.id}: memory overcommitted")
+            if cell.vcpus > len(cell.cpus) * scheduler.cpu_ratio + 1e-9:
+                errors.append(f"{host.name}/cell{cell.id}: {cell.vcpus} vCPUs over ratio")
+    by_name = {h.name: h for h in fleet}
+    for placement, (vcpu, _) in zip(placements, requests):
+        if isinstance(placement, SchedulingError) or placement.cell is None or not placement.cpuset:
+            continue
+        cell = by_name[placement.host].cells[placement.cell]
+        if placement.cpuset != cpuset_string(cell.cpus) or placement.nodeset != str(cell.id):
+            errors.append(f"{placement.host}: pinning doesn't match cell {cell.id}")
+        if placement.tuning.count('<vcpupin ') != vcpu:
+            errors.append(f"{placement.host}: {vcpu} vCPUs but a different number of vcpupins")
+    return errors
+
+
+def simulate(policy, args, requests):
+    fleet = build_fleet(args.hosts, args.cells, args.cpus_per_cell, args.memory_gb)
+    scheduler = PlacementScheduler(policy, cpu_ratio=args.cpu_ratio, reserve_mb=args.reserve_mb)
+    placements = scheduler.place_many(requests, fleet)
+    used = [h for h in fleet if h.committed_kb]
+    placed = [p for p in placements if not isinstance(p, SchedulingError)]
+    mem_util = [h.committed_kb / h.memory_kb for h in used]
+    stats = {
+        'placed': len(placed),
+        'rejected': len(placements) - len(placed),
+        'hosts_used': len(used),
+        'spanning': sum(1 for p in placed if p.cell is None),
+        'mem_util_avg': sum(mem_util) / len(mem_util) if mem_util else 0.0,
+        'mem_util_min': min(mem_util) if mem_util else 0.0,
+    }
+    return stats, check(fleet, placements, requests, scheduler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate VM placement policies.")
+    parser.add_argument('--hosts', type=int, default=20)
+    parser.add_argument('--cells', type=int, default=2)
+    parser.add_argument('--cpus-per-cell', type=int, default=16)
+    parser.add_argument('--memory-gb', type=int, default=128, help="Memory per cell")
+    parser.add_argument('--cpu-ratio', type=float, default=4.0)
+    parser.add_argument('--reserve-mb', type=int, default=512)
+    parser.add_argument('--vms', type=int, default=600)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    requests = rng.choices(SHAPES, WEIGHTS, k=args.vms)
+
+    print(f"{'policy':>8} {'placed':>7} {'rejected':>9} {'hosts':>6} {'spanning':>9} {'mem avg':>8} {'mem min':>8}")
+    results = {}
+    failures = []
+    for policy in ('binpack', 'spread'):
+        stats, errors = simulate(policy, args, requests)
+        results[policy] = stats
+        failures.extend(f"{policy}: {e}" for e in errors)
+        print(f"{policy:>8} {stats['placed']:7d} {stats['rejected']:9d} {stats['hosts_used']:6d} "
+              f"{stats['spanning']:9d} {stats['mem_util_avg']:8.1%} {stats['mem_util_min']:8.1%}")
+
+    if results['binpack']['hosts_used'] > results['spread']['hosts_used']:
+        failures.append("binpack used more hosts than spread")
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,479 @@
+# benchmarks/suite.py
+#
+# Reproducible performance suite, offline, on libvirt's test driver. For each
+# size (--sizes, domains) a child process opens test:///<node file> generated
+# by benchmarks.testdriver and times, on the same manager the web app uses:
+#
+#   manager.*  LibvirtManager listing, lookup, details, search, storage
+#   lifecycle.* suspend/resume and start/destroy, single and batched
+#   xml.*      domain XML rendering, parsing and clone templating (size-independent)
+#   http.*     every GET endpoint of the Flask app plus the main POST ones
+#
+# Each case records the median/p95/min time per operation and how many libvirt
+# calls one operation makes (from the instrumentation layer). Results go to
+# --output as JSON. With --baseline the run is compared case by case: a case is
+# a regression if its median grew by more than --threshold (and by more than
+# --floor-ms) or if it makes more libvirt calls than before. The exit status is
+# 1 if anything regressed, so the suite can gate changes.
+#
+# Usage: python -m benchmarks.suite --sizes 10,100,1000 --baseline benchmarks/baseline.json
+#        python -m benchmarks.suite --save-baseline benchmarks/baseline.json
+
+import argparse
+import fnmatch
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SUITE_VERSION = 1
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+class Skip(Exception):
+    """Raised by a case's setup when it cannot run at this size or on this driver."""
+
+
+CASES = []  # [(name, setup, sized)]
+
+def case(name, sized=True):
+    """
+    Registers setup(ctx) -> op; op() is what gets timed. Unsized cases run
+    only at the smallest size.
+    """
+    def register(setup):
+        CASES.append((name, setup, sized))
+        return setup
+    return register
+
+
+class Context:
+    """What the cases work on: the web app's manager and test client, and sample names."""
+
+    def __init__(self, size):
+        import libvirt
+        from app import main
+        self.size = size
+        self.main = main
+        self.manager = main.libvirt_manager
+        if not self.manager.connect():
+            raise RuntimeError(f"Cannot connect to {self.manager.uri}")
+        self.conn = self.manager.conn
+        ensure_domains(self.conn, size)
+        self.manager.resync_inventory()
+        vms = sorted(self.manager.get_vm_inventory() or [], key=lambda vm: vm['name'])
+        running = libvirt.VIR_DOMAIN_RUNNING
+        self.running = [vm['name'] for vm in vms if vm['state_code'] == running]
+        self.stopped = [vm['name'] for vm in vms if vm['state_code'] == libvirt.VIR_DOMAIN_SHUTOFF]
+        self.names = [vm['name'] for vm in vms]
+        pools = self.manager.list_storage_pools()
+        self.pool = pools[0] if pools else None
+        index = self.manager.get_storage_index()
+        volumes = index.volumes(self.pool) if index is not None and self.pool else None
+        self.volume = volumes[0]['path'] if volumes else None
+        self.client = main.app.test_client()
+        job = main.job_manager.submit('suite', 'noop', lambda: True)
+        self.job = job.id if job is not None else None
+
+    def sample(self, names, count=50):
+        """Up to `count` names spread over `names`, cycled forever."""
+        if not names:
+            raise Skip("no matching domains")
+        step = max(1, len(names) // count)
+        return itertools.cycle(names[::step][:count])
+
+
+def ensure_domains(conn, size):
+    """Defines the suite's domains if the driver did not load them from the node file."""
+    from benchmarks.testdriver import domain_xml, layout
+    existing = len(conn.listAllDomains(0))
+    if existing >= size:
+        return
+    pools, networks = layout(size)
+    for index in range(existing, size):
+        dom = conn.defineXML(domain_xml(index, f"/bench-pool-{index % pools}", f"bench-net-{index % networks}"))
+        if index % 2 == 0:
+            dom.create()
+
+
+# --- LibvirtManager ---
+@case('manager.list_vms')
+def list_vms_cached(ctx):
+    if not ctx.manager.inventory.is_ready():
+        raise Skip("inventory cache not live (no domain events)")
+    return ctx.manager.list_vms
+
+@case('manager.get_vm_inventory')
+def list_vms_bulk(ctx):
+    return ctx.manager.get_vm_inventory
+
+@case('manager.find_vm')
+def find_vm(ctx):
+    names = ctx.sample(ctx.names)
+    return lambda: ctx.manager.find_vm(next(names))
+
+@case('manager.get_vm_details.cold')
+def vm_details_cold(ctx):
+    names = ctx.sample(ctx.names)
+
+    def op():
+        ctx.manager.domain_xml.clear()
+        ctx.manager.get_vm_details(next(names))
+    return op
+
+@case('manager.get_vm_details.warm')
+def vm_details_warm(ctx):
+    names = ctx.sample(ctx.names)
+    return lambda: ctx.manager.get_vm_details(next(names))
+
+@case('manager.search_vms')
+def search_vms(ctx):
+    queries = itertools.cycle(('bench-000', 'tag:web', '52:54:00:00:00:0', 'disk:/bench-pool-0/bench-00001.qcow2'))
+    return lambda: ctx.manager.search_vms(next(queries))
+
+@case('manager.select_vms')
+def select_vms(ctx):
+    return lambda: ctx.manager.select_vms(selector={'state': 'Running', 'tag': 'db'})
+
+@case('manager.list_storage_pools')
+def list_storage_pools(ctx):
+    return ctx.manager.list_storage_pools
+
+@case('manager.get_storage_index.cold')
+def storage_index_cold(ctx):
+    def op():
+        ctx.manager.storage.invalidate()
+        ctx.manager.get_storage_index()
+    return op
+
+@case('manager.list_snapshots')
+def list_snapshots(ctx):
+    names = ctx.sample(ctx.names)
+    return lambda: ctx.manager.list_snapshots(next(names))
+
+# --- Lifecycle ---
+@case('lifecycle.suspend_resume')
+def suspend_resume(ctx):
+    names = ctx.sample(ctx.running)
+
+    def op():
+        name = next(names)
+        ctx.manager.suspend_vm(name)
+        ctx.manager.resume_vm(name)
+    return op
+
+@case('lifecycle.start_destroy')
+def start_destroy(ctx):
+    names = ctx.sample(ctx.stopped)
+
+    def op():
+        name = next(names)
+        ctx.manager.start_vm(name)
+        ctx.manager.destroy_vm(name)
+    return op
+
+@case('lifecycle.batch_suspend_resume')
+def batch_suspend_resume(ctx):
+    names = ctx.running[:100]
+    if not names:
+        raise Skip("no running domains")
+
+    def op():
+        list(ctx.manager.suspend_many(names))
+        list(ctx.manager.resume_many(names))
+    return op
+
+# --- Domain XML ---
+@case('xml.render', sized=False)
+def xml_render(ctx):
+    from app.core.domain_builder import VMProfile
+    profile = VMProfile(disks=[{'format': 'qcow2', 'bus': 'virtio'}], vcpu=2, memory_mb=2048)
+    counter = itertools.count()
+
+    def op():
+        i = next(counter)
+        profile.render(f"suite-{i:06d}", disk_paths=[f"/pool/suite-{i:06d}.qcow2"])
+    return op
+
+@case('xml.parse', sized=False)
+def xml_parse(ctx):
+    from app.core.domain_xml import parse_domain_xml
+    from benchmarks.testdriver import domain_xml
+    xml = domain_xml(0, '/bench-pool-0', 'bench-net-0')
+    return lambda: parse_domain_xml(xml)
+
+@case('xml.clone_template', sized=False)
+def xml_clone_template(ctx):
+    from app.core.cloning import CloneTemplate
+    from benchmarks.testdriver import domain_xml
+    template = CloneTemplate(domain_xml(0, '/bench-pool-0', 'bench-net-0'))
+    counter = itertools.count()
+
+    def op():
+        uuid, macs = template.identity()
+        i = next(counter)
+        template.render(f"clone-{i:06d}", [f"/pool/clone-{i:06d}.qcow2"], uuid, macs)
+    return op
+
+# --- HTTP ---
+# GET rules needing path arguments or a query: rule -> URL template over ctx
+HTTP_URLS = {
+    '/api/vms': '/api/vms?limit=50',
+    '/api/vms/<name>': '/api/vms/{vm}',
+    '/api/vms/<name>/metrics': '/api/vms/{vm}/metrics',
+    '/api/vms/<name>/snapshots': '/api/vms/{vm}/snapshots',
+    '/api/storage/pools/<name>/volumes': '/api/storage/pools/{pool}/volumes',
+    '/api/storage/volumes/chain': '/api/storage/volumes/chain?path={volume}',
+    '/api/jobs/<job_id>': '/api/jobs/{job}',
+    '/api/search': '/api/search?q=bench-000',
+}
+HTTP_SKIPPED = {
+    '/api/stream/metrics': "endless event stream",
+    '/static/<path:filename>': "static files",
+}
+# POST endpoints worth timing; the rest create or destroy things
+HTTP_POSTS = (
+    ('/api/vm/<name>/<action>', '/api/vm/{vm}/resume', None),
+    ('/api/vms/batch', '/api/vms/batch', lambda ctx: {'action': 'resume', 'names': ctx.running[:10]}),
+    ('/api/scheduler/plan', '/api/scheduler/plan', lambda ctx: {'vcpu': 2, 'memory_mb': 2048, 'count': 10}),
+)
+
+def http_cases(app):
+    """(name, setup) for every GET rule of the Flask app and the POSTs in HTTP_POSTS."""
+    cases = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+        if 'GET' not in rule.methods:
+            continue
+        cases.append((f"http.GET {rule.rule}", _http_setup('GET', rule.rule, HTTP_URLS.get(rule.rule, rule.rule))))
+    for rule, url, body in HTTP_POSTS:
+        cases.append((f"http.POST {rule}", _http_setup('POST', rule, url, body)))
+    return cases
+
+def _http_setup(method, rule, template, body=None):
+    def setup(ctx):
+        if rule in HTTP_SKIPPED:
+            raise Skip(HTTP_SKIPPED[rule])
+        if '<' in template:
+            raise Skip("no sample URL for this rule (add it to HTTP_URLS)")
+        names = ctx.sample(ctx.running or ctx.names)
+        values = {'pool': ctx.pool, 'volume': ctx.volume, 'job': ctx.job}
+        for key in ('pool', 'volume', 'job'):
+            if '{' + key + '}' in template and values[key] is None:
+                raise Skip(f"no {key} on this driver")
+        data = body(ctx) if body else None
+
+        def op():
+            url = template.format(vm=next(names), **values)
+            response = ctx.client.open(url, method=method, json=data)
+            response.get_data() # Drains streamed bodies
+            if response.status_code >= 500:
+                raise RuntimeError(f"{method} {url}: HTTP {response.status_code}")
+        return op
+    return setup
+
+
+# --- Timing ---
+def total_calls(stats):
+    return sum(row['calls'] for row in stats.methods())
+
+def measure(op, stats, repeat, min_time, max_runs=2000):
+    """
+    Times op() at least `repeat` times and for at least `min_time` seconds.
+    Libvirt calls are counted process-wide, so calls made on worker threads
+    (batch actions, jobs) are included.
+    """
+    op() # Warm-up: caches, lazy imports
+    timings, calls = [], []
+    started = time.perf_counter()
+    while len(timings) < repeat or (time.perf_counter() - started < min_time and len(timings) < max_runs):
+        before = total_calls(stats)
+        start = time.perf_counter()
+        op()
+        timings.append((time.perf_counter() - start) * 1000)
+        calls.append(total_calls(stats) - before)
+    timings.sort()
+    return {
+        'median_ms': round(statistics.median(timings), 4),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+        'min_ms': round(timings[0], 4),
+        'runs': len(timings),
+        'calls': int(statistics.median(calls)),
+    }
+
+def run_size(size, smallest, repeat, min_time, patterns):
+    """Child process body: runs every selected case at one size. Returns {case: result}."""
+    ctx = Context(size)
+    stats = ctx.main.rpc_stats
+    if stats is None:
+        raise RuntimeError("libvirt call statistics are disabled (GRENADE_RPC_STATS=0)")
+    results = {}
+    for name, setup, sized in CASES + [(n, s, True) for n, s in http_cases(ctx.main.app)]:
+        if not sized and not smallest:
+            continue
+        if patterns and not any(fnmatch.fnmatch(name, p) for p in patterns):
+            continue
+        try:
+            op = setup(ctx)
+            results[name] = measure(op, stats, repeat, min_time)
+        except Skip as e:
+            results[name] = {'skipped': str(e)}
+        except Exception as e:
+            print(f"Case {name} failed: {e}", file=sys.stderr)
+            results[name] = {'error': str(e)}
+    ctx.main.job_manager.shutdown(wait=False)
+    return results
+
+
+# --- Comparison ---
+def compare(baseline, current, threshold, floor_ms):
+    """
+    Case-by-case comparison. Returns (rows, regressions); a row is
+    (size, case, baseline ms, current ms, change, calls before, calls now, status).
+    """
+    rows, regressions = [], 0
+    for size, cases in sorted(current['results'].items(), key=lambda item: int(item[0])):
+        base_cases = baseline.get('results', {}).get(size, {})
+        for name, result in sorted(cases.items()):
+            base = base_cases.get(name)
+            if 'median_ms' not in result or not base or 'median_ms' not in base:
+                status = 'new' if base is None and 'median_ms' in result else 'n/a'
+                rows.append((size, name, None, result.get('median_ms'), None, None, result.get('calls'), status))
+                continue
+            change = (result['median_ms'] - base['median_ms']) / base['median_ms'] if base['median_ms'] else 0.0
+            status = 'ok'
+            if result['calls'] > base['calls']:
+                status = 'MORE CALLS'
+            elif change > threshold and result['median_ms'] - base['median_ms'] > floor_ms:
+                status = 'SLOWER'
+            elif change < -threshold and base['median_ms'] - result['median_ms'] > floor_ms:
+                status = 'faster'
+            regressions += status in ('MORE CALLS', 'SLOWER')
+            rows.append((size, name, base['median_ms'], result['median_ms'], change,
+                         base['calls'], result['calls'], status))
+    return rows, regressions
+
+def print_comparison(rows):
+    print(f"{'size':>5} {'case':<48} {'base ms':>9} {'now ms':>9} {'change':>8} {'calls':>9}  status")
+    for size, name, base, now, change, base_calls, calls, status in rows:
+        print(f"{size:>5} {name:<48} {_fmt(base):>9} {_fmt(now):>9} "
+              f"{'' if change is None else f'{change * 100:+.1f}%':>8} "
+              f"{'' if base_calls is None else base_calls}->{'' if calls is None else calls:<4}  {status}")
+
+def print_results(results):
+    print(f"{'size':>5} {'case':<48} {'median ms':>10} {'p95 ms':>9} {'calls':>6}")
+    for size, cases in sorted(results.items(), key=lambda item: int(item[0])):
+        for name, result in sorted(cases.items()):
+            if 'median_ms' in result:
+                print(f"{size:>5} {name:<48} {result['median_ms']:>10.3f} {result['p95_ms']:>9.3f} {result['calls']:>6}")
+            else:
+                print(f"{size:>5} {name:<48} {result.get('skipped') or 'ERROR ' + result.get('error', '')}")
+
+def _fmt(value):
+    return '' if value is None else f"{value:.3f}"
+
+
+def metadata(args):
+    try:
+        import libvirt
+        libvirt_version = libvirt.getVersion()
+    except Exception:
+        libvirt_version = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {'suite_version': SUITE_VERSION, 'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+            'libvirt_version': libvirt_version, 'sizes': args.sizes, 'repeat': args.repeat,
+            'min_time': args.min_time}
+
+
+def run_child(args, size, smallest, workdir):
+    """Runs one size in a fresh process (the web app's globals are per process)."""
+    from benchmarks.testdriver import node_xml
+    node_path = os.path.join(workdir, f"node-{size}.xml")
+    with open(node_path, 'w') as f:
+        f.write(node_xml(size))
+    output = os.path.join(workdir, f"result-{size}.json")
+    env = dict(os.environ,
+               GRENADE_LIBVIRT_URI=args.uri or f"test://{node_path}",
+               GRENADE_SAMPLE_INTERVAL='3600', # Keep the metrics sampler out of the timings
+               GRENADE_RPC_STATS='1')
+    command = [sys.executable, '-m', 'benchmarks.suite', '--child-size', str(size), '--child-output', output,
+               '--repeat', str(args.repeat), '--min-time', str(args.min_time)]
+    if smallest:
+        command.append('--child-smallest')
+    for pattern in args.only:
+        command += ['--only', pattern]
+    started = time.perf_counter()
+    completed = subprocess.run(command, env=env, stdout=subprocess.DEVNULL)
+    if completed.returncode != 0 or not os.path.exists(output):
+        print(f"Size {size}: suite process failed (exit {completed.returncode})", file=sys.stderr)
+        return None
+    with open(output) as f:
+        results = json.load(f)
+    print(f"size {size}: {len(results)} cases in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the performance suite on libvirt's test driver.")
+    parser.add_argument('--sizes', default='10,100,1000,5000', help="Domain counts, comma-separated")
+    parser.add_argument('--uri', default=None,
+                        help="Use this URI instead of a generated test:///node file (missing domains are defined)")
+    parser.add_argument('--repeat', type=int, default=10, help="Minimum runs per case")
+    parser.add_argument('--min-time', type=float, default=0.3, help="Minimum seconds per case")
+    parser.add_argument('--only', action='append', default=[], help="Case name glob (repeatable)")
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--baseline', default=None, help=f"Compare with this result file (default {DEFAULT_BASELINE} if present)")
+    parser.add_argument('--save-baseline', default=None, metavar='PATH', help="Also write the results here")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Relative slowdown that counts as a regression")
+    parser.add_argument('--floor-ms', type=float, default=0.05, help="Ignore slowdowns smaller than this")
+    parser.add_argument('--child-size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--child-output', help=argparse.SUPPRESS)
+    parser.add_argument('--child-smallest', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child_size is not None:
+        results = run_size(args.child_size, args.child_smallest, args.repeat, args.min_time, args.only)
+        with open(args.child_output, 'w') as f:
+            json.dump(results, f)
+        os._exit(0) # Skip joining the app's background threads
+
+    sizes = sorted(int(s) for s in args.sizes.split(','))
+    report = {'meta': metadata(args), 'results': {}}
+    with tempfile.TemporaryDirectory(prefix='grenade-suite-') as workdir:
+        for size in sizes:
+            results = run_child(args, size, size == sizes[0], workdir)
+            if results is None:
+                return 1
+            report['results'][str(size)] = results
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    print_results(report['results'])
+
+    baseline_path = args.baseline or (DEFAULT_BASELINE if os.path.exists(DEFAULT_BASELINE) and not args.save_baseline
+                                      else None)
+    if baseline_path is None:
+        return 0
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('meta', {}).get('commit')}):")
+    rows, regressions = compare(baseline, report, args.threshold, args.floor_ms)
+    print_comparison(rows)
+    if regressions:
+        print(f"{regressions} regression(s)", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+# benchmarks/testdriver.py
+#
+# Node definitions for libvirt's test driver. test:///<absolute path> opens a
+# private in-memory hypervisor built from the file, so a benchmark can start
+# from the same N domains, pools and networks every time, offline.
+#
+# Usage: python -m benchmarks.testdriver --domains 1000 > /tmp/node-1000.xml
+#        virsh -c test:///tmp/node-1000.xml list --all
+
+import argparse
+import sys
+import uuid
+from xml.sax.saxutils import escape
+
+from app.core.domain_builder import metadata_xml
+
+# Fixed namespace so UUIDs (and so every run's output) are reproducible
+UUID_NAMESPACE = uuid.UUID('6c1f4a8e-9d5b-4e2a-8f3c-2b7d9e0a1c45')
+TEST_NS = 'http://libvirt.org/schemas/domain/test/1.0'
+VOLUME_BYTES = 10 * 1024 ** 3
+# Tags cycled over the domains, for tag search/selectors
+TAGS = ('web', 'db', 'cache', 'batch')
+
+
+def domain_name(index):
+    return f"bench-{index:05d}"
+
+
+def domain_uuid(index):
+    return str(uuid.uuid5(UUID_NAMESPACE, domain_name(index)))
+
+
+def domain_mac(index):
+    return "52:54:00:%02x:%02x:%02x" % ((index >> 16) & 0xff, (index >> 8) & 0xff, index & 0xff)
+
+
+def domain_xml(index, pool_path, network, running=True):
+    """One test-driver domain: a qcow2 disk in `pool_path`, a NIC on `network`, a tag."""
+    name = domain_name(index)
+    runstate = '' if running else "  <test:runstate>5</test:runstate>\n" # VIR_DOMAIN_SHUTOFF
+    return (
+        f"<domain type='test' xmlns:test='{TEST_NS}'>\n"
+        f"  <name>{name}</name>\n"
+        f"  <uuid>{domain_uuid(index)}</uuid>\n"
+        f"{metadata_xml([TAGS[index % len(TAGS)]])}"
+        "  <memory unit='MiB'>512</memory>\n"
+        "  <currentMemory unit='MiB'>512</currentMemory>\n"
+        f"  <vcpu>{1 + index % 4}</vcpu>\n"
+        "  <os><type arch='x86_64'>hvm</type></os>\n"
+        "  <devices>\n"
+        "    <disk type='file' device='disk'>\n"
+        "      <driver name='qemu' type='qcow2'/>\n"
+        f"      <source file='{escape(pool_path)}/{name}.qcow2'/>\n"
+        "      <target dev='vda' bus='virtio'/>\n"
+        "    </disk>\n"
+        "    <interface type='network'>\n"
+        f"      <mac address='{domain_mac(index)}'/>\n"
+        f"      <source network='{network}'/>\n"
+        "      <model type='virtio'/>\n"
+        "    </interface>\n"
+        "  </devices>\n"
+        f"{runstate}"
+        "</domain>\n"
+    )
+
+
+def volume_xml(name, allocation):
+    return (
+        "    <volume type='file'>\n"
+        f"      <name>{name}</name>\n"
+        f"      <capacity unit='bytes'>{VOLUME_BYTES}</capacity>\n"
+        f"      <allocation unit='bytes'>{allocation}</allocation>\n"
+        "      <target><format type='qcow2'/></target>\n"
+        "    </volume>\n"
+    )
+
+
+def layout(domains, pools=None, networks=None):
+    """(pools, networks) used for `domains` domains: one of each per 500 domains by default."""
+    return pools or max(1, domains // 500), networks or max(1, domains // 500)
+
+
+def node_xml(domains, pools=None, networks=None, unattached=None):
+    """
+    A <node> document with `domains` domains (every other one shut off), their
+    disks as volumes spread over `pools` pools, `unattached` spare volumes
+    (10% of the domains by default) and `networks` NAT networks.
+    """
+    pools, networks = layout(domains, pools, networks)
+    unattached = domains // 10 if unattached is None else unattached
+    parts = [
+        "<node>\n",
+        "  <cpu><nodes>2</nodes><sockets>2</sockets><cores>8</cores><threads>2</threads>"
+        "<active>64</active><mhz>2400</mhz><model>x86_64</model></cpu>\n",
+        f"  <memory>{max(64, domains) * 1024 * 1024}</memory>\n",
+    ]
+    for index in range(domains):
+        parts.append(domain_xml(index, f"/bench-pool-{index % pools}", f"bench-net-{index % networks}",
+                                running=index % 2 == 0))
+    for n in range(networks):
+        parts.append(
+            "<network>\n"
+            f"  <name>bench-net-{n}</name>\n"
+            f"  <bridge name='vbench{n}'/>\n"
+            "  <forward mode='nat'/>\n"
+            f"  <ip address='10.{n // 256}.{n % 256}.1' netmask='255.255.255.0'>\n"
+            f"    <dhcp><range start='10.{n // 256}.{n % 256}.2' end='10.{n // 256}.{n % 256}.254'/></dhcp>\n"
+            "  </ip>\n"
+            "</network>\n")
+    for p in range(pools):
+        parts.append(
+            "<pool type='dir'>\n"
+            f"  <name>bench-pool-{p}</name>\n"
+            f"  <capacity unit='bytes'>{VOLUME_BYTES * (domains + unattached + 1)}</capacity>\n"
+            "  <allocation unit='bytes'>0</allocation>\n"
+            f"  <available unit='bytes'>{VOLUME_BYTES * (domains + unattached + 1)}</available>\n"
+            "  <source/>\n"
+            f"  <target><path>/bench-pool-{p}</path></target>\n")
+        for index in range(p, domains, pools):
+            parts.append(volume_xml(f"{domain_name(index)}.qcow2", (index % 10 + 1) * 1024 ** 3))
+        for spare in range(p, unattached, pools):
+            parts.append(volume_xml(f"spare-{spare:05d}.qcow2", 1024 ** 2))
+        parts.append("</pool>\n")
+    parts.append("</node>\n")
+    return ''.join(parts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a libvirt test driver node definition.")
+    parser.add_argument('--domains', type=int, default=100)
+    parser.add_argument('--pools', type=int, default=None)
+    parser.add_argument('--networks', type=int, default=None)
+    args = parser.parse_args(argv)
+    sys.stdout.write(node_xml(args.domains, args.pools, args.networks))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
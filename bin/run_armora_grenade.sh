@@ -62,7 +62,8 @@ echo "Starting Armora Grenade web server..."
 # Using gunicorn for production-ready deployment is recommended.
 # For simplicity, we'll use Flask's built-in server here, but redirect output to a log file.
 # Note: For production, do NOT use debug=True or the built-in server.
-# Consider 'gunicorn -w 4 app.main:app' (after installing gunicorn)
+# Consider 'gunicorn -c "$APP_ROOT/gunicorn.conf.py" -w 4 app.main:app' (after installing gunicorn);
+# the config starts the background collectors in every worker.
 
 nohup python3 "$APP_ROOT/app/main.py" > "$LOG_FILE" 2>&1 &
 PID=$!
@@ -0,0 +1,19 @@
+# gunicorn.conf.py
+#
+# gunicorn settings for the Flask app: gunicorn -c gunicorn.conf.py -w 4 app.main:app
+# (picked up automatically when gunicorn runs from the repository root).
+#
+# Importing app.main starts no threads, so each worker starts the metrics
+# history sampler and the guest agent collector itself once it is forked.
+
+bind = '0.0.0.0:5000'
+
+
+def post_worker_init(worker):
+    from app.main import start_background
+    start_background()
+
+
+def worker_exit(server, worker):
+    from app.main import stop_background
+    stop_background()
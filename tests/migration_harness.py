@@ -0,0 +1,171 @@
+# tests/migration_harness.py
+#
+# Mocked hosts and domains for the migration engine, shared by
+# tests/test_migration.py and benchmarks/sim_migration.py. SimDomain models
+# pre-copy live migration: memory is sent at the speed set by
+# migrateSetMaxSpeed while the guest keeps dirtying pages. Simulation records
+# every slot or bandwidth limit broken while migrations run.
+
+import threading
+import time
+
+import libvirt
+
+TICK = 0.002    # real seconds per simulation step
+LINK_MIB = 10000  # speed of an uncapped migration, MiB/s
+
+
+class Simulation:
+    """Shared clock scale and the bookkeeping behind the checks."""
+
+    def __init__(self, scale, per_host, budget):
+        self.scale = scale
+        self.per_host = per_host
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.inflight = {}  # host -> {domain}
+        self.peak = {}      # host -> highest sum of caps seen
+        self.errors = []
+        self.hosts = {}     # uri -> SimHost
+
+    def enter(self, domain, *hosts):
+        with self.lock:
+            for host in hosts:
+                self.inflight.setdefault(host, set()).add(domain)
+            self.check_locked()
+
+    def leave(self, domain, *hosts):
+        with self.lock:
+            for host in hosts:
+                self.inflight[host].discard(domain)
+
+    def check_locked(self):
+        for host, domains in self.inflight.items():
+            if len(domains) > self.per_host:
+                self.errors.append(f"{host}: {len(domains)} migrations in flight")
+            total = sum(d.speed or LINK_MIB for d in domains)
+            if domains:
+                self.peak[host] = max(self.peak.get(host, 0), total)
+            if self.budget and total > self.budget:
+                self.errors.append(f"{host}: caps add up to {total} MiB/s")
+
+
+class SimDomain:
+    """A running guest with `memory_mib` of RAM dirtying `dirty_mib_s` of it per second."""
+
+    def __init__(self, sim, host, name, memory_mib, dirty_mib_s):
+        self.sim = sim
+        self.host = host
+        self.name = name
+        self.memory_mib = memory_mib
+        self.dirty_mib_s = dirty_mib_s
+        self.speed = None
+        self.stats = {}
+        self.postcopy = False
+        self.switched = False
+
+    def migrateSetMaxSpeed(self, speed, flags=0):
+        self.speed = speed
+        with self.sim.lock:
+            self.sim.check_locked()
+
+    def migrateSetMaxDowntime(self, downtime, flags=0):
+        pass
+
+    def migrateStartPostCopy(self, flags=0):
+        if not self.postcopy:
+            raise libvirt.libvirtError("post-copy not enabled for this migration")
+        self.switched = True
+
+    def jobStats(self, flags=0):
+        return dict(self.stats)
+
+    def migrateToURI3(self, uri, params, flags):
+        dest = self.sim.hosts[uri]
+        self.postcopy = bool(flags & libvirt.VIR_MIGRATE_POSTCOPY)
+        throttle = 0.5 if flags & libvirt.VIR_MIGRATE_AUTO_CONVERGE else 1.0
+        self.sim.enter(self, self.host.name, dest.name)
+        try:
+            dirty_rate = self.dirty_mib_s
+            remaining, processed = float(self.memory_mib), 0.0
+            iteration, elapsed = 1, 0.0
+            while True:
+                time.sleep(TICK)
+                dt = TICK * self.sim.scale
+                elapsed += dt
+                sent = min(remaining, (self.speed or LINK_MIB) * dt)
+                processed += sent
+                remaining -= sent
+                if not self.switched:
+                    remaining = min(self.memory_mib, remaining + dirty_rate * dt)
+                if processed >= iteration * self.memory_mib:
+                    iteration += 1
+                    dirty_rate *= throttle
+                self.stats = {'type': 2, 'time_elapsed': int(elapsed * 1000),
+                              'data_total': int(processed + remaining) << 20,
+                              'data_processed': int(processed) << 20,
+                              'data_remaining': int(remaining) << 20,
+                              'memory_iteration': iteration}
+                # Stop-and-copy once what's left fits in ~300 ms at the current speed
+                if remaining <= (self.speed or LINK_MIB) * 0.3:
+                    break
+                if iteration > 30:
+                    raise libvirt.libvirtError(f"{self.name}: migration not converging")
+        finally:
+            self.sim.leave(self, self.host.name, dest.name)
+            self.stats = {}
+        del self.host.domains[self.name]
+        self.host = dest
+        dest.domains[self.name] = self
+
+
+class SimHost:
+    """Stands in for both the LibvirtManager and its connection."""
+
+    def __init__(self, name, cells=2, cpus_per_cell=32, memory_gb_per_cell=256):
+        self.name = name
+        self.uri = f"sim://{name}"
+        self.domains = {}
+        self.cells = cells
+        self.cpus_per_cell = cpus_per_cell
+        self.cell_kb = memory_gb_per_cell * 1024 ** 2
+
+    # LibvirtManager side
+    @property
+    def conn(self):
+        return self
+
+    def is_connected(self):
+        return True
+
+    def connect(self):
+        return True
+
+    def disconnect(self):
+        pass
+
+    def get_domain_by_name(self, name):
+        return self.domains.get(name)
+
+    def get_domain_model(self, name):
+        return None, None
+
+    def list_vms(self):
+        return [{'name': d.name, 'uuid': d.name, 'id': 1, 'state': 'Running', 'vcpu': 2,
+                 'memory_kb': d.memory_mib * 1024, 'max_memory_kb': d.memory_mib * 1024}
+                for d in list(self.domains.values())]
+
+    # virConnect side
+    def getCapabilities(self):
+        cells = ''.join(
+            f"<cell id='{c}'><memory unit='KiB'>{self.cell_kb}</memory><cpus>"
+            + ''.join(f"<cpu id='{c * self.cpus_per_cell + i}'/>" for i in range(self.cpus_per_cell))
+            + "</cpus></cell>" for c in range(self.cells))
+        return f"<capabilities><host><topology><cells>{cells}</cells></topology></host></capabilities>"
+
+    def getInfo(self):
+        return ['x86_64', self.cells * self.cell_kb // 1024, self.cells * self.cpus_per_cell, 2400]
+
+    def getCellsFreeMemory(self, start, count):
+        used = sum(d.memory_mib for d in self.domains.values()) * 1024 ** 2 // self.cells
+        return [self.cell_kb * 1024 - used] * count
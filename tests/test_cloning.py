@@ -0,0 +1,118 @@
+# tests/test_cloning.py
+
+import xml.etree.ElementTree as ET
+
+import pytest
+
+libvirt = pytest.importorskip('libvirt')
+
+from app.core.cloning import CloneTemplate
+from app.core.libvirt_manager import LibvirtManager
+from app.core.provisioning import ProvisioningError, ProvisioningPipeline
+
+SOURCE_XML = """<domain type='kvm'>
+  <name>web</name>
+  <uuid>6c1f4a8e-9d5b-4e2a-8f3c-2b7d9e0a1c45</uuid>
+  <memory unit='MiB'>1024</memory>
+  <devices>
+    <disk type='file' device='disk'>
+      <driver name='qemu' type='raw'/>
+      <source file='/pool/web.img'/>
+      <target dev='vda' bus='virtio'/>
+    </disk>
+    <disk type='file' device='disk'>
+      <driver name='qemu' type='qcow2'/>
+      <source file='/pool/web-data.qcow2'/>
+      <target dev='vdb' bus='virtio'/>
+    </disk>
+    <interface type='network'>
+      <mac address='52:54:00:00:00:01'/>
+      <source network='default'/>
+    </interface>
+    <graphics type='vnc' port='5901' autoport='no' passwd='s3cret'/>
+    <graphics type='spice' autoport='yes' passwd='sp1ce'/>
+  </devices>
+</domain>"""
+
+
+def passwords(xml_desc):
+    return {g.get('type'): g.get('passwd') for g in ET.fromstring(xml_desc).findall('./devices/graphics')}
+
+
+class FakeVolume:
+    def __init__(self, path):
+        self._path = path
+
+    def path(self):
+        return self._path
+
+
+class FakePool:
+    def __init__(self):
+        self.created = []
+
+    def createXML(self, xml_desc, flags=0):
+        self.created.append(xml_desc)
+        return FakeVolume('/pool/' + ET.fromstring(xml_desc).findtext('name'))
+
+
+class FakeConnection:
+    def __init__(self):
+        self.defined = []
+
+    def defineXML(self, xml_desc):
+        self.defined.append(xml_desc)
+
+
+class FakeDomain:
+    def __init__(self):
+        self.flags = []
+
+    def isActive(self):
+        return False
+
+    def XMLDesc(self, flags=0):
+        self.flags.append(flags)
+        return SOURCE_XML
+
+
+def test_clones_keep_console_passwords_and_get_a_new_identity():
+    template = CloneTemplate(SOURCE_XML)
+    xml_desc = template.render('web-1', ['/pool/web-1-vda.qcow2', '/pool/web-1-vdb.qcow2'],
+                               '00000000-0000-0000-0000-000000000001', ['52:54:00:aa:bb:cc'])
+    root = ET.fromstring(xml_desc)
+    assert passwords(xml_desc) == {'vnc': 's3cret', 'spice': 'sp1ce'}
+    assert root.findtext('name') == 'web-1'
+    assert root.findtext('uuid') == '00000000-0000-0000-0000-000000000001'
+    assert root.find('./devices/interface/mac').get('address') == '52:54:00:aa:bb:cc'
+    assert root.find("./devices/graphics[@type='vnc']").get('port') == '-1'
+
+
+def test_freeze_keeps_the_source_password():
+    template = CloneTemplate(SOURCE_XML)
+    pool, conn = FakePool(), FakeConnection()
+    plans = [{'pool': pool, 'base': object(), 'base_path': disk['path'], 'base_format': disk['format'],
+              'capacity': 1024 ** 3} for disk in template.disks]
+
+    ProvisioningPipeline(max_workers=1).freeze_source(conn, template, plans, '20260101000000')
+
+    [redefined] = conn.defined
+    root = ET.fromstring(redefined)
+    assert passwords(redefined) == {'vnc': 's3cret', 'spice': 'sp1ce'}
+    assert root.findtext('uuid') == '6c1f4a8e-9d5b-4e2a-8f3c-2b7d9e0a1c45'
+    assert [d.find('source').get('file') for d in root.findall('./devices/disk')] == [
+        '/pool/web-vda-20260101000000.qcow2', '/pool/web-vdb-20260101000000.qcow2']
+    assert len(pool.created) == 2
+
+
+def test_clone_many_reads_the_secure_xml(monkeypatch):
+    domain = FakeDomain()
+    manager = LibvirtManager('test:///default', use_events=False)
+    monkeypatch.setattr(manager, 'get_domain_by_name', lambda name: domain)
+
+    def stop(pipeline, conn, template):
+        raise ProvisioningError("stop after reading the template")
+    monkeypatch.setattr(ProvisioningPipeline, 'clone_plans', stop)
+
+    assert manager.clone_many('web', ['web-1']) is None
+    assert domain.flags == [libvirt.VIR_DOMAIN_XML_INACTIVE | libvirt.VIR_DOMAIN_XML_SECURE]
@@ -0,0 +1,59 @@
+# tests/test_connection_pool.py
+
+import pytest
+
+pytest.importorskip('libvirt')
+
+from app.core.connection_pool import ConnectionPool
+from app.core.libvirt_manager import LibvirtManager
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def isAlive(self):
+        return 0 if self.closed else 1
+
+    def setKeepAlive(self, interval, count):
+        return 0
+
+    def close(self):
+        self.closed = True
+        return 0
+
+
+def test_pool_reuses_connections_up_to_its_size():
+    pool = ConnectionPool('fake:///', size=2, timeout=0.05, opener=lambda uri: FakeConnection())
+    first, second = pool.acquire(), pool.acquire()
+    assert first is not second and pool.acquire() is None # Exhausted
+    pool.release(first)
+    assert pool.acquire() is first
+    metrics = pool.metrics()
+    assert metrics['opened'] == 2 and metrics['timeouts'] == 1 and metrics['in_use'] == 2
+
+
+def test_closed_pool_can_be_reopened():
+    pool = ConnectionPool('fake:///', size=2, opener=lambda uri: FakeConnection())
+    conn = pool.acquire()
+    pool.release(conn)
+    pool.close()
+    assert conn.closed and pool.acquire() is None
+    pool.reopen()
+    again = pool.acquire()
+    assert again is not None and not again.closed
+
+
+def test_manager_pool_survives_disconnect():
+    manager = LibvirtManager('test:///default', use_events=False, pool_size=2)
+    assert manager.connect()
+    manager.disconnect()
+    assert manager.connect()
+    try:
+        with manager.connection():
+            pooled = manager.conn
+            assert pooled is not None and pooled is not manager._conn
+            assert manager.list_vms() is not None
+        assert manager.pool.metrics()['opened'] == 1
+    finally:
+        manager.disconnect()
@@ -0,0 +1,96 @@
+# tests/test_domain_builder.py
+
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from app.core.domain_builder import VMProfile, metadata_xml
+from app.core.domain_xml import parse_domain_xml
+
+NASTY = """it's a "test" <b>&amp; more</b>"""
+
+
+@pytest.fixture
+def profile():
+    return VMProfile(disks=[{'format': 'qcow2', 'bus': 'virtio'}, {'format': 'raw', 'bus': 'sata'}],
+                     interfaces=[{'type': 'bridge', 'source': 'br0'}, {'type': 'network', 'source': 'default'}])
+
+
+def test_render_is_well_formed_and_complete(profile):
+    root = ET.fromstring(profile.render('web-01', uuid='6C1F4A8E-9D5B-4E2A-8F3C-2B7D9E0A1C45',
+                                        memory_mb=2048, vcpu=2, disk_paths=['/a.qcow2', '/b.img'],
+                                        macs=['52:54:00:AA:BB:CC'], iso_path='/iso/install.iso'))
+    assert root.findtext('name') == 'web-01'
+    assert root.findtext('uuid') == '6c1f4a8e-9d5b-4e2a-8f3c-2b7d9e0a1c45'
+    assert root.findtext('memory') == str(2048 * 1024) and root.findtext('vcpu') == '2'
+    disks = root.findall('./devices/disk')
+    assert [d.find('source').get('file') for d in disks] == ['/a.qcow2', '/b.img', '/iso/install.iso']
+    assert [d.find('target').get('dev') for d in disks] == ['vda', 'sda', 'sdb']
+    macs = [i.find('mac') for i in root.findall('./devices/interface')]
+    assert macs[0].get('address') == '52:54:00:aa:bb:cc' and macs[1] is None
+
+
+@pytest.mark.parametrize('value', [NASTY, "/var/lib/x'/><evil/>", 'a"b', 'a<b', 'a&b', '{name}'])
+def test_per_vm_values_are_escaped(profile, value):
+    xml_desc = profile.render('vm1', disk_paths=[value, value], interface_sources=[value, value],
+                              iso_path=value, cpuset=value, metadata=metadata_xml([value]))
+    root = ET.fromstring(xml_desc) # Well-formed
+    assert root.find('./devices/evil') is None and root.find('.//b') is None
+    assert [d.find('source').get('file') for d in root.findall('./devices/disk')] == [value] * 3
+    ifaces = root.findall('./devices/interface')
+    assert ifaces[0].find('source').get('bridge') == value and ifaces[1].find('source').get('network') == value
+    assert root.find('vcpu').get('cpuset') == value
+    assert parse_domain_xml(xml_desc).tags == [value.strip()]
+
+
+def test_profile_values_are_escaped():
+    profile = VMProfile(machine="pc'q35", arch='x86_64', cpu_mode='host-"model"', emulator='/usr/bin/<qemu>&',
+                        graphics_listen="0.0.0.0' evil='1",
+                        disks=[{'format': "qcow2'", 'bus': 'virtio', 'source': '/x'}])
+    root = ET.fromstring(profile.render('vm1'))
+    assert root.find('./os/type').get('machine') == "pc'q35"
+    assert root.find('cpu').get('mode') == 'host-"model"'
+    assert root.findtext('./devices/emulator') == '/usr/bin/<qemu>&'
+    listen = root.find('./devices/graphics/listen')
+    assert listen.get('address') == "0.0.0.0' evil='1" and listen.get('evil') is None
+    assert root.find('./devices/disk/driver').get('type') == "qcow2'"
+
+
+def test_metadata_xml_escapes_tags():
+    assert metadata_xml([]) == '' and metadata_xml(['  ']) == ''
+    fragment = metadata_xml(['web', '<db>', 'a&b', NASTY])
+    root = ET.fromstring(fragment)
+    assert [t.text for t in root.iter() if t.tag.endswith('tag')] == ['web', '<db>', 'a&b', NASTY]
+
+
+@pytest.mark.parametrize('name', ["vm'1", 'vm"1', 'vm<1', 'vm&1', '', '-vm', 'vm 1', 'a' * 65, None, 42,
+                                  'vm/1', '../etc'])
+def test_invalid_names_are_rejected(profile, name):
+    with pytest.raises(ValueError):
+        profile.render(name, disk_paths=['/a', '/b'])
+
+
+@pytest.mark.parametrize('mac', ['52:54:00:aa:bb', '52:54:00:aa:bb:cc:dd', '52-54-00-aa-bb-cc',
+                                 "52:54:00:aa:bb:c'", '52:54:00:aa:bb:gg', "52:54:00:aa:bb:cc'/><x a='"])
+def test_invalid_macs_are_rejected(profile, mac):
+    with pytest.raises(ValueError, match="Invalid MAC"):
+        profile.render('vm1', disk_paths=['/a', '/b'], macs=[mac])
+
+
+@pytest.mark.parametrize('uuid', ['not-a-uuid', '6c1f4a8e-9d5b-4e2a-8f3c', "6c1f4a8e'", '<uuid/>', ''])
+def test_invalid_uuids_are_rejected(profile, uuid):
+    with pytest.raises(ValueError):
+        profile.render('vm1', uuid=uuid, disk_paths=['/a', '/b'])
+
+
+@pytest.mark.parametrize('kwargs', [{'memory_mb': 0}, {'vcpu': -1}, {'memory_mb': 'lots'}, {'vcpu': '2x'}])
+def test_invalid_sizes_are_rejected(profile, kwargs):
+    with pytest.raises(ValueError):
+        profile.render('vm1', disk_paths=['/a', '/b'], **kwargs)
+
+
+def test_missing_sources_are_rejected():
+    with pytest.raises(ValueError, match="No source path"):
+        VMProfile().render('vm1')
+    with pytest.raises(ValueError, match="No source for interface"):
+        VMProfile(interfaces=[{'type': 'bridge'}]).render('vm1', disk_paths=['/a'])
@@ -0,0 +1,176 @@
+# tests/test_fleet.py
+
+import contextvars
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('libvirt')
+
+from app.core.fleet import FleetManager
+from app.core.libvirt_manager import LibvirtManager
+
+TEST_URI = 'test:///default'
+
+
+class HangingManager(LibvirtManager):
+    """A test driver host whose list_vms() blocks until `release` is set, like an unresponsive daemon."""
+
+    def __init__(self, uri, release):
+        super().__init__(uri, use_events=False)
+        self.release = release
+
+    def list_vms(self):
+        self.release.wait(10)
+        return super().list_vms()
+
+
+class UnreachableManager(LibvirtManager):
+    def is_connected(self):
+        return False
+
+    def connect(self):
+        return False
+
+
+@pytest.fixture
+def release():
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+@pytest.fixture
+def fleet(release):
+    def factory(uri):
+        if uri == 'hang':
+            return HangingManager(TEST_URI, release)
+        if uri == 'unreachable':
+            return UnreachableManager(TEST_URI, use_events=False)
+        return LibvirtManager(uri, use_events=False)
+
+    fleet = FleetManager(timeout=5.0, manager_factory=factory)
+    yield fleet
+    fleet.close()
+
+
+@pytest.fixture
+def local():
+    manager = LibvirtManager(TEST_URI, use_events=False)
+    assert manager.connect()
+    yield manager
+    manager.disconnect()
+
+
+def test_list_vms_merges_hosts(fleet, local):
+    assert fleet.add_host('a', TEST_URI)
+    assert fleet.add_host('b', TEST_URI)
+    assert not fleet.add_host('a', TEST_URI)
+    assert fleet.hosts() == ['a', 'b']
+
+    expected = sorted(vm['name'] for vm in local.list_vms())
+    vms, results = fleet.list_vms()
+    assert all(r.ok and r.error is None for r in results.values())
+    assert sorted(results) == ['a', 'b']
+    for host in ('a', 'b'):
+        assert sorted(vm['name'] for vm in vms if vm['host'] == host) == expected
+    assert len(vms) == 2 * len(expected)
+
+
+def test_host_metrics_totals(fleet, local):
+    fleet.add_host('a', TEST_URI)
+    fleet.add_host('b', TEST_URI)
+    fleet.add_host('local', manager=local)
+    fleet.add_host('down', 'unreachable')
+
+    per_host, totals, results = fleet.host_metrics()
+    assert sorted(per_host) == ['a', 'b', 'local']
+    assert not results['down'].ok and results['down'].error.startswith("Cannot connect")
+    assert totals['hosts'] == 4 and totals['hosts_ok'] == 3
+    for key in ('cpus', 'memory_mb', 'vms', 'running', 'vcpus_allocated', 'memory_allocated_mb'):
+        assert totals[key] == sum(m[key] for m in per_host.values())
+    single = per_host['local']
+    assert single['vms'] == len(local.list_vms())
+    assert totals['vms'] == 3 * single['vms']
+    assert totals['cpus'] == 3 * single['cpus']
+
+
+def test_hanging_host_times_out_and_then_fails_fast(fleet, release):
+    fleet.add_host('a', TEST_URI)
+    fleet.add_host('b', TEST_URI)
+    fleet.add_host('slow', 'hang')
+
+    start = time.monotonic()
+    vms, results = fleet.list_vms(timeout=0.5)
+    elapsed = time.monotonic() - start
+    assert elapsed < 3.0 # Bounded by the timeout, not by the hanging host
+    assert results['a'].ok and results['b'].ok
+    assert not results['slow'].ok and results['slow'].error == "Timed out after 0.5s"
+    assert {vm['host'] for vm in vms} == {'a', 'b'}
+
+    # The first call is still blocked: the host is refused without queueing another one
+    start = time.monotonic()
+    _, results = fleet.list_vms(timeout=0.5)
+    assert time.monotonic() - start < 0.5
+    assert results['slow'].error == "Host busy: previous call still running"
+    assert results['a'].ok and results['b'].ok
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while 'slow' in fleet._stuck and time.monotonic() < deadline:
+        time.sleep(0.01)
+    _, results = fleet.list_vms(timeout=5.0)
+    assert results['slow'].ok
+
+
+def test_overlapping_fan_outs_share_healthy_hosts(fleet):
+    fleet.add_host('a', TEST_URI)
+    fleet.add_host('b', TEST_URI)
+    both_running = threading.Barrier(2, timeout=5)
+
+    def slow_list(manager):
+        time.sleep(0.2)
+        return manager.list_vms()
+
+    def request(out):
+        both_running.wait()
+        out.update(fleet.fan_out(slow_list, timeout=5.0))
+
+    outcomes = [{}, {}]
+    threads = [threading.Thread(target=request, args=(out,)) for out in outcomes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    for results in outcomes:
+        assert sorted(results) == ['a', 'b']
+        assert all(r.ok for r in results.values()), {n: r.error for n, r in results.items()}
+    assert fleet._stuck == {}
+
+
+def test_fan_out_limits_to_known_hosts(fleet):
+    fleet.add_host('a', TEST_URI)
+    fleet.add_host('b', TEST_URI)
+    results = fleet.fan_out(lambda m: m.uri, hosts=['b', 'nope'])
+    assert list(results) == ['b'] and results['b'].value == TEST_URI
+    results = fleet.fan_out(lambda m: None)
+    assert all(not r.ok and r.error == "Call failed, see server log" for r in results.values())
+
+
+def test_fan_out_runs_in_the_callers_context(fleet):
+    request_id = contextvars.ContextVar('request_id', default=None)
+    fleet.add_host('a', TEST_URI)
+    fleet.add_host('b', TEST_URI)
+    request_id.set('req-1')
+    results = fleet.fan_out(lambda m: request_id.get())
+    assert {name: r.value for name, r in results.items()} == {'a': 'req-1', 'b': 'req-1'}
+
+
+def test_remove_host(fleet):
+    fleet.add_host('a', TEST_URI)
+    assert not fleet.remove_host('unknown')
+    assert fleet.hosts() == ['a']
+    assert fleet.remove_host('a')
+    assert fleet.hosts() == [] and fleet.get_manager('a') is None
+    assert not fleet.remove_host('a')
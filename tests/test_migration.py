@@ -0,0 +1,180 @@
+# tests/test_migration.py
+
+import pytest
+
+pytest.importorskip('libvirt')
+
+from app.core.fleet import FleetManager
+from app.core.migration import Migration, MigrationEngine, MigrationError
+from app.core.scheduler import PlacementScheduler
+from tests.migration_harness import TICK, SimDomain, SimHost, Simulation
+
+
+def make_fleet(sim, names, **host_args):
+    fleet = FleetManager(manager_factory=lambda uri: sim.hosts[uri])
+    for name in names:
+        host = SimHost(name, **host_args.get(name, {}))
+        sim.hosts[host.uri] = host
+        fleet.add_host(name, host.uri)
+    return fleet
+
+
+@pytest.fixture
+def sim():
+    return Simulation(scale=50.0, per_host=2, budget=1000)
+
+
+@pytest.fixture
+def fleet(sim):
+    fleet = make_fleet(sim, ['a', 'b', 'c', 'd'])
+    yield fleet
+    fleet.close()
+
+
+def make_engine(fleet, **kwargs):
+    engine = MigrationEngine(fleet, **kwargs)
+    engine.POLL_INTERVAL = TICK * 5
+    return engine
+
+
+def start(engine, sim, vm, source, dest, requested_mib=None):
+    """Takes the slots of a migration the way migrate() does and gives it a mocked domain."""
+    migration = Migration(vm, source, dest, requested_mib)
+    neighbours = engine._acquire(migration, timeout=0)
+    if neighbours is None:
+        return None
+    migration.domain = SimDomain(sim, sim.hosts[f"sim://{source}"], vm, 1024, 10)
+    engine._apply_speeds([migration] + neighbours)
+    return migration
+
+
+def test_slot_limit_counts_both_directions(fleet, sim):
+    engine = make_engine(fleet, max_per_host=1)
+    first = start(engine, sim, 'vm-1', 'a', 'b')
+    assert first is not None
+    # a and b are both busy, whichever side the next migration puts them on
+    assert start(engine, sim, 'vm-2', 'a', 'c') is None
+    assert start(engine, sim, 'vm-3', 'c', 'a') is None
+    assert start(engine, sim, 'vm-4', 'b', 'c') is None
+    assert start(engine, sim, 'vm-5', 'c', 'b') is None
+    assert start(engine, sim, 'vm-6', 'c', 'd') is not None
+    assert {m['vm'] for m in engine.active()} == {'vm-1', 'vm-6'}
+
+    engine._release(first)
+    assert start(engine, sim, 'vm-7', 'b', 'a') is not None
+
+
+def test_slot_limit_with_two_per_host(fleet, sim):
+    engine = make_engine(fleet, max_per_host=2)
+    assert start(engine, sim, 'vm-1', 'a', 'b')
+    assert start(engine, sim, 'vm-2', 'c', 'a')
+    assert start(engine, sim, 'vm-3', 'a', 'd') is None # a has an outgoing and an incoming one
+    assert start(engine, sim, 'vm-4', 'd', 'b')
+
+
+def test_waiting_for_a_slot_times_out(fleet, sim):
+    engine = make_engine(fleet, max_per_host=1)
+    start(engine, sim, 'busy', 'a', 'b')
+    sim.hosts['sim://a'].domains['vm-1'] = SimDomain(sim, sim.hosts['sim://a'], 'vm-1', 1024, 10)
+    with pytest.raises(MigrationError, match="No migration slot"):
+        engine.migrate('vm-1', 'a', 'c', wait_timeout=0.05)
+    assert 'vm-1' in sim.hosts['sim://a'].domains
+
+
+def test_fair_share_is_reapplied_when_a_neighbour_finishes(fleet, sim):
+    engine = make_engine(fleet, max_per_host=3, host_bandwidth_mib=900)
+    first = start(engine, sim, 'vm-1', 'a', 'b')
+    assert first.domain.speed == 900
+    second = start(engine, sim, 'vm-2', 'a', 'c')
+    third = start(engine, sim, 'vm-3', 'a', 'd')
+    assert [m.domain.speed for m in (first, second, third)] == [300, 300, 300]
+    assert [m.bandwidth_mib for m in (first, second, third)] == [300, 300, 300]
+
+    engine._release(first)
+    assert second.domain.speed == third.domain.speed == 450
+    engine._release(second)
+    assert third.domain.speed == 900
+
+
+def test_share_follows_the_tighter_host_and_the_request(fleet, sim):
+    engine = make_engine(fleet, max_per_host=2, host_bandwidth_mib=1000)
+    engine.set_host_bandwidth('c', 200)
+    migration = start(engine, sim, 'vm-1', 'a', 'c')
+    assert migration.domain.speed == 200
+    engine.set_host_bandwidth('c', None)
+    assert migration.domain.speed == 1000
+    capped = start(engine, sim, 'vm-2', 'b', 'd', requested_mib=50)
+    assert capped.domain.speed == 50
+    assert engine._speed_locked(migration) == 1000
+
+
+def test_migrate_rejects_unknown_and_identical_hosts(fleet):
+    engine = make_engine(fleet)
+    with pytest.raises(MigrationError, match="Unknown host 'nope'"):
+        engine.migrate('vm-1', 'nope', 'a')
+    with pytest.raises(MigrationError, match="Unknown host 'nope'"):
+        engine.migrate('vm-1', 'a', 'nope')
+    with pytest.raises(MigrationError, match="same host"):
+        engine.migrate('vm-1', 'a', 'a')
+    with pytest.raises(MigrationError, match="Unknown host 'nope'"):
+        engine.drain('nope', PlacementScheduler())
+    assert engine.active() == [] and engine.history() == []
+
+
+def test_migrate_moves_the_domain(fleet, sim):
+    engine = make_engine(fleet, host_bandwidth_mib=1000)
+    source, dest = sim.hosts['sim://a'], sim.hosts['sim://b']
+    source.domains['vm-1'] = SimDomain(sim, source, 'vm-1', 1024, 10)
+    result = engine.migrate('vm-1', 'a', 'b')
+    assert result['status'] == Migration.SUCCEEDED and result['progress'] == 100
+    assert 'vm-1' in dest.domains and 'vm-1' not in source.domains
+    assert engine.active() == [] and engine.history()[0]['vm'] == 'vm-1'
+    with pytest.raises(MigrationError, match="not found"):
+        engine.migrate('vm-1', 'a', 'b')
+
+
+def test_drain_skips_draining_hosts_and_reports_rejections(sim):
+    # c is too small for the big VM; d is being drained itself
+    fleet = make_fleet(sim, ['a', 'b', 'c', 'd'], b={'memory_gb_per_cell': 8}, c={'memory_gb_per_cell': 8})
+    try:
+        engine = make_engine(fleet, max_per_host=2, host_bandwidth_mib=1000)
+        source = sim.hosts['sim://a']
+        for i, memory in enumerate((1024, 2048, 1024, 2048, 65536)):
+            source.domains[f"vm-{i}"] = SimDomain(sim, source, f"vm-{i}", memory, 10)
+        engine.draining.add('d')
+
+        result = engine.drain('a', PlacementScheduler('spread'), parallel=4)
+
+        assert result['source'] == 'a'
+        assert [m['vm'] for m in result['migrated']] == ['vm-0', 'vm-1', 'vm-2', 'vm-3']
+        assert {m['dest'] for m in result['migrated']} <= {'b', 'c'}
+        [rejected] = result['failed']
+        assert rejected['vm'] == 'vm-4' and rejected['dest'] is None
+        assert rejected['error'].startswith("No host can fit")
+        assert list(source.domains) == ['vm-4'] and not sim.hosts['sim://d'].domains
+        assert sim.errors == []
+        assert 'a' not in engine.draining and 'd' in engine.draining
+    finally:
+        fleet.close()
+
+
+def test_drain_keeps_the_limits(sim, fleet):
+    engine = make_engine(fleet, max_per_host=2, host_bandwidth_mib=1000)
+    source = sim.hosts['sim://a']
+    for i in range(12):
+        source.domains[f"vm-{i:02d}"] = SimDomain(sim, source, f"vm-{i:02d}", 1024 * (1 + i % 3), 50)
+    result = engine.drain('a', PlacementScheduler('spread'), parallel=8)
+    assert len(result['migrated']) == 12 and result['failed'] == []
+    assert not source.domains
+    assert sim.errors == []
+    assert max(sim.peak.values()) <= 1000
+
+
+def test_drain_without_destinations(fleet, sim):
+    engine = make_engine(fleet)
+    source = sim.hosts['sim://a']
+    assert engine.drain('a', PlacementScheduler()) == {'source': 'a', 'migrated': [], 'failed': []}
+    source.domains['vm-1'] = SimDomain(sim, source, 'vm-1', 1024, 10)
+    engine.draining.update(('b', 'c', 'd'))
+    with pytest.raises(MigrationError, match="No destination hosts"):
+        engine.drain('a', PlacementScheduler())
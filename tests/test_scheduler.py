@@ -0,0 +1,153 @@
+# tests/test_scheduler.py
+
+import random
+
+import pytest
+
+pytest.importorskip('libvirt')
+
+from app.core.scheduler import (CellState, HostState, PlacementScheduler, SchedulingError, cpuset_string,
+                                parse_cpuset, tuning_xml)
+from benchmarks.sim_scheduler import SHAPES, WEIGHTS, build_fleet, check
+
+GIB_KB = 1024 ** 2
+
+
+def two_cell_host(name='host-00', cpus_per_cell=4, memory_gb_per_cell=8):
+    return HostState(name, [CellState(c, range(c * cpus_per_cell, (c + 1) * cpus_per_cell),
+                                      memory_gb_per_cell * GIB_KB) for c in range(2)])
+
+
+@pytest.mark.parametrize('text, ids', [
+    ('', set()),
+    ('3', {3}),
+    ('0-3,8,10-11', {0, 1, 2, 3, 8, 10, 11}),
+    (' 0-2 , 5 ', {0, 1, 2, 5}),
+    ('0-7,^3', {0, 1, 2, 4, 5, 6, 7}),
+    ('0-7,^2-4,^7', {0, 1, 5, 6}),
+    ('^1,0-2', {0, 2}),
+])
+def test_parse_cpuset(text, ids):
+    assert parse_cpuset(text) == ids
+
+
+@pytest.mark.parametrize('ids, text', [
+    (set(), ''),
+    ({4}, '4'),
+    ({0, 1, 2, 3, 8}, '0-3,8'),
+    ({11, 10, 0, 2, 1}, '0-2,10-11'),
+])
+def test_cpuset_string(ids, text):
+    assert cpuset_string(ids) == text
+
+
+def test_cpuset_round_trip():
+    rng = random.Random(3)
+    for _ in range(200):
+        ids = set(rng.sample(range(64), rng.randint(0, 32)))
+        assert parse_cpuset(cpuset_string(ids)) == ids
+    # Exclusions are resolved by parse_cpuset, so they never survive the round trip
+    assert cpuset_string(parse_cpuset('0-15,^4-7,^12')) == '0-3,8-11,13-15'
+
+
+@pytest.mark.parametrize('vcpu', [1, 2, 7])
+def test_tuning_xml_pins_every_vcpu(vcpu):
+    tuning = tuning_xml(vcpu, '0-3', '0')
+    assert tuning.count('<vcpupin ') == vcpu
+    assert tuning.count("cpuset='0-3'") == vcpu + 1 # Plus the emulatorpin
+    assert "<memory mode='strict' nodeset='0'/>" in tuning
+
+
+def test_place_binds_vm_that_fits_a_cell():
+    host = two_cell_host()
+    scheduler = PlacementScheduler('binpack')
+    placement = scheduler.place(2, 2048, [host])
+
+    cell = host.cells[placement.cell]
+    assert placement.host == host.name
+    assert placement.cpuset == cpuset_string(cell.cpus)
+    assert placement.nodeset == str(cell.id)
+    assert placement.tuning.count('<vcpupin ') == 2
+    assert cell.vcpus == 2 and cell.committed_kb == 2048 * 1024
+    assert host.vcpus == 2 and host.committed_kb == 2048 * 1024
+    assert check([host], [placement], [(2, 2048)], scheduler) == []
+
+
+def test_place_spans_cells_when_no_cell_fits():
+    host = two_cell_host()
+    scheduler = PlacementScheduler('binpack')
+    # 12 GiB is more than one 8 GiB cell, but fits in both together
+    placement = scheduler.place(4, 12 * 1024, [host])
+
+    assert placement.cell is None
+    assert placement.cpuset is None and placement.nodeset is None and placement.tuning == ''
+    assert host.committed_kb == 12 * GIB_KB
+    assert sum(c.committed_kb for c in host.cells) == 12 * GIB_KB
+    assert sum(c.vcpus for c in host.cells) == pytest.approx(4)
+    assert check([host], [placement], [(4, 12 * 1024)], scheduler) == []
+
+
+def test_place_prefers_a_numa_local_host_over_spanning():
+    tight = HostState('tight', [CellState(c, range(c * 4, c * 4 + 4), 8 * GIB_KB, free_kb=3 * GIB_KB)
+                                for c in range(2)])
+    roomy = two_cell_host('roomy')
+    for policy in ('binpack', 'spread'):
+        placement = PlacementScheduler(policy).place(2, 4096, [tight, roomy])
+        assert placement.host == 'roomy' and placement.cell is not None
+
+
+def test_place_rejects_what_no_host_fits():
+    host = two_cell_host()
+    scheduler = PlacementScheduler('binpack', cpu_ratio=1.0)
+    with pytest.raises(SchedulingError):
+        scheduler.place(2, 32 * 1024, [host]) # Memory
+    with pytest.raises(SchedulingError):
+        scheduler.place(9, 1024, [host])      # vCPUs over the ratio
+    assert host.vcpus == 0 and host.committed_kb == 0
+
+
+def test_place_rejects_unknown_policy():
+    with pytest.raises(ValueError):
+        PlacementScheduler('random')
+    with pytest.raises(ValueError):
+        PlacementScheduler().place(1, 1024, [two_cell_host()], policy='random')
+
+
+def test_single_cell_host_is_not_pinned():
+    host = HostState('flat', [CellState(0, range(8), 16 * GIB_KB)])
+    placement = PlacementScheduler().place(2, 2048, [host])
+    assert placement.cell == 0 and placement.tuning == '' and placement.cpuset is None
+
+
+@pytest.mark.parametrize('seed', [1, 7, 42])
+def test_policies_keep_invariants_and_binpack_consolidates(seed):
+    requests = random.Random(seed).choices(SHAPES, WEIGHTS, k=400)
+    hosts_used = {}
+    for policy in ('binpack', 'spread'):
+        fleet = build_fleet(12, 2, 16, 128)
+        scheduler = PlacementScheduler(policy)
+        placements = scheduler.place_many(requests, fleet)
+        assert check(fleet, placements, requests, scheduler) == []
+        assert len(placements) == len(requests)
+        hosts_used[policy] = sum(1 for h in fleet if h.committed_kb)
+    assert hosts_used['binpack'] <= hosts_used['spread']
+
+
+def test_host_state_collect_from_test_driver():
+    from app.core.libvirt_manager import LibvirtManager
+
+    manager = LibvirtManager('test:///default', use_events=False)
+    assert manager.connect()
+    try:
+        host = HostState.collect('test', manager)
+        assert host is not None and host.name == 'test'
+        assert host.cells and host.cpus > 0 and host.memory_kb > 0
+        for cell in host.cells:
+            assert 0 <= cell.free_kb <= cell.memory_kb
+        running = [vm for vm in manager.list_vms() or [] if vm['id'] is not None]
+        assert host.vcpus == sum(vm['vcpu'] or 0 for vm in running)
+        assert host.committed_kb == sum(vm['max_memory_kb'] or vm['memory_kb'] or 0 for vm in running)
+        # Capabilities are cached per URI
+        assert 'test:///default' in HostState._caps_cache
+    finally:
+        manager.disconnect()
@@ -0,0 +1,120 @@
+# tests/test_snapshots.py
+
+import xml.etree.ElementTree as ET
+
+import pytest
+
+pytest.importorskip('libvirt')
+
+from app.core.snapshots import SnapshotCache, parse_snapshot_xml, snapshot_tree, snapshot_xml
+
+SNAPSHOT_XML = """<domainsnapshot>
+  <name>before-upgrade</name>
+  <description>pre &amp; post</description>
+  <state>running</state>
+  <parent>
+    <name>base</name>
+  </parent>
+  <creationTime>1760000000</creationTime>
+  <memory snapshot='no'/>
+  <disks>
+    <disk name='vda' snapshot='external' type='file'>
+      <driver type='qcow2'/>
+      <source file='/pool/web.before-upgrade'/>
+    </disk>
+    <disk name='hdc' snapshot='no'/>
+  </disks>
+  <domain type='kvm'>
+    <name>web</name>
+    <description>not the snapshot's</description>
+    <devices>
+      <disk type='file' device='disk'>
+        <source file='/pool/web.qcow2'/>
+        <target dev='vda'/>
+      </disk>
+    </devices>
+  </domain>
+</domainsnapshot>"""
+
+
+def info(name, parent=None, created=0):
+    return {'name': name, 'description': '', 'state': 'shutoff', 'created': created, 'parent': parent,
+            'memory': False, 'external': False, 'disks': []}
+
+
+@pytest.mark.parametrize('target', ["vd'a", 'vd"a', 'vd<a', 'vd&a', "vda' snapshot='no"])
+def test_snapshot_xml_quotes_disk_names(target):
+    root = ET.fromstring(snapshot_xml("it's <new> & \"quoted\"", 'a < b & c', {target: 'external', 'vdb': 'no'}))
+    assert root.findtext('name') == "it's <new> & \"quoted\""
+    assert root.findtext('description') == 'a < b & c'
+    assert [(d.get('name'), d.get('snapshot')) for d in root.findall('./disks/disk')] == [
+        (target, 'external'), ('vdb', 'no')]
+
+
+def test_snapshot_xml_round_trips_through_the_parser():
+    parsed = parse_snapshot_xml(snapshot_xml("vm'1 snap", 'desc', {"vd'a": 'external'}))
+    assert parsed['name'] == "vm'1 snap" and parsed['description'] == 'desc'
+    assert parsed['external'] and parsed['disks'] == [{'target': "vd'a", 'snapshot': 'external', 'source': None}]
+    assert snapshot_xml('s') == '<domainsnapshot><name>s</name></domainsnapshot>'
+
+
+def test_parse_snapshot_xml_skips_the_embedded_domain():
+    parsed = parse_snapshot_xml(SNAPSHOT_XML)
+    assert parsed == {'name': 'before-upgrade', 'description': 'pre & post', 'state': 'running',
+                      'created': 1760000000, 'parent': 'base', 'memory': False, 'external': True,
+                      'disks': [{'target': 'vda', 'snapshot': 'external', 'source': '/pool/web.before-upgrade'}]}
+    assert parse_snapshot_xml(SNAPSHOT_XML.encode('utf-8')) == parsed
+
+
+def test_parse_snapshot_xml_defaults():
+    parsed = parse_snapshot_xml("<domainsnapshot><name>root</name><memory snapshot='internal'/>"
+                                "<disks><disk name='vda'/></disks></domainsnapshot>")
+    assert parsed['parent'] is None and parsed['created'] == 0 and parsed['description'] == ''
+    assert parsed['memory'] and not parsed['external']
+    assert parsed['disks'] == [{'target': 'vda', 'snapshot': 'internal', 'source': None}]
+
+
+@pytest.fixture
+def cache():
+    # a <- b <- c, a <- d, c <- e; 'c' is current
+    snapshots = {'a': info('a', created=1), 'b': info('b', 'a', 2), 'c': info('c', 'b', 3),
+                 'd': info('d', 'a', 4), 'e': info('e', 'c', 5)}
+    cache = SnapshotCache(ttl=60)
+    cache._entries['uuid'] = {'snapshots': snapshots, 'current': 'c', 'synced': float('inf')}
+    return cache
+
+
+def parents(cache):
+    snapshots, _ = cache.get('uuid')
+    return {name: s['parent'] for name, s in snapshots.items()}
+
+
+def test_deleted_moves_children_to_the_parent(cache):
+    cache.deleted('uuid', 'b')
+    assert parents(cache) == {'a': None, 'c': 'a', 'd': 'a', 'e': 'c'}
+    assert cache.get('uuid')[1] == 'c'
+
+    cache.deleted('uuid', 'a')
+    assert parents(cache) == {'c': None, 'd': None, 'e': 'c'}
+    assert [root['name'] for root in snapshot_tree(*cache.get('uuid'))] == ['c', 'd']
+
+
+def test_deleted_current_hands_over_to_its_parent(cache):
+    cache.deleted('uuid', 'c')
+    assert parents(cache) == {'a': None, 'b': 'a', 'd': 'a', 'e': 'b'}
+    assert cache.get('uuid')[1] == 'b'
+
+
+def test_deleted_with_children_drops_the_subtree(cache):
+    cache.deleted('uuid', 'b', children=True)
+    assert parents(cache) == {'a': None, 'd': 'a'}
+    assert cache.get('uuid')[1] == 'a'
+
+
+def test_deleted_leaves_earlier_copies_alone(cache):
+    before, _ = cache.get('uuid')
+    cache.deleted('uuid', 'b')
+    assert before['c']['parent'] == 'b'
+    cache.deleted('uuid', 'unknown')
+    cache.deleted('other-uuid', 'a')
+    assert sorted(parents(cache)) == ['a', 'c', 'd', 'e']
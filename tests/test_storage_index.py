@@ -0,0 +1,72 @@
+# tests/test_storage_index.py
+
+import pytest
+
+libvirt = pytest.importorskip('libvirt')
+
+from app.core.storage_index import StorageIndex
+
+
+class FakeVolume:
+    def __init__(self, name, key, path):
+        self._name, self._key, self._path = name, key, path
+        self.reads = 0
+
+    def name(self):
+        return self._name
+
+    def key(self):
+        return self._key
+
+    def XMLDesc(self, flags=0):
+        self.reads += 1
+        return (f"<volume type='block'><name>{self._name}</name><key>{self._key}</key>"
+                f"<capacity>1024</capacity><allocation>512</allocation>"
+                f"<target><path>{self._path}</path><format type='raw'/></target></volume>")
+
+
+class FakePool:
+    """A pool whose volume keys are not their paths, as with LVM or iSCSI pools."""
+
+    def __init__(self, name, volumes):
+        self._name = name
+        self.volumes = volumes
+
+    def name(self):
+        return self._name
+
+    def UUIDString(self):
+        return '00000000-0000-0000-0000-000000000001'
+
+    def info(self):
+        return [libvirt.VIR_STORAGE_POOL_RUNNING, 4096, 1024, 3072]
+
+    def XMLDesc(self, flags=0):
+        return f"<pool type='logical'><name>{self._name}</name><target><path>/dev/vg0</path></target></pool>"
+
+    def listAllVolumes(self, flags=0):
+        return list(self.volumes)
+
+
+def test_refresh_pool_diffs_on_volume_keys():
+    root = FakeVolume('root', 'lv-uuid-1', '/dev/vg0/root')
+    data = FakeVolume('data', 'lv-uuid-2', '/dev/vg0/data')
+    pool = FakePool('vg0', [root, data])
+    index = StorageIndex()
+
+    assert index.refresh_pool(pool)
+    assert [v['path'] for v in index.volumes()] == ['/dev/vg0/data', '/dev/vg0/root']
+
+    # Unchanged volumes are not re-read
+    assert index.refresh_pool(pool)
+    assert root.reads == 1 and data.reads == 1
+
+    # A removed volume disappears from the index
+    pool.volumes = [root]
+    assert index.refresh_pool(pool)
+    assert [v['path'] for v in index.volumes()] == ['/dev/vg0/root']
+    assert index.volume('/dev/vg0/data') is None
+
+    assert index.refresh_pool(pool, full=True)
+    assert root.reads == 2
+    assert index.volume('/dev/vg0/root')['key'] == 'lv-uuid-1'